@@ -1,23 +1,51 @@
 # backtester.py
+import argparse
 import asyncio
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import pytz
 import pandas as pd
 import numpy as np
 from binance.async_client import AsyncClient
+from binance.helpers import interval_to_milliseconds
+from binance_client import init_binance_client, close_binance_client
+from kline_store import KlineStore, update_store
+from trade_simulator import simulate_trades, summarize_trades, format_summary, measured_win_rates, hold_bars_for, TAKE_PROFIT_PCT, STOP_LOSS_PCT, MAX_HOLD_HOURS, MAX_HOLD_BARS
+from timeframes import timeframe_label
+from cvd import DELTA_METHODS
 
 # <<< SỬA ĐỔI IMPORT TẠI ĐÂY >>>
 from trading_logic import (
     calculate_stochastic,
+    enrich_signals,
     find_all_signals_for_backtest, # Sử dụng hàm mới
-    get_klines,
+    update_win_rates,
+    CVD_METHOD,
     TIMEFRAME_M15,
-    TIMEFRAME_H1
+    TIMEFRAME_H1,
+    FRACTAL_PERIODS,
+    CVD_PERIOD,
+    EMA_TREND_PERIOD,
+    STOCH_K,
+    STOCH_SMOOTH_K,
+    STOCH_D,
+    DIVERGENCE_MAX_BARS,
+    STOCH_M15_OVERSOLD,
+    STOCH_M15_OVERBOUGHT,
+    STOCH_H1_OVERSOLD,
+    STOCH_H1_OVERBOUGHT
 )
 
 # --- CẤU HÌNH BACKTEST ---
 SYMBOLS_TO_TEST = ["ZROUSDT"] 
-CANDLE_LIMIT = 1500
+BACKTEST_DAYS = 365 # Số ngày lịch sử đọc từ kho nến cục bộ (tải lần đầu nếu chưa có)
+BACKTEST_WORKERS = os.cpu_count() or 1 # Số tiến trình tính toán song song
+BACKTEST_CACHE_SIZE = 64 # Số kết quả (mã, khung, khoảng thời gian, tham số) giữ trong cache
+
+kline_store = KlineStore()
 
 # --- HÀM IN TÍN HIỆU (Không đổi) ---
 def print_signal(signal_data):
@@ -38,66 +66,214 @@ def print_signal(signal_data):
     print(f"    (Debug) Thời gian xác nhận: {confirmation_time.strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"    (Debug) Giá tại gốc: {signal_data['price']:.4f}")
     print(f"    (Debug) Giá xác nhận: {signal_data.get('confirmation_price', 0):.4f}")
-    print(f"    (Debug) Stoch M15: {signal_data.get('stoch_m15', 0):.2f} | Stoch H1: {signal_data.get('stoch_h1', 0):.2f}")
+    print(f"    (Debug) Stoch {signal_data.get('timeframe', 'M15')}: {signal_data.get('stoch_m15', 0):.2f} | Stoch {signal_data.get('filter_timeframe', 'H1')}: {signal_data.get('stoch_h1', 0):.2f}")
+    if 'exit_reason' in signal_data:
+        print(f"    (Debug) Kết quả lệnh: {signal_data['exit_reason']} | {signal_data['return_pct'] * 100:+.2f}% sau {signal_data['bars_held']} nến")
     print("==================================================")
 
 # --- BỘ MÁY BACKTEST ---
-async def run_backtest_logic():
-    all_final_signals = []
+ARRAY_COLUMNS = ('timestamp', 'high', 'low', 'close', 'volume', 'taker_buy_base_asset_volume')
 
-    for symbol in SYMBOLS_TO_TEST:
-        print(f"--- [Backtest] Đang xử lý mã {symbol} ---")
-        m15_data, h1_data = await asyncio.gather(
-            get_klines(symbol, TIMEFRAME_M15, limit=CANDLE_LIMIT),
-            get_klines(symbol, TIMEFRAME_H1, limit=CANDLE_LIMIT)
-        )
+# Pool tiến trình dùng chung cho backtest, tạo khi cần và đóng khi bot tắt
+_process_pool = None
 
-        if m15_data.empty or h1_data.empty:
-            print(f"--- [Backtest] Dữ liệu trống cho {symbol}, bỏ qua ---")
-            continue
+def get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        # 'spawn' để tiến trình con không kế thừa event loop / kết nối của bot
+        _process_pool = ProcessPoolExecutor(max_workers=BACKTEST_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _process_pool
+
+def close_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+def to_arrays(df):
+    """
+    Chỉ giữ các cột cần cho backtest dưới dạng mảng numpy liền bộ nhớ (gửi sang tiến trình con rẻ hơn DataFrame).
+    df có thể là DataFrame hoặc structured array của kline_parser.
+    """
+    return {col: np.ascontiguousarray(df[col], dtype='int64' if col == 'timestamp' else 'float64') for col in ARRAY_COLUMNS}
+
+def _now_ms():
+    return int(datetime.now(pytz.utc).timestamp() * 1000)
+
+async def load_backtest_data(symbol, interval, days=BACKTEST_DAYS, start=None, end=None):
+    """
+    Đọc nến trong [start, end] (ms) từ kho cục bộ, mặc định `days` ngày gần nhất;
+    chỉ gọi mạng để nối thêm các nến đã đóng mới nhất (hoặc tải lần đầu).
+    """
+    if start is None:
+        start = _now_ms() - days * 86_400_000
+    history_days = max(days, -(-(_now_ms() - start) // 86_400_000))
+    await update_store(kline_store, symbol, interval, history_days)
+    return await asyncio.to_thread(kline_store.load, symbol, interval, start, end)
+
+def backtest_symbol(symbol, m15_arrays, h1_arrays, delta_method=CVD_METHOD, timeframes=('M15', 'H1'), max_hold_bars=MAX_HOLD_BARS):
+    """
+    Chạy trong tiến trình con: tìm và lọc tín hiệu của một mã từ các mảng nến.
+    m15_arrays / h1_arrays là khung tín hiệu / khung lọc (mặc định M15 / H1), nhãn trong `timeframes`;
+    max_hold_bars tính theo nến khung tín hiệu (hold_bars_for).
+    Các hàm tín hiệu chỉ đọc mảng nên không cần dựng DataFrame hay sao chép dữ liệu.
+    """
+    # <<< SỬA ĐỔI GỌI HÀM TẠI ĐÂY >>>
+    m15_signals = find_all_signals_for_backtest(m15_arrays, delta_method, timeframes[0])
+    if not m15_signals:
+        return []
+
+    print(f"--- [Backtest] Tìm thấy {len(m15_signals)} tín hiệu thô cho {symbol}. Bắt đầu lọc...")
+
+    # Một lần as-of join cho toàn bộ tín hiệu thay vì tra từng tín hiệu trên DataFrame
+    m15_stoch_k, h1_stoch_k = calculate_stochastic(m15_arrays), calculate_stochastic(h1_arrays)
+    if m15_stoch_k is None or h1_stoch_k is None:
+        return []
+    m15_stoch = {'timestamp': m15_arrays['timestamp'], 'stoch_k': m15_stoch_k.to_numpy(dtype=float)}
+    h1_stoch = {'timestamp': h1_arrays['timestamp'], 'stoch_k': h1_stoch_k.to_numpy(dtype=float)}
+    final_signals = [signal.replace(symbol=symbol) for signal in enrich_signals(m15_signals, m15_stoch, h1_stoch, timeframes[1])]
+    # Mô phỏng lệnh ngay trong tiến trình con, trên cùng mảng nến khung tín hiệu
+    return simulate_trades(final_signals, m15_arrays, max_hold_bars=max_hold_bars)
+
+# --- CACHE KẾT QUẢ BACKTEST ---
+# khóa (mã, khung, khoảng thời gian, tham số) -> (hết hạn lúc (ms) hoặc None, danh sách tín hiệu)
+_result_cache = OrderedDict()
+
+def strategy_params(delta_method):
+    """Các tham số chiến lược quyết định kết quả backtest, dùng làm một phần khóa cache."""
+    return (
+        ('delta_method', delta_method),
+        ('fractal_periods', FRACTAL_PERIODS),
+        ('cvd_period', CVD_PERIOD),
+        ('ema_period', EMA_TREND_PERIOD),
+        ('stoch', (STOCH_K, STOCH_SMOOTH_K, STOCH_D)),
+        ('divergence_max_bars', DIVERGENCE_MAX_BARS),
+        ('stoch_thresholds', (STOCH_M15_OVERSOLD, STOCH_M15_OVERBOUGHT, STOCH_H1_OVERSOLD, STOCH_H1_OVERBOUGHT)),
+        ('trade', (TAKE_PROFIT_PCT, STOP_LOSS_PCT, MAX_HOLD_HOURS)),
+    )
+
+def _cache_key(symbol, pipeline, days, start, end, delta_method):
+    window = ('days', days) if start is None else ('range', start, end)
+    return (symbol, tuple(pipeline), window, strategy_params(delta_method))
+
+def _cached_result(key):
+    entry = _result_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, signals = entry
+    if expires_at is not None and _now_ms() >= expires_at:
+        # Đã có nến đóng mới trong khoảng backtest: tính lại
+        del _result_cache[key]
+        return None
+    _result_cache.move_to_end(key)
+    return signals
 
-        # <<< SỬA ĐỔI GỌI HÀM TẠI ĐÂY >>>
-        m15_signals = find_all_signals_for_backtest(m15_data.copy())
-        if not m15_signals:
+def _expires_at(frames, intervals, end):
+    """Thời điểm có nến đã đóng mới hơn dữ liệu đang dùng mà vẫn nằm trong khoảng backtest (None: không bao giờ)."""
+    deadlines = []
+    for df, interval in zip(frames, intervals):
+        interval_ms = interval_to_milliseconds(interval)
+        next_open = int(df['timestamp'].iloc[-1]) + interval_ms
+        if end is None or next_open <= end:
+            deadlines.append(next_open + interval_ms)
+    return min(deadlines) if deadlines else None
+
+def _store_result(key, expires_at, signals):
+    _result_cache[key] = (expires_at, signals)
+    _result_cache.move_to_end(key)
+    while len(_result_cache) > BACKTEST_CACHE_SIZE:
+        _result_cache.popitem(last=False)
+
+def clear_result_cache():
+    _result_cache.clear()
+
+async def _run_symbol(symbol, delta_method, pipeline=(TIMEFRAME_M15, TIMEFRAME_H1), days=BACKTEST_DAYS, start=None, end=None):
+    """Trả về (danh sách tín hiệu, lấy từ cache hay không)."""
+    key = _cache_key(symbol, pipeline, days, start, end, delta_method)
+    cached = _cached_result(key)
+    if cached is not None:
+        print(f"--- [Backtest] {symbol}: dùng kết quả trong cache ---")
+        return cached, True
+
+    print(f"--- [Backtest] Đang xử lý mã {symbol} ---")
+    signal_interval, filter_interval = pipeline
+    m15_data, h1_data = await asyncio.gather(
+        load_backtest_data(symbol, signal_interval, days, start, end),
+        load_backtest_data(symbol, filter_interval, days, start, end)
+    )
+
+    if m15_data.empty or h1_data.empty:
+        print(f"--- [Backtest] Dữ liệu trống cho {symbol}, bỏ qua ---")
+        return [], False
+
+    loop = asyncio.get_running_loop()
+    timeframes = (timeframe_label(signal_interval), timeframe_label(filter_interval))
+    signals = await loop.run_in_executor(get_process_pool(), backtest_symbol, symbol, to_arrays(m15_data), to_arrays(h1_data),
+                                         delta_method, timeframes, hold_bars_for(signal_interval))
+    _store_result(key, _expires_at((m15_data, h1_data), pipeline, end), signals)
+    return signals, False
+
+async def run_backtest_logic(symbols=None, delta_method=CVD_METHOD, pipeline=(TIMEFRAME_M15, TIMEFRAME_H1),
+                             days=BACKTEST_DAYS, start=None, end=None, on_progress=None):
+    """
+    Backtest các mã song song: tải dữ liệu trên event loop, tính toán trên pool tiến trình.
+    delta_method: cách tính delta cho CVD ('shape' hoặc 'taker', xem cvd.py).
+    pipeline: (khung tín hiệu, khung lọc Stoch); start/end (ms) thay cho `days` ngày gần nhất.
+    Kết quả mỗi mã được cache cho đến khi có nến đóng mới trong khoảng backtest.
+    on_progress(done, total, symbol, cached) được gọi mỗi khi xong một mã.
+    """
+    symbols = symbols or SYMBOLS_TO_TEST
+    done = 0
+
+    async def run(symbol):
+        nonlocal done
+        cached = False
+        try:
+            signals, cached = await _run_symbol(symbol, delta_method, pipeline, days, start, end)
+            return signals
+        finally:
+            done += 1
+            if on_progress:
+                on_progress(done, len(symbols), symbol, cached)
+
+    results = await asyncio.gather(*(run(symbol) for symbol in symbols), return_exceptions=True)
+    all_final_signals = []
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, Exception):
+            print(f"--- [Backtest] Lỗi khi xử lý {symbol}: {result} ---")
             continue
-            
-        print(f"--- [Backtest] Tìm thấy {len(m15_signals)} tín hiệu thô cho {symbol}. Bắt đầu lọc...")
-
-        m15_data['stoch_k'] = calculate_stochastic(m15_data)
-        h1_data['stoch_k'] = calculate_stochastic(h1_data)
-        
-        m15_data.set_index('timestamp', inplace=True)
-        h1_data.set_index('timestamp', inplace=True)
-        
-        for signal in m15_signals:
-            try:
-                stoch_m15_val = m15_data.loc[signal['confirmation_timestamp'], 'stoch_k']
-                stoch_h1_val = h1_data.loc[h1_data.index <= signal['confirmation_timestamp'], 'stoch_k'].iloc[-1]
-            except (KeyError, IndexError):
-                continue
-
-            base_signal = {**signal, 'symbol': symbol, 'stoch_m15': stoch_m15_val, 'stoch_h1': stoch_h1_val}
-            final_signal = None
-            if signal['type'] == 'LONG 📈' and stoch_m15_val < 20:
-                if stoch_h1_val > 25: final_signal = {**base_signal, 'win_rate': '60%'}
-                elif stoch_h1_val < 25: final_signal = {**base_signal, 'win_rate': '80%'}
-            elif signal['type'] == 'SHORT 📉' and stoch_m15_val > 80:
-                if stoch_h1_val < 75: final_signal = {**base_signal, 'win_rate': '60%'}
-                elif stoch_h1_val > 75: final_signal = {**base_signal, 'win_rate': '80%'}
-            
-            if final_signal:
-                all_final_signals.append(final_signal)
-    
+        all_final_signals.extend(result)
     return all_final_signals
 
+async def calibrate_win_rates(symbols=None):
+    """Backtest các mã rồi thay WIN_RATES hiển thị bằng tỷ lệ win đo được theo nhóm Stoch (WIN_RATE_SOURCE=backtest)."""
+    measured = measured_win_rates(summarize_trades(await run_backtest_logic(symbols)))
+    update_win_rates(measured)
+    print(f"--- [Backtest] Tỷ lệ win theo backtest: {measured or 'chưa đủ lệnh, giữ mặc định'} ---")
+    return measured
+
 # --- KHỐI CHẠY CHÍNH (Không đổi) ---
 async def main():
+    parser = argparse.ArgumentParser(description="Backtest chiến lược trên kho nến cục bộ")
+    parser.add_argument('--cvd', choices=DELTA_METHODS + ('compare',), default=CVD_METHOD,
+                        help="Cách tính delta cho CVD; 'compare' chạy cả hai và so sánh kết quả")
+    args = parser.parse_args()
+    methods = DELTA_METHODS if args.cvd == 'compare' else (args.cvd,)
     print("--- Chạy Backtester ở chế độ Standalone ---")
-    signals = await run_backtest_logic()
-    if signals:
-        for signal in signals:
-            print_signal(signal)
-    print(f"\n--- Hoàn tất Backtest. Đã tìm thấy tổng cộng {len(signals)} tín hiệu. ---")
+    await init_binance_client()
+    results = {}
+    try:
+        for method in methods:
+            results[method] = await run_backtest_logic(delta_method=method)
+    finally:
+        await close_binance_client()
+        close_process_pool()
+    for method, signals in results.items():
+        if len(methods) == 1:
+            for signal in signals:
+                print_signal(signal)
+        print(f"\n--- Hoàn tất Backtest (delta '{method}'). Đã tìm thấy tổng cộng {len(signals)} tín hiệu. ---")
+        print(format_summary(summarize_trades(signals)))
 
 if __name__ == "__main__":
     try:
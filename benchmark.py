@@ -0,0 +1,402 @@
+# benchmark.py
+"""
+Benchmark bộ máy tín hiệu, chạy offline (không gọi Binance).
+
+- Dữ liệu: chuỗi OHLCV tổng hợp có seed cố định, và các file kline đã ghi (--fixtures):
+  *.json là mảng kline của REST (/fapi/v1/klines), *.jsonl là message stream như fake_kline_server.
+- Đo từng giai đoạn (parse, resample, indicators, cvd, stochastic, kernels, detection, enrichment) với
+  1/50/500 mã và 1k-1M nến: thời gian, thông lượng (nến/giây) và bộ nhớ đỉnh (tracemalloc).
+- Đối chiếu tập tín hiệu với cài đặt tham chiếu (vòng lặp iloc + tra cứu .loc như bản gốc) và
+  CVD/EMA50/Stoch với pandas_ta trong sai số VERIFY_RTOL/VERIFY_ATOL; thoát với mã 1 nếu có sai khác.
+- --backends numpy numba chạy lại mọi phép đo cho từng backend chỉ báo (kernels.py) và in tỷ lệ tăng tốc.
+
+    python benchmark.py --out bench_results.json
+    python benchmark.py --candles 1000 10000 --symbols 1 50 --compare bench_results.json
+    python benchmark.py --candles 1000 10000 100000 1000000 --symbols 1 --backends numpy numba
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+import pytz
+import trading_logic as tl
+from indicators import IndicatorState, ema, stoch, reference_indicators, VERIFY_RTOL, VERIFY_ATOL
+from signal_engine import pivot_masks
+import kernels
+from cvd import frame_delta
+from kline_parser import KLINE_FIELDS, parse_kline_payload, kline_frame
+from kline_stream import parse_kline_message
+from timeframes import resample_candles
+
+# --- CẤU HÌNH BENCHMARK ---
+BENCH_SYMBOLS = [1, 50, 500]
+BENCH_CANDLES = [1_000, 10_000, 100_000, 1_000_000]
+MAX_TOTAL_CANDLES = 5_000_000   # Bỏ qua tổ hợp (mã x nến) lớn hơn mức này
+BENCH_REPEAT = 3                # Lấy thời gian tốt nhất trong số lần chạy
+BENCH_SEED = 42
+VERIFY_MAX_CANDLES = 20_000     # Cài đặt tham chiếu chạy bằng vòng lặp nên chỉ đối chiếu phần cuối dữ liệu
+VERIFY_WINDOWS = 40             # Số cửa sổ LIVE_CANDLE_LIMIT nến dùng đối chiếu find_latest_confirmed_signal
+SYNTHETIC_START_MS = 1_704_067_200_000  # 2024-01-01 00:00 UTC
+M15_MS = 15 * 60 * 1000
+
+
+# --- DỮ LIỆU TỔNG HỢP / FIXTURE ---
+def synthetic_klines(candles, seed):
+    """
+    Sinh chuỗi nến M15 có seed cố định với đủ các cột của REST /klines (to_payload dựng lại body JSON).
+    Giá đi theo random walk với xu hướng đổi theo từng đoạn để có đủ fractal và phân kỳ.
+    """
+    rng = np.random.default_rng(seed)
+    drift = np.repeat(rng.normal(0, 0.002, candles // 200 + 1), 200)[:candles]
+    close = 100 * np.exp(np.cumsum(drift + rng.normal(0, 0.004, candles)))
+    open_ = np.r_[close[0], close[:-1]]
+    wick = np.abs(rng.normal(0, 0.003, (2, candles)))
+    high = np.maximum(open_, close) * (1 + wick[0])
+    low = np.minimum(open_, close) * (1 - wick[1])
+    volume = rng.lognormal(8, 0.6, candles)
+    taker_buy = volume * rng.beta(5, 5, candles)
+    timestamp = SYNTHETIC_START_MS + np.arange(candles, dtype=np.int64) * M15_MS
+    return pd.DataFrame({
+        'timestamp': timestamp,
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+        'close_time': timestamp + M15_MS - 1,
+        'quote_asset_volume': volume * close,
+        'number_of_trades': rng.integers(100, 5000, candles),
+        'taker_buy_base_asset_volume': taker_buy,
+        'taker_buy_quote_asset_volume': taker_buy * close,
+    })
+
+def to_payload(df):
+    """Chuyển DataFrame về body JSON của REST /klines (timestamp số nguyên, giá dạng chuỗi)."""
+    columns = [np.full(len(df), '0') if c == 'ignore' else df[c].to_numpy() if c in ('timestamp', 'close_time', 'number_of_trades') else df[c].astype(str).to_numpy()
+               for c in tl.KLINE_COLUMNS]
+    return json.dumps([list(row) for row in zip(*(c.tolist() for c in columns))]).encode()
+
+def load_fixture(path):
+    """Đọc kline đã ghi: mảng REST (.json) hoặc message stream (.jsonl, chỉ lấy nến đã đóng)."""
+    path = Path(path)
+    if path.suffix == '.jsonl':
+        rows = {}
+        with open(path) as f:
+            for line in f:
+                parsed = parse_kline_message(line) if line.strip() else None
+                if parsed and parsed[3]:
+                    rows[parsed[2]['timestamp']] = parsed[2]
+        df = pd.DataFrame([rows[ts] for ts in sorted(rows)], columns=list(KLINE_FIELDS))
+    else:
+        df = kline_frame(parse_kline_payload(path.read_bytes()))
+    return df.drop_duplicates('timestamp').reset_index(drop=True)
+
+
+# --- CÀI ĐẶT THAM CHIẾU (VÒNG LẶP GỐC, DÙNG ĐỂ ĐỐI CHIẾU) ---
+def _reference_fractals(df, n):
+    price_range = df['high'] - df['low']
+    df['delta'] = np.where(price_range > 0, df['volume'] * (2 * df['close'] - df['low'] - df['high']) / price_range, 0)
+    df['delta'] = df['delta'].fillna(0)
+    df['cvd'] = ta.ema(df['delta'], length=tl.CVD_PERIOD)
+    df['ema50'] = ta.ema(df['close'], length=tl.EMA_TREND_PERIOD)
+    up_fractals, down_fractals = [], []
+    for i in range(n, len(df) - n):
+        is_uptrend = df['close'].iloc[i] > df['ema50'].iloc[i]
+        is_downtrend = df['close'].iloc[i] < df['ema50'].iloc[i]
+        is_pivot_high = df['high'].iloc[i] >= df['high'].iloc[i-n:i+n+1].max()
+        is_pivot_low = df['low'].iloc[i] <= df['low'].iloc[i-n:i+n+1].min()
+        if is_pivot_high and is_uptrend: up_fractals.append(i)
+        if is_pivot_low and is_downtrend: down_fractals.append(i)
+    return up_fractals, down_fractals
+
+def _reference_divergence(df, last_pivot_idx, prev_pivot_idx, bearish):
+    cvd_last, cvd_prev = df['cvd'].iloc[last_pivot_idx], df['cvd'].iloc[prev_pivot_idx]
+    if (last_pivot_idx - prev_pivot_idx) >= tl.DIVERGENCE_MAX_BARS: return False
+    if bearish:
+        return df['high'].iloc[last_pivot_idx] > df['high'].iloc[prev_pivot_idx] and cvd_last < cvd_prev and cvd_last > 0 and cvd_prev > 0
+    return df['low'].iloc[last_pivot_idx] < df['low'].iloc[prev_pivot_idx] and cvd_last > cvd_prev and cvd_last < 0 and cvd_prev < 0
+
+def _reference_signal(df, pivot_idx, signal_type):
+    n = tl.FRACTAL_PERIODS
+    return {'type': signal_type, 'price': df['close'].iloc[pivot_idx], 'timestamp': df['timestamp'].iloc[pivot_idx], 'confirmation_timestamp': df['timestamp'].iloc[pivot_idx + n], 'confirmation_price': df['close'].iloc[pivot_idx + n], 'timeframe': 'M15'}
+
+def reference_all_signals(df):
+    n = tl.FRACTAL_PERIODS
+    df = df.copy()
+    if len(df) < tl.EMA_TREND_PERIOD + n: return []
+    up_fractals, down_fractals = _reference_fractals(df, n)
+    signals = [_reference_signal(df, up_fractals[i], 'SHORT 📉') for i in range(1, len(up_fractals))
+               if _reference_divergence(df, up_fractals[i], up_fractals[i-1], bearish=True)]
+    signals += [_reference_signal(df, down_fractals[i], 'LONG 📈') for i in range(1, len(down_fractals))
+                if _reference_divergence(df, down_fractals[i], down_fractals[i-1], bearish=False)]
+    return signals
+
+def reference_latest_signal(df):
+    n = tl.FRACTAL_PERIODS
+    df = df.copy()
+    if len(df) < tl.EMA_TREND_PERIOD + n: return None
+    up_fractals, down_fractals = _reference_fractals(df, n)
+    if len(up_fractals) >= 2 and up_fractals[-1] + n == len(df) - 1 and _reference_divergence(df, up_fractals[-1], up_fractals[-2], bearish=True):
+        return _reference_signal(df, up_fractals[-1], 'SHORT 📉')
+    if len(down_fractals) >= 2 and down_fractals[-1] + n == len(df) - 1 and _reference_divergence(df, down_fractals[-1], down_fractals[-2], bearish=False):
+        return _reference_signal(df, down_fractals[-1], 'LONG 📈')
+    return None
+
+def reference_enrich(signals, m15, h1):
+    """Tra Stoch bằng .loc từng tín hiệu như bộ quét gốc."""
+    m15 = m15.assign(stoch_k=tl.calculate_stochastic(m15)).set_index('timestamp')
+    h1 = h1.assign(stoch_k=tl.calculate_stochastic(h1)).set_index('timestamp')
+    final_signals = []
+    for signal in signals:
+        try:
+            stoch_m15 = m15.loc[signal['confirmation_timestamp'], 'stoch_k']
+            stoch_h1 = h1.loc[h1.index <= signal['confirmation_timestamp'], 'stoch_k'].iloc[-1]
+        except (KeyError, IndexError): continue
+        final_signal = tl.apply_stoch_filter(signal, stoch_m15, stoch_h1)
+        if final_signal: final_signals.append(final_signal)
+    return final_signals
+
+def signal_key(signal):
+    if signal is None: return None
+    return (signal['type'], int(signal['timestamp']), int(signal['confirmation_timestamp']), float(signal['price']), signal.get('tier'))
+
+
+# --- ĐO TỪNG GIAI ĐOẠN ---
+def _stoch_arrays(df):
+    return {'timestamp': df['timestamp'].to_numpy(), 'stoch_k': tl.calculate_stochastic(df).to_numpy(dtype=float)}
+
+def _warm_state(df):
+    state = IndicatorState(tl.CVD_PERIOD, tl.EMA_TREND_PERIOD, tl.STOCH_K, tl.STOCH_SMOOTH_K)
+    state.update(df.iloc[:-1])
+    return state
+
+def _hot_loops(df):
+    """Các vòng lặp nóng mà backend kernels.py thay thế: delta + CVD, EMA50, Stoch %K, pivot fractal."""
+    high, low, close = df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy()
+    return (ema(frame_delta(df, 'shape'), tl.CVD_PERIOD), ema(close, tl.EMA_TREND_PERIOD),
+            stoch(high, low, close, tl.STOCH_K, tl.STOCH_SMOOTH_K), pivot_masks(high, low, tl.FRACTAL_PERIODS))
+
+def _scan_offline(klines):
+    """Đường quét live của một mã không qua mạng / Telegram: resample, chỉ báo, tìm tín hiệu, lọc Stoch."""
+    h1 = resample_candles(klines, '15m', '1h')
+    signal_indicators = IndicatorState(tl.CVD_PERIOD, tl.EMA_TREND_PERIOD, tl.STOCH_K, tl.STOCH_SMOOTH_K).update(klines)
+    filter_indicators = IndicatorState(tl.CVD_PERIOD, tl.EMA_TREND_PERIOD, tl.STOCH_K, tl.STOCH_SMOOTH_K).update(h1)
+    signal = tl.find_latest_confirmed_signal(klines, signal_indicators)
+    return tl.enrich_signals([signal], signal_indicators, filter_indicators) if signal else []
+
+def stage_plan(frames):
+    """
+    Các giai đoạn của pipeline theo thứ tự chạy: (tên, hàm chuẩn bị dữ liệu không tính giờ, hàm được đo).
+    Dữ liệu chuẩn bị của giai đoạn sau dùng kết quả của giai đoạn trước.
+    """
+    return [
+        ('parse', lambda: [to_payload(df) for df in frames], lambda payloads: [parse_kline_payload(payload) for payload in payloads]),
+        ('parse_frame', lambda: [to_payload(df) for df in frames], lambda payloads: [kline_frame(parse_kline_payload(payload)) for payload in payloads]),
+        ('resample', lambda: frames, lambda dfs: [resample_candles(df, '15m', '1h') for df in dfs]),
+        ('indicators_full', lambda: frames, lambda dfs: [IndicatorState(tl.CVD_PERIOD, tl.EMA_TREND_PERIOD, tl.STOCH_K, tl.STOCH_SMOOTH_K).update(df) for df in dfs]),
+        ('indicators_incremental', lambda: [(_warm_state(df), df.iloc[1:]) for df in frames], lambda items: [state.update(df) for state, df in items]),
+        ('cvd_shape', lambda: frames, lambda dfs: [ema(frame_delta(df, 'shape'), tl.CVD_PERIOD) for df in dfs]),
+        ('cvd_taker', lambda: frames, lambda dfs: [ema(frame_delta(df, 'taker'), tl.CVD_PERIOD) for df in dfs]),
+        ('stochastic', lambda: frames, lambda dfs: [tl.calculate_stochastic(df) for df in dfs]),
+        ('kernels', lambda: frames, lambda dfs: [_hot_loops(df) for df in dfs]),
+        ('detection_all', lambda: frames, lambda dfs: [tl.find_all_signals_for_backtest(df) for df in dfs]),
+        ('detection_latest', lambda: [(df, IndicatorState(tl.CVD_PERIOD, tl.EMA_TREND_PERIOD, tl.STOCH_K, tl.STOCH_SMOOTH_K).update(df)) for df in frames],
+         lambda items: [tl.find_latest_confirmed_signal(df, indicators) for df, indicators in items]),
+        ('enrichment', lambda: [(tl.find_all_signals_for_backtest(df), _stoch_arrays(df), _stoch_arrays(resample_candles(df, '15m', '1h'))) for df in frames],
+         lambda items: [tl.enrich_signals(signals, m15, h1) for signals, m15, h1 in items]),
+        ('scan_symbol', lambda: [parse_kline_payload(to_payload(df)) for df in frames], lambda items: [_scan_offline(klines) for klines in items]),
+    ]
+
+def run_stages(frames, repeat):
+    total_candles = sum(len(df) for df in frames)
+    results = {}
+    for name, prepare, run in stage_plan(frames):
+        data = prepare()
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(data)
+            best = min(best, time.perf_counter() - start)
+        # Lần chạy riêng dưới tracemalloc để đo bộ nhớ đỉnh (tracemalloc làm chậm nên không tính giờ)
+        tracemalloc.start()
+        run(data)
+        _, peak = tracemalloc.get_traced_memory()
+        # Bộ nhớ đỉnh khi xử lý riêng từng mã (lấy mã lớn nhất), để ước lượng theo kích thước watchlist
+        peak_per_symbol = 0
+        for item in data:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            run([item])
+            peak_per_symbol = max(peak_per_symbol, tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+        results[name] = {
+            'seconds': best,
+            'candles_per_second': total_candles / best if best > 0 else None,
+            'peak_bytes': peak,
+            'peak_bytes_per_symbol': peak_per_symbol,
+        }
+        print(f"      {name:<24} {best * 1000:10.2f} ms  {total_candles / best if best > 0 else 0:14,.0f} nến/s  {peak / 2**20:8.1f} MiB  {peak_per_symbol / 2**10:8.0f} KiB/mã")
+    return results
+
+
+# --- ĐỐI CHIẾU VỚI CÀI ĐẶT THAM CHIẾU ---
+def verify_equivalence(source, df):
+    """
+    So tập tín hiệu (backtest, nến cuối live, sau lọc Stoch) giữa bản hiện tại và bản tham chiếu.
+    Bản tham chiếu dùng delta theo hình dạng nến nên bản hiện tại cũng chạy với delta 'shape'.
+    """
+    df = df.tail(VERIFY_MAX_CANDLES).reset_index(drop=True)
+    mismatches = []
+    expected_indicators = reference_indicators(df, tl.CVD_PERIOD, tl.EMA_TREND_PERIOD, tl.STOCH_K, tl.STOCH_SMOOTH_K)
+    actual_indicators = IndicatorState(tl.CVD_PERIOD, tl.EMA_TREND_PERIOD, tl.STOCH_K, tl.STOCH_SMOOTH_K).update(df)
+    for name, expected in expected_indicators.items():
+        actual = actual_indicators[name]
+        if not np.allclose(actual, expected, rtol=VERIFY_RTOL, atol=VERIFY_ATOL, equal_nan=True):
+            mismatches.append({'check': f'indicators[{name}]', 'max_abs_diff': float(np.nanmax(np.abs(actual - expected)))})
+    expected_all = reference_all_signals(df)
+    actual_all = tl.find_all_signals_for_backtest(df, delta_method='shape')
+    expected_keys, actual_keys = {signal_key(s) for s in expected_all}, {signal_key(s) for s in actual_all}
+    if expected_keys != actual_keys:
+        mismatches.append({'check': 'find_all_signals_for_backtest',
+                           'missing': sorted(map(str, expected_keys - actual_keys)),
+                           'extra': sorted(map(str, actual_keys - expected_keys))})
+    h1 = resample_candles(df, '15m', '1h')
+    expected_enriched = {signal_key(s) for s in reference_enrich(expected_all, df, h1)}
+    actual_enriched = {signal_key(s) for s in tl.enrich_signals(actual_all, _stoch_arrays(df), _stoch_arrays(h1))}
+    if expected_enriched != actual_enriched:
+        mismatches.append({'check': 'enrich_signals',
+                           'missing': sorted(map(str, expected_enriched - actual_enriched)),
+                           'extra': sorted(map(str, actual_enriched - expected_enriched))})
+    # Cửa sổ live kết thúc đúng ở nến xác nhận của các tín hiệu, cộng thêm các điểm ngẫu nhiên
+    window = tl.LIVE_CANDLE_LIMIT
+    if len(df) < window:
+        ends = np.array([len(df)])
+    else:
+        confirm_positions = np.searchsorted(df['timestamp'].to_numpy(), [s['confirmation_timestamp'] for s in expected_all]) + 1
+        rng = np.random.default_rng(BENCH_SEED)
+        ends = np.unique(np.r_[confirm_positions[confirm_positions >= window], rng.integers(window, len(df) + 1, VERIFY_WINDOWS)])
+        if len(ends) > VERIFY_WINDOWS:
+            ends = rng.choice(ends, VERIFY_WINDOWS, replace=False)
+    for end in ends:
+        window_df = df.iloc[max(0, end - window):end].reset_index(drop=True)
+        expected = signal_key(reference_latest_signal(window_df))
+        indicators = IndicatorState(tl.CVD_PERIOD, tl.EMA_TREND_PERIOD, tl.STOCH_K, tl.STOCH_SMOOTH_K).update(window_df)
+        for check, actual in (('find_latest_confirmed_signal', tl.find_latest_confirmed_signal(window_df, delta_method='shape')),
+                              ('find_latest_confirmed_signal[indicators]', tl.find_latest_confirmed_signal(window_df, indicators))):
+            if signal_key(actual) != expected:
+                mismatches.append({'check': check, 'window_end': int(window_df['timestamp'].iloc[-1]),
+                                   'expected': str(expected), 'actual': str(signal_key(actual))})
+    print(f"   Đối chiếu {source} [{kernels.backend}]: {len(expected_all)} tín hiệu, {len(ends)} cửa sổ live, {len(mismatches)} sai khác")
+    return {'source': source, 'backend': kernels.backend, 'candles': len(df), 'signals': len(expected_all), 'windows': len(ends), 'mismatches': mismatches}
+
+
+# --- CHẠY / SO SÁNH ---
+def run_metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'started_at': datetime.now(pytz.utc).isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'numba': kernels.numba.__version__ if kernels.numba is not None else None,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare_results(current, previous):
+    """In tỷ lệ thời gian hiện tại / lần chạy trước cho mỗi (run, giai đoạn) có ở cả hai."""
+    old_runs = {(r['source'], r['symbols'], r['candles'], r.get('backend', 'numpy')): r['stages'] for r in previous['runs']}
+    print(f"\nSo sánh với commit {previous['meta'].get('git_commit')} (tỷ lệ < 1 là nhanh hơn):")
+    for run in current['runs']:
+        old_stages = old_runs.get((run['source'], run['symbols'], run['candles'], run['backend']))
+        if not old_stages: continue
+        ratios = [f"{name}={stage['seconds'] / old_stages[name]['seconds']:.2f}x"
+                  for name, stage in run['stages'].items() if name in old_stages and old_stages[name]['seconds'] > 0]
+        print(f"   {run['source']} [{run['backend']}] {run['symbols']}x{run['candles']}: {', '.join(ratios)}")
+
+def backend_speedup(runs, baseline='numpy'):
+    """Tỷ lệ thời gian backend `baseline` / backend khác cho mỗi (run, giai đoạn) đo được ở cả hai (> 1 là nhanh hơn)."""
+    base = {(r['source'], r['symbols'], r['candles']): r['stages'] for r in runs if r['backend'] == baseline}
+    speedup = []
+    for run in runs:
+        base_stages = base.get((run['source'], run['symbols'], run['candles']))
+        if run['backend'] == baseline or not base_stages: continue
+        stages = {name: base_stages[name]['seconds'] / stage['seconds']
+                  for name, stage in run['stages'].items() if name in base_stages and stage['seconds'] > 0}
+        speedup.append({'source': run['source'], 'symbols': run['symbols'], 'candles': run['candles'], 'backend': run['backend'], 'stages': stages})
+        print(f"   {run['source']} {run['symbols']}x{run['candles']} {run['backend']}/{baseline}: "
+              + ', '.join(f"{name}=x{ratio:.1f}" for name, ratio in stages.items()))
+    return speedup
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark và đối chiếu bộ máy tín hiệu (offline)")
+    parser.add_argument('--symbols', type=int, nargs='+', default=BENCH_SYMBOLS, help="Số mã mỗi lần đo")
+    parser.add_argument('--candles', type=int, nargs='+', default=BENCH_CANDLES, help="Số nến M15 mỗi mã")
+    parser.add_argument('--fixtures', nargs='*', default=[], help="File kline đã ghi (.json REST hoặc .jsonl stream)")
+    parser.add_argument('--repeat', type=int, default=BENCH_REPEAT)
+    parser.add_argument('--max-total-candles', type=int, default=MAX_TOTAL_CANDLES)
+    parser.add_argument('--seed', type=int, default=BENCH_SEED)
+    parser.add_argument('--skip-verify', action='store_true', help="Không đối chiếu với cài đặt tham chiếu")
+    parser.add_argument('--out', help="Ghi kết quả JSON ra file (mặc định in ra stdout)")
+    parser.add_argument('--compare', help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument('--backends', nargs='+', choices=kernels.BACKENDS, default=[tl.KERNEL_BACKEND],
+                        help="Backend chỉ báo cần đo (mặc định theo INDICATOR_BACKEND)")
+    args = parser.parse_args()
+
+    result = {'meta': run_metadata(), 'runs': [], 'skipped': [], 'equivalence': []}
+    result['meta'].update(repeat=args.repeat, seed=args.seed)
+    fixtures = {path: load_fixture(path) for path in args.fixtures}
+    for backend in args.backends:
+        if kernels.set_backend(backend) != backend:
+            result['skipped'].append({'backend': backend})
+            continue
+        for candles in args.candles:
+            for symbols in args.symbols:
+                if symbols * candles > args.max_total_candles:
+                    result['skipped'].append({'backend': backend, 'symbols': symbols, 'candles': candles})
+                    continue
+                print(f"\n>> [{backend}] synthetic: {symbols} mã x {candles:,} nến")
+                frames = [synthetic_klines(candles, args.seed + i) for i in range(symbols)]
+                result['runs'].append({'source': 'synthetic', 'backend': backend, 'symbols': symbols, 'candles': candles,
+                                       'stages': run_stages(frames, args.repeat)})
+        for path, df in fixtures.items():
+            print(f"\n>> [{backend}] fixture {path}: {len(df):,} nến")
+            result['runs'].append({'source': path, 'backend': backend, 'symbols': 1, 'candles': len(df), 'stages': run_stages([df], args.repeat)})
+
+        if not args.skip_verify:
+            print(f"\n>> [{backend}] Đối chiếu với cài đặt tham chiếu")
+            sources = {f"synthetic:{args.seed}": synthetic_klines(min(max(args.candles), VERIFY_MAX_CANDLES), args.seed), **fixtures}
+            result['equivalence'] += [verify_equivalence(source, df) for source, df in sources.items()]
+    kernels.set_backend(tl.KERNEL_BACKEND)
+    if len({run['backend'] for run in result['runs']}) > 1:
+        print("\n>> Tăng tốc so với backend numpy")
+        result['speedup'] = backend_speedup(result['runs'])
+    result['equivalent'] = all(not check['mismatches'] for check in result['equivalence'])
+
+    output = json.dumps(result, indent=2, default=str)
+    if args.out:
+        Path(args.out).write_text(output)
+        print(f"\nĐã ghi kết quả vào {args.out}")
+    else:
+        print(output)
+    if args.compare:
+        compare_results(result, json.loads(Path(args.compare).read_text()))
+    if not result['equivalent']:
+        print("❌ Tín hiệu KHÁC với cài đặt tham chiếu.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# binance_client.py
+import asyncio
+import time
+import aiohttp
+from binance.async_client import AsyncClient
+from binance.exceptions import BinanceAPIException
+
+# --- CẤU HÌNH POOL KẾT NỐI ---
+HTTP_POOL_SIZE = 20          # Số kết nối TCP tối đa giữ trong pool
+HTTP_KEEPALIVE_SECONDS = 60  # Thời gian giữ kết nối rảnh trước khi đóng
+HTTP_TIMEOUT_SECONDS = 15
+
+# Biến global để giữ client dùng chung (giống db_pool trong database.py)
+binance_client = None
+_client_lock = asyncio.Lock()
+
+async def init_binance_client():
+    """
+    Tạo AsyncClient dùng chung cho toàn bộ ứng dụng với pool keep-alive giới hạn.
+    Hàm này chỉ được gọi một lần khi bot khởi động.
+    """
+    global binance_client
+    async with _client_lock:
+        if binance_client:
+            return binance_client
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=HTTP_KEEPALIVE_SECONDS)
+        binance_client = await AsyncClient.create(session_params={
+            'connector': connector,
+            'timeout': aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SECONDS),
+        })
+        print(f"Binance client initialized (pool size {HTTP_POOL_SIZE}).")
+        return binance_client
+
+async def get_binance_client():
+    """Trả về client dùng chung, tự khởi tạo nếu chưa có (ví dụ khi chạy backtester độc lập)."""
+    if binance_client:
+        return binance_client
+    return await init_binance_client()
+
+async def close_binance_client():
+    """Đóng client và pool kết nối khi bot tắt."""
+    global binance_client
+    if binance_client:
+        await binance_client.close_connection()
+        print("Binance client closed.")
+        binance_client = None
+
+async def fetch_klines_payload(client, params, spot=False):
+    """
+    Gọi REST klines qua session của client nhưng trả về body thô (bytes) thay vì list đã
+    decode bởi python-binance, để kline_parser đọc thẳng vào mảng numpy.
+    Lỗi HTTP được đổi thành BinanceAPIException giống các hàm của client.
+    """
+    uri = client._create_api_uri('klines', signed=False, version='v3') if spot else client._create_futures_api_uri('klines')
+    async with client.session.get(uri, params=params) as response:
+        client.response = response
+        body = await response.read()
+        if not str(response.status).startswith('2'):
+            raise BinanceAPIException(response, response.status, body.decode())
+        return body
+
+# --- GIỚI HẠN TRỌNG SỐ REQUEST (REQUEST WEIGHT) CỦA BINANCE ---
+BINANCE_WEIGHT_PER_MINUTE = 2400  # Giới hạn IP của Futures REST
+WEIGHT_SAFETY_RATIO = 0.8         # Chỉ dùng 80% giới hạn để chừa chỗ cho các request khác
+MAX_RATE_LIMIT_RETRIES = 3
+
+def kline_request_weight(limit):
+    """Trọng số của endpoint klines phụ thuộc vào tham số limit."""
+    if limit < 100: return 1
+    if limit < 500: return 2
+    if limit <= 1000: return 5
+    return 10
+
+class WeightLimiter:
+    """
+    Token bucket theo trọng số request của Binance.
+    Token được nạp lại đều đặn theo giới hạn mỗi phút, đồng bộ với header
+    X-MBX-USED-WEIGHT-1M từ server và tạm dừng toàn bộ khi bị 429/418.
+    """
+    def __init__(self, weight_per_minute=BINANCE_WEIGHT_PER_MINUTE, safety_ratio=WEIGHT_SAFETY_RATIO):
+        self.capacity = weight_per_minute * safety_ratio
+        self.refill_rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.used_weight = 0
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.refill_rate)
+        self._updated_at = now
+
+    async def acquire(self, weight):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep((weight - self.tokens) / self.refill_rate)
+
+    def update_used_weight(self, used_weight):
+        """Đồng bộ với trọng số server báo đã dùng trong phút hiện tại."""
+        self.used_weight = used_weight
+        self._refill()
+        self.tokens = min(self.tokens, max(0.0, self.capacity - used_weight))
+
+    def backoff(self, retry_after):
+        """Chặn mọi request trong retry_after giây (khi nhận 429/418)."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        self.tokens = 0.0
+
+weight_limiter = WeightLimiter()
+
+def record_used_weight(client):
+    """Đọc header X-MBX-USED-WEIGHT-1M của response gần nhất và cập nhật limiter."""
+    response = getattr(client, 'response', None)
+    if response is None: return
+    used = response.headers.get('X-MBX-USED-WEIGHT-1M') or response.headers.get('X-MBX-USED-WEIGHT')
+    if used is not None:
+        weight_limiter.update_used_weight(int(used))
+
+def retry_after_seconds(exception, default=60):
+    """Lấy thời gian chờ từ header Retry-After của response lỗi 429/418."""
+    response = getattr(exception, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', default))
+    except (TypeError, ValueError):
+        return default
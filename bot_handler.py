@@ -1,17 +1,23 @@
 # bot_handler.py
 
 import asyncio
+import html
+import io
+import pstats
 from datetime import datetime
 import pytz
 from telegram import Update, Bot
 from telegram.ext import ContextTypes
-from config import CHANNEL_ID
-from backtester import run_backtest_logic
-from database import (
-    get_watchlist_from_db, 
-    add_symbols_to_db, 
-    remove_symbols_from_db
-)
+from config import CHANNEL_ID, CHAT_ID
+from backtester import run_backtest_logic, SYMBOLS_TO_TEST, BACKTEST_DAYS
+from trading_logic import CVD_METHOD, TIMEFRAME_M15, TIMEFRAME_H1
+from timeframes import parse_pipelines
+from cvd import check_delta_method
+from trade_simulator import summarize_trades, format_summary
+from watchlist_manager import watchlist_manager
+from signal_store import SignalStore
+from metrics import profile_coroutine
+from telegram_queue import telegram_queue
 
 # Cấu hình logging
 import logging
@@ -36,7 +42,7 @@ async def _reload_or_restart_logic(context: ContextTypes.DEFAULT_TYPE):
 
     new_task = asyncio.create_task(run_signal_checker(context.bot))
     context.application.bot_data["watchlist_task"] = new_task
-    logger.info("Bộ quét tín hiệu đã được khởi động lại với watchlist mới.")
+    logger.info("Bộ quét tín hiệu đã được khởi động lại.")
 
 
 # Handler cho /start
@@ -52,13 +58,11 @@ async def add_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         await update.message.reply_text("Ví dụ: /add BTCUSDT ETHUSDT")
         return
     
-    current_watchlist = await get_watchlist_from_db()
-    symbols_to_add = [s.upper() for s in context.args if s.upper() not in current_watchlist]
+    # Cập nhật watchlist tại chỗ, bộ quét áp dụng từ chu kỳ tiếp theo mà không cần khởi động lại
+    symbols_to_add = await watchlist_manager.add([s.upper() for s in context.args])
     
     if symbols_to_add:
-        await add_symbols_to_db(symbols_to_add)
-        await update.message.reply_text(f"Đã thêm thành công: {', '.join(symbols_to_add)}. Đang tải lại...")
-        await _reload_or_restart_logic(context)
+        await update.message.reply_text(f"Đã thêm thành công: {', '.join(symbols_to_add)}. Áp dụng từ chu kỳ quét tiếp theo.")
     else:
         await update.message.reply_text("Các mã coin này đã có trong danh sách.")
 
@@ -68,23 +72,20 @@ async def remove_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text("Ví dụ: /remove SOLUSDT")
         return
 
-    current_watchlist = await get_watchlist_from_db()
-    symbols_to_remove = [s.upper() for s in context.args if s.upper() in current_watchlist]
-    not_found_symbols = [s.upper() for s in context.args if s.upper() not in current_watchlist]
+    symbols_to_remove, not_found_symbols = await watchlist_manager.remove([s.upper() for s in context.args])
 
     if symbols_to_remove:
-        await remove_symbols_from_db(symbols_to_remove)
-        message = f"Đã xóa thành công: {', '.join(symbols_to_remove)}. Đang tải lại..."
+        message = f"Đã xóa thành công: {', '.join(symbols_to_remove)}. Áp dụng từ chu kỳ quét tiếp theo."
         if not_found_symbols:
             message += f"\nKhông tìm thấy: {', '.join(not_found_symbols)}"
         await update.message.reply_text(message)
-        await _reload_or_restart_logic(context)
     else:
         await update.message.reply_text("Không tìm thấy các mã coin này trong danh sách.")
 
 # Handler cho /list
 async def list_symbols(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    watchlist = await get_watchlist_from_db()
+    await watchlist_manager.load()
+    watchlist = watchlist_manager.snapshot()
     if not watchlist:
         message = "Danh sách theo dõi đang trống."
     else:
@@ -97,8 +98,29 @@ async def restart_bot(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     await _reload_or_restart_logic(context)
     await update.message.reply_text("Bot đã được khởi động lại.")
 
-# Hàm gửi tín hiệu
-async def send_formatted_signal(bot: Bot, signal_data: dict):
+# Handler cho /profile (chỉ admin): chạy thử một chu kỳ quét dưới cProfile và trả về các hàm tốn thời gian nhất.
+# Chạy thử không gửi tín hiệu và dùng SignalStore riêng, nên không chặn các tín hiệu mà bộ quét thật sẽ gửi.
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    from trading_logic import scan_watchlist
+
+    if str(update.effective_chat.id) != str(CHAT_ID):
+        return
+    watchlist = watchlist_manager.snapshot()
+    if not watchlist:
+        await update.message.reply_text("Danh sách theo dõi đang trống.")
+        return
+    await update.message.reply_text(f"⏳ Đang profile một chu kỳ quét thử ({len(watchlist)} mã, không gửi tín hiệu)...")
+    stats, profiler = await profile_coroutine(scan_watchlist(None, watchlist, store=SignalStore(persist=False)))
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(15)
+    report = html.escape(output.getvalue()[-3500:])
+    await update.message.reply_text(
+        f"Chu kỳ: {stats['duration_seconds']:.2f}s, lỗi: {stats['errors']}\n<pre>{report}</pre>",
+        parse_mode='HTML'
+    )
+
+# Hàm định dạng / gửi tín hiệu
+def format_signal_message(signal_data: dict):
     vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
     original_time = datetime.fromtimestamp(signal_data['timestamp'] / 1000, tz=pytz.utc).astimezone(vietnam_tz)
     confirmation_time = datetime.fromtimestamp(signal_data['confirmation_timestamp'] / 1000, tz=pytz.utc).astimezone(vietnam_tz)
@@ -109,7 +131,7 @@ async def send_formatted_signal(bot: Bot, signal_data: dict):
     stoch_m15 = signal_data.get('stoch_m15', 0.0)
     stoch_h1 = signal_data.get('stoch_h1', 0.0)
         
-    message = (
+    return (
         f"<b>🔶 Token:</b> <code>{signal_data['symbol']}</code>\n"
         f"<b>{signal_emoji} {signal_type_text}</b>\n"
         f"<b>⏰ Khung thời gian:</b> {signal_data.get('timeframe', 'N/A')}\n"
@@ -118,27 +140,148 @@ async def send_formatted_signal(bot: Bot, signal_data: dict):
         f"---------------------------------\n"
         f"<i>Thời gian gốc: {original_time.strftime('%H:%M %d-%m-%Y')}</i>\n"
         f"<i>Thời gian xác nhận: {confirmation_time.strftime('%H:%M %d-%m-%Y')}</i>\n"
-        f"<i>Stoch (M15/H1): {stoch_m15:.2f} / {stoch_h1:.2f}</i>"
+        f"<i>Stoch ({signal_data.get('timeframe', 'M15')}/{signal_data.get('filter_timeframe', 'H1')}): {stoch_m15:.2f} / {stoch_h1:.2f}</i>"
     )
+
+async def send_formatted_signal(bot: Bot, signal_data: dict):
+    """
+    Đưa tín hiệu vào hàng đợi gửi và trả về ngay; task gửi nền lo giới hạn tốc độ, thử lại và gộp tin.
+    Trả về Future của telegram_queue (True khi Telegram đã nhận) cho nơi cần xác nhận đã gửi (signal_outbox).
+    """
+    delivered = telegram_queue.enqueue(bot, CHANNEL_ID, format_signal_message(signal_data))
+    logger.info(f"📨 Đã xếp tín hiệu {signal_data['symbol']} vào hàng đợi gửi.")
+    return delivered
+
+# --- /backtest CHẠY NỀN ---
+PROGRESS_EDIT_SECONDS = 3 # Khoảng cách tối thiểu giữa hai lần sửa tin tiến độ
+BACKTEST_USAGE = (
+    "Cú pháp: /backtest [MÃ ...] [tf=15m:1h] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [days=N] [cvd=shape|taker]\n"
+    "Ví dụ: /backtest BTCUSDT ETHUSDT tf=1h:4h from=2024-01-01 to=2024-06-30"
+)
+
+def _parse_date(value):
+    return int(datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=pytz.utc).timestamp() * 1000)
+
+def parse_backtest_args(args):
+    """
+    Đọc tham số /backtest thành dict keyword cho run_backtest_logic.
+    Từ không có dấu '=' là mã coin; 'to' lấy hết ngày đó (UTC). Sai cú pháp thì ném ValueError.
+    """
+    options = {'symbols': [], 'pipeline': (TIMEFRAME_M15, TIMEFRAME_H1), 'days': BACKTEST_DAYS,
+               'start': None, 'end': None, 'delta_method': CVD_METHOD}
+    for arg in args:
+        if '=' not in arg:
+            options['symbols'].append(arg.upper())
+            continue
+        name, value = arg.split('=', 1)
+        name = name.lower()
+        if name == 'tf':
+            options['pipeline'] = parse_pipelines(value)[0]
+        elif name == 'from':
+            options['start'] = _parse_date(value)
+        elif name == 'to':
+            options['end'] = _parse_date(value) + 86_400_000 - 1
+        elif name == 'days':
+            options['days'] = int(value)
+            if options['days'] <= 0:
+                raise ValueError("days phải lớn hơn 0")
+        elif name == 'cvd':
+            options['delta_method'] = check_delta_method(value)
+        else:
+            raise ValueError(f"Tham số không hợp lệ: {name}")
+    if options['end'] is not None and options['start'] is None:
+        options['start'] = options['end'] - options['days'] * 86_400_000
+    if options['start'] is not None and options['end'] is not None and options['start'] > options['end']:
+        raise ValueError("'from' phải trước 'to'")
+    options['symbols'] = options['symbols'] or None
+    return options
+
+def _describe_backtest(options):
+    symbols = ', '.join(options['symbols'] or SYMBOLS_TO_TEST)
+    signal_interval, filter_interval = options['pipeline']
+    if options['start'] is None:
+        window = f"{options['days']} ngày gần nhất"
+    else:
+        start = datetime.fromtimestamp(options['start'] / 1000, tz=pytz.utc).strftime('%d-%m-%Y')
+        end = datetime.fromtimestamp(options['end'] / 1000, tz=pytz.utc).strftime('%d-%m-%Y') if options['end'] else "nay"
+        window = f"{start} → {end}"
+    return f"{symbols} | {signal_interval}/{filter_interval} | {window} | CVD {options['delta_method']}"
+
+async def _edit_status(message, text):
     try:
-        await bot.send_message(chat_id=CHANNEL_ID, text=message, parse_mode='HTML')
-        logger.info(f"✅ Đã gửi tín hiệu cho {signal_data['symbol']} lên channel.")
+        await message.edit_text(text)
     except Exception as e:
-        logger.error(f"❌ Gửi tín hiệu thất bại: {e}")
+        # Sửa tin chỉ để báo tiến độ: lỗi (trùng nội dung, flood limit...) thì bỏ qua
+        logger.warning(f"Không sửa được tin tiến độ backtest: {e}")
 
-# Handler cho /backtest
-async def backtest_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text("⏳ Bắt đầu backtest...")
+async def _backtest_job(status_message, options):
+    """Chạy backtest trong nền, sửa một tin duy nhất để báo tiến độ và kết quả."""
+    description = _describe_backtest(options)
+    progress = {'done': 0, 'total': 0, 'cached': 0}
+    finished = asyncio.Event()
+
+    def on_progress(done, total, symbol, cached):
+        progress.update(done=done, total=total)
+        progress['cached'] += cached
+
+    async def report_progress():
+        last_text = None
+        while not finished.is_set():
+            try:
+                await asyncio.wait_for(finished.wait(), PROGRESS_EDIT_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            text = f"⏳ Backtest {description}\nĐã xong {progress['done']}/{progress['total'] or '?'} mã..."
+            if not finished.is_set() and text != last_text:
+                await _edit_status(status_message, text)
+                last_text = text
+
+    reporter = asyncio.create_task(report_progress())
     try:
-        found_signals = await run_backtest_logic()
-        if not found_signals:
-            await update.message.reply_text("✅ Hoàn tất. Không tìm thấy tín hiệu nào.")
-            return
-        await update.message.reply_text(f"🔥 Tìm thấy {len(found_signals)} tín hiệu! Bắt đầu gửi...")
-        for signal in found_signals:
-            await send_formatted_signal(context.bot, signal)
-            await asyncio.sleep(1)
-        await update.message.reply_text("✅ Backtest hoàn tất.")
+        found_signals = await run_backtest_logic(on_progress=on_progress, **options)
+    except asyncio.CancelledError:
+        finished.set()
+        await _edit_status(status_message, f"⛔ Backtest {description} đã bị hủy.")
+        raise
     except Exception as e:
         logger.error(f"Lỗi backtest: {e}")
-        await update.message.reply_text(f"Rất tiếc, đã có lỗi: {e}")
\ No newline at end of file
+        finished.set()
+        await _edit_status(status_message, f"Rất tiếc, đã có lỗi: {e}")
+        return
+    finally:
+        finished.set()
+        await reporter
+
+    cache_note = f" ({progress['cached']}/{progress['total']} mã lấy từ cache)" if progress['cached'] else ""
+    if not found_signals:
+        await _edit_status(status_message, f"✅ Backtest {description} hoàn tất{cache_note}. Không tìm thấy tín hiệu nào.")
+        return
+    # Chỉ báo kết quả tổng hợp trong chat đã gọi lệnh: tín hiệu lịch sử không được gửi vào channel tín hiệu live
+    await _edit_status(
+        status_message,
+        f"✅ Backtest {description} hoàn tất{cache_note}.\n"
+        f"🔥 Tìm thấy {len(found_signals)} tín hiệu.\n\n"
+        f"{format_summary(summarize_trades(found_signals))}"
+    )
+
+# Handler cho /backtest
+async def backtest_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        options = parse_backtest_args(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}\n{BACKTEST_USAGE}")
+        return
+
+    # Mỗi chat chỉ chạy một backtest tại một thời điểm
+    jobs = context.application.bot_data.setdefault("backtest_jobs", {})
+    chat_id = update.effective_chat.id
+    job = jobs.get(chat_id)
+    if job and not job.done():
+        await update.message.reply_text("⏳ Một backtest khác đang chạy, vui lòng đợi kết quả.")
+        return
+
+    status_message = await update.message.reply_text(f"⏳ Bắt đầu backtest {_describe_backtest(options)}...")
+    # Chạy nền để handler trả về ngay, bot vẫn nhận lệnh khác trong lúc backtest
+    job = asyncio.create_task(_backtest_job(status_message, options))
+    jobs[chat_id] = job
+    job.add_done_callback(lambda task: jobs.pop(chat_id, None) if jobs.get(chat_id) is task else None)
@@ -0,0 +1,127 @@
+# candle_cache.py
+import numpy as np
+from binance.helpers import interval_to_milliseconds
+from kline_parser import kline_row
+from clock import clock
+
+# --- CẤU HÌNH CACHE NẾN ---
+MAX_TOPUP_CANDLES = 99  # limit < 100 giữ trọng số request ở mức thấp nhất (1)
+
+
+class CandleCache:
+    """
+    Bộ đệm nến trong bộ nhớ theo (symbol, interval).
+    Lần đầu tải đầy đủ `limit` nến, các chu kỳ sau chỉ tải các nến mới kể từ
+    nến cuối trong cache (nến cuối được tải lại vì có thể chưa đóng).
+    Nếu dữ liệu mới không nối liền với cache thì tải lại toàn bộ.
+    Mã có ít lịch sử hơn `limit` (mới niêm yết) được đánh dấu đã tải hết lịch sử khi lần tải đầy đủ trả về ít
+    hơn `limit` nến, các chu kỳ sau vẫn chỉ tải nến mới và bộ đệm lớn dần đến `limit`.
+    Nến được giữ dưới dạng structured array (kline_parser.KLINE_DTYPE) chỉ đọc: get/snapshot trả về
+    chính mảng trong cache thay vì bản sao, mỗi lần cập nhật tạo mảng mới nên mảng đã trả ra không bị đổi.
+    """
+    def __init__(self, fetcher):
+        # fetcher: coroutine (symbol, interval, limit, start_time=None) -> structured array, ví dụ get_kline_array
+        self.fetcher = fetcher
+        self._frames = {}
+        self._limits = {}
+        self._full_history = set()
+
+    def __contains__(self, key):
+        return key in self._frames
+
+    async def get(self, symbol, interval, limit):
+        key = (symbol, interval)
+        cached = self._frames.get(key)
+        df = None
+        if cached is not None and (len(cached) >= limit or key in self._full_history):
+            df = await self._top_up(symbol, interval, cached)
+        if df is None:
+            df = await self.fetcher(symbol, interval, limit=limit)
+            if len(df) == 0:
+                self._forget(key)
+                return df
+            if len(df) < limit:
+                self._full_history.add(key)
+        df = df[-limit:]
+        if len(df) >= limit:
+            self._full_history.discard(key)
+        self._limits[key] = limit
+        df.flags.writeable = False
+        self._frames[key] = df
+        return df
+
+    async def _top_up(self, symbol, interval, cached):
+        """Trả về mảng nến đã nối thêm nến mới, hoặc None nếu cần tải lại toàn bộ."""
+        interval_ms = interval_to_milliseconds(interval)
+        last_ts = int(cached['timestamp'][-1])
+        missing = (int(clock.time() * 1000) - last_ts) // interval_ms + 1
+        if missing > MAX_TOPUP_CANDLES:
+            print(f"[Cache] {symbol} {interval}: thiếu {missing} nến, tải lại toàn bộ.")
+            return None
+        new_rows = await self.fetcher(symbol, interval, limit=MAX_TOPUP_CANDLES, start_time=last_ts)
+        if len(new_rows) == 0 or int(new_rows['timestamp'][0]) != last_ts:
+            print(f"[Cache] {symbol} {interval}: dữ liệu mới không nối liền cache, tải lại toàn bộ.")
+            return None
+        merged = np.concatenate([cached[:-1], new_rows])
+        if (np.diff(merged['timestamp']) != interval_ms).any():
+            print(f"[Cache] {symbol} {interval}: phát hiện khoảng trống nến, tải lại toàn bộ.")
+            return None
+        return merged
+
+    def append_closed(self, symbol, interval, row):
+        """
+        Ghi một nến đã đóng (ví dụ từ WebSocket) vào cache, giữ nguyên kích thước bộ đệm.
+        Trả về False nếu nến không nối liền với cache (khi đó cache của key bị xóa để tải lại).
+        """
+        key = (symbol, interval)
+        cached = self._frames.get(key)
+        if cached is None:
+            return False
+        last_ts = int(cached['timestamp'][-1])
+        if row['timestamp'] == last_ts:
+            base = cached[:-1]
+        elif row['timestamp'] == last_ts + interval_to_milliseconds(interval):
+            # Bộ đệm chưa đủ `limit` nến (mã mới niêm yết) thì lớn thêm thay vì trượt
+            base = cached[1:] if len(cached) >= self._limits.get(key, 0) else cached
+        else:
+            self._forget(key)
+            return False
+        merged = np.concatenate([base, kline_row(row)])
+        merged.flags.writeable = False
+        self._frames[key] = merged
+        return True
+
+    def with_open(self, symbol, interval, row):
+        """
+        Nến đã đóng trong cache cộng nến đang chạy `row` ở cuối (không ghi vào cache), cùng số nến như get():
+        giống dữ liệu REST của chế độ poll, nơi nến cuối luôn là nến đang chạy.
+        Trả về None nếu `row` không phải nến ngay sau nến cuối trong cache.
+        """
+        key = (symbol, interval)
+        cached = self._frames.get(key)
+        if cached is None or row['timestamp'] != int(cached['timestamp'][-1]) + interval_to_milliseconds(interval):
+            return None
+        base = cached[1:] if len(cached) >= self._limits.get(key, 0) else cached
+        merged = np.concatenate([base, kline_row(row)])
+        merged.flags.writeable = False
+        return merged
+
+    def snapshot(self, symbol, interval):
+        """Mảng nến (chỉ đọc) đang cache, hoặc None nếu chưa có."""
+        return self._frames.get((symbol, interval))
+
+    def prune(self, symbols):
+        """Bỏ cache của các mã không còn trong watchlist."""
+        keep = set(symbols)
+        for key in [k for k in self._frames if k[0] not in keep]:
+            self._forget(key)
+
+    def _forget(self, key):
+        self._frames.pop(key, None)
+        self._limits.pop(key, None)
+        self._full_history.discard(key)
+
+    def clear(self):
+        self._frames.clear()
+        self._limits.clear()
+        self._full_history.clear()
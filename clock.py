@@ -0,0 +1,105 @@
+# clock.py
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime
+import pytz
+
+
+class SystemClock:
+    """Đồng hồ thật (mặc định khi chạy bot)."""
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class ReplayClock:
+    """
+    Đồng hồ ảo cho replay, chạy theo sự kiện rời rạc: bắt đầu tại `start` (epoch giây) và đứng yên cho đến khi
+    replay gọi advance(), khi đó nhảy thẳng tới lúc đánh thức sớm nhất của các clock.sleep đang chờ.
+    Thời gian xử lý thật không làm đồng hồ chạy nên một chu kỳ quét chậm không làm lỡ nến và kết quả
+    không phụ thuộc tải của máy. `speed` (giây ảo mỗi giây thật) chỉ giới hạn tốc độ tối đa, 0 là không giới hạn.
+    """
+    def __init__(self, start, speed=0):
+        self._now = start
+        self.speed = speed
+        self._waiters = []  # heap (thời điểm đánh thức, thứ tự, future, task đang chờ)
+        self._order = itertools.count()
+
+    def time(self):
+        return self._now
+
+    def monotonic(self):
+        return self._now
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (self._now + max(0.0, seconds), next(self._order), future, asyncio.current_task()))
+        await future
+
+    def _pending(self):
+        # Bỏ các lượt chờ đã bị hủy (task bị cancel trong lúc sleep)
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        return self._waiters
+
+    def sleeping(self, task):
+        """True nếu `task` đang chờ trong clock.sleep."""
+        return any(waiter[3] is task and not waiter[2].done() for waiter in self._waiters)
+
+    def next_wakeup(self):
+        """Thời điểm đánh thức sớm nhất (epoch giây), None nếu không có task nào đang chờ."""
+        waiters = self._pending()
+        return waiters[0][0] if waiters else None
+
+    async def advance(self):
+        """Nhảy tới lúc đánh thức sớm nhất và đánh thức mọi task đến hạn; False nếu không có task nào đang chờ."""
+        wakeup = self.next_wakeup()
+        if wakeup is None:
+            return False
+        if self.speed:
+            await asyncio.sleep((wakeup - self._now) / self.speed)
+            # Trong lúc chờ thật, task khác có thể đã bắt đầu một lượt chờ ngắn hơn
+            wakeup = self.next_wakeup()
+            if wakeup is None:
+                return False
+        self._now = max(self._now, wakeup)
+        while self._pending() and self._waiters[0][0] <= self._now:
+            heapq.heappop(self._waiters)[2].set_result(None)
+        return True
+
+
+class Clock:
+    """
+    Đồng hồ dùng chung cho bộ quét live (lịch quét, cache nến, chống trùng, hàng đợi Telegram).
+    Các module gọi qua đối tượng này để replay có thể thay bằng ReplayClock (install) mà không đổi code.
+    """
+    def __init__(self, source=None):
+        self.source = source or SystemClock()
+
+    def install(self, source):
+        self.source = source
+
+    def reset(self):
+        self.source = SystemClock()
+
+    def time(self):
+        return self.source.time()
+
+    def now(self):
+        return datetime.fromtimestamp(self.source.time(), tz=pytz.utc)
+
+    def monotonic(self):
+        return self.source.monotonic()
+
+    async def sleep(self, seconds):
+        await self.source.sleep(seconds)
+
+
+clock = Clock()
@@ -13,11 +13,39 @@ CHANNEL_ID = os.getenv("CHANNEL_ID")
 # Lấy URL của database từ biến môi trường
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Chế độ quét: "poll" (REST theo lịch 15 phút) hoặc "stream" (WebSocket kline)
+SCAN_MODE = os.getenv("SCAN_MODE", "poll")
+# Các cặp "khung tín hiệu:khung lọc Stoch", ví dụ "15m:1h,1h:4h" (khung nhỏ nhất phải đủ nến cho mọi khung tín hiệu, xem timeframes.parse_pipelines)
+SIGNAL_TIMEFRAMES = os.getenv("SIGNAL_TIMEFRAMES", "15m:1h")
+# Danh sách mã cần quét: "watchlist" (các mã thêm bằng /add) hoặc "market" (mọi hợp đồng USDT-M, chỉ ở chế độ poll)
+SCAN_UNIVERSE = os.getenv("SCAN_UNIVERSE", "watchlist")
+# Chế độ "market": bỏ qua các mã có khối lượng 24h (USDT) thấp hơn ngưỡng này
+UNIVERSE_MIN_QUOTE_VOLUME = float(os.getenv("UNIVERSE_MIN_QUOTE_VOLUME", "10000000"))
+# Vai trò tiến trình: "all" (bot + bộ quét trong một tiến trình), "bot" (chỉ Telegram, gửi tín hiệu
+# từ signal_outbox) hoặc "worker" (chỉ quét các shard giành được, xem worker.py)
+SCAN_ROLE = os.getenv("SCAN_ROLE", "all")
+# Số shard chia watchlist giữa các worker; mọi worker phải dùng cùng một giá trị
+SCAN_SHARDS = int(os.getenv("SCAN_SHARDS", "16"))
+# URL combined stream của Binance Futures (đổi sang server giả lập khi test)
+BINANCE_STREAM_URL = os.getenv("BINANCE_STREAM_URL", "wss://fstream.binance.com/stream")
+# Cách tính delta cho CVD: "shape" (ước lượng từ hình dạng nến) hoặc "taker" (taker buy volume của Binance)
+CVD_DELTA_METHOD = os.getenv("CVD_DELTA_METHOD", "shape")
+# Backend tính chỉ báo: "numpy" (mặc định) hoặc "numba" (kernel biên dịch, cần pip install numba; thiếu thì dùng numpy)
+INDICATOR_BACKEND = os.getenv("INDICATOR_BACKEND", "numpy")
+# Tỷ lệ win hiển thị trong tin nhắn: "fixed" (60% / 80% cố định) hoặc "backtest" (đo bằng backtest watchlist khi bộ quét khởi động)
+WIN_RATE_SOURCE = os.getenv("WIN_RATE_SOURCE", "fixed")
+# Endpoint /metrics (Prometheus) chỉ lắng nghe local; METRICS_PORT=0 để tắt
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+# Thư mục lưu dữ liệu nến lịch sử cho backtest
+KLINE_STORE_DIR = os.getenv("KLINE_STORE_DIR", "data/klines")
+
 # --- KIỂM TRA BIẾN MÔI TRƯỜNG MỘT CÁCH CHI TIẾT ---
 missing_vars = []
-if not TELEGRAM_TOKEN:
+# Worker quét không gửi Telegram nên không cần token / channel
+if not TELEGRAM_TOKEN and SCAN_ROLE != "worker":
     missing_vars.append("TELEGRAM_TOKEN")
-if not CHANNEL_ID:
+if not CHANNEL_ID and SCAN_ROLE != "worker":
     missing_vars.append("CHANNEL_ID")
 if not DATABASE_URL:
     missing_vars.append("DATABASE_URL")
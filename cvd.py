@@ -0,0 +1,40 @@
+# cvd.py
+import numpy as np
+from signal_engine import compute_delta
+
+# --- CÁCH TÍNH DELTA KHỐI LƯỢNG ---
+# 'shape': ước lượng từ hình dạng nến (công thức gốc), 'taker': delta thực từ khối lượng taker mua
+DELTA_METHODS = ('shape', 'taker')
+TAKER_BUY_COLUMN = 'taker_buy_base_asset_volume'
+
+
+def check_delta_method(method):
+    if method not in DELTA_METHODS:
+        raise ValueError(f"Cách tính delta không hợp lệ: {method} (chọn một trong {', '.join(DELTA_METHODS)})")
+    return method
+
+def shape_delta(high, low, close, volume):
+    """volume * (2*close - low - high) / (high - low): đoán áp lực mua/bán từ vị trí giá đóng cửa."""
+    return compute_delta(high, low, close, volume)
+
+def taker_delta(volume, taker_buy):
+    """Khối lượng mua chủ động - bán chủ động = taker_buy - (volume - taker_buy)."""
+    return 2 * np.asarray(taker_buy, dtype=float) - np.asarray(volume, dtype=float)
+
+def delta_for(method, high, low, close, volume, taker_buy=None):
+    """Tính delta theo `method` trên các mảng (có thể chỉ là phần nến mới khi cập nhật tăng dần)."""
+    if method == 'taker':
+        if taker_buy is None:
+            raise ValueError(f"Delta 'taker' cần cột {TAKER_BUY_COLUMN}")
+        return taker_delta(volume, taker_buy)
+    return shape_delta(high, low, close, volume)
+
+def taker_buy_of(data, method):
+    """Cột taker buy (mảng float) của DataFrame / structured array / dict mảng, chỉ khi method cần."""
+    if method != 'taker':
+        return None
+    return np.asarray(data[TAKER_BUY_COLUMN], dtype=float)
+
+def frame_delta(data, method):
+    """Delta cho toàn bộ nến của DataFrame / structured array / dict mảng."""
+    return delta_for(method, data['high'], data['low'], data['close'], data['volume'], taker_buy_of(data, method))
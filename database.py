@@ -1,4 +1,5 @@
 # database.py
+import json
 import asyncpg
 from config import DATABASE_URL
 import asyncio
@@ -29,7 +30,38 @@ async def init_db():
                     symbol TEXT UNIQUE NOT NULL
                 );
             ''')
-        print("Database pool initialized, 'watchlist' table is ready.")
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS signals (
+                    id BIGSERIAL PRIMARY KEY,
+                    symbol TEXT NOT NULL,
+                    timeframe TEXT NOT NULL,
+                    pivot_timestamp BIGINT NOT NULL,
+                    confirmation_timestamp BIGINT NOT NULL,
+                    signal_type TEXT NOT NULL,
+                    price DOUBLE PRECISION,
+                    confirmation_price DOUBLE PRECISION,
+                    stoch_m15 DOUBLE PRECISION,
+                    stoch_h1 DOUBLE PRECISION,
+                    tier TEXT,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    UNIQUE (symbol, pivot_timestamp, timeframe)
+                );
+            ''')
+            # Hàng đợi tín hiệu từ các worker quét (SCAN_ROLE=worker) đến tiến trình bot gửi Telegram
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS signal_outbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    payload JSONB NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+            ''')
+            # Tín hiệu được đánh dấu đang gửi (claimed_at), chỉ xóa sau khi Telegram nhận; bảng cũ được bổ sung cột
+            await conn.execute('''
+                ALTER TABLE signal_outbox
+                    ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMPTZ,
+                    ADD COLUMN IF NOT EXISTS attempts INT NOT NULL DEFAULT 0;
+            ''')
+        print("Database pool initialized, 'watchlist', 'signals' and 'signal_outbox' tables are ready.")
     except Exception as e:
         print(f"FATAL: Could not connect to the database: {e}")
         # Dừng chương trình nếu không kết nối được DB
@@ -61,4 +93,78 @@ async def add_symbols_to_db(symbols: list):
 async def remove_symbols_from_db(symbols: list):
     """Xóa một hoặc nhiều mã coin khỏi database bằng cách sử dụng pool."""
     async with db_pool.acquire() as conn:
-        await conn.executemany('DELETE FROM watchlist WHERE symbol = $1;', [(s,) for s in symbols])
\ No newline at end of file
+        await conn.executemany('DELETE FROM watchlist WHERE symbol = $1;', [(s,) for s in symbols])
+
+async def get_recent_signal_keys(since_timestamp: int):
+    """Lấy khóa (symbol, pivot_timestamp, timeframe) của các tín hiệu có pivot từ since_timestamp (ms)."""
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch(
+            'SELECT symbol, pivot_timestamp, timeframe FROM signals WHERE pivot_timestamp >= $1;',
+            since_timestamp
+        )
+        return [(row['symbol'], row['pivot_timestamp'], row['timeframe']) for row in rows]
+
+def _json_default(value):
+    # Giá trị numpy (np.int64, np.float64...) trong tín hiệu
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Không chuyển được {type(value).__name__} sang JSON")
+
+async def insert_signals(signals: list, outbox: bool = False):
+    """
+    Ghi một lô tín hiệu trong một câu lệnh, bỏ qua tín hiệu đã có (trùng symbol/pivot/timeframe).
+    outbox=True: trong cùng transaction, đưa các tín hiệu mới (chưa có trong bảng) vào signal_outbox
+    để tiến trình bot gửi đi; bảng signals vì vậy là nơi chống trùng chung cho mọi worker.
+    Trả về số tín hiệu mới được ghi.
+    """
+    if not signals:
+        return 0
+    columns = list(zip(*[(
+        s['symbol'], s['timeframe'], int(s['timestamp']), int(s['confirmation_timestamp']), s['type'],
+        float(s['price']), float(s['confirmation_price']),
+        float(s.get('stoch_m15', 0.0)), float(s.get('stoch_h1', 0.0)), s.get('tier')
+    ) for s in signals]))
+    async with db_pool.acquire() as conn:
+        async with conn.transaction():
+            rows = await conn.fetch('''
+                INSERT INTO signals (symbol, timeframe, pivot_timestamp, confirmation_timestamp, signal_type,
+                                     price, confirmation_price, stoch_m15, stoch_h1, tier)
+                SELECT * FROM unnest($1::text[], $2::text[], $3::bigint[], $4::bigint[], $5::text[],
+                                     $6::float8[], $7::float8[], $8::float8[], $9::float8[], $10::text[])
+                ON CONFLICT (symbol, pivot_timestamp, timeframe) DO NOTHING
+                RETURNING symbol, pivot_timestamp, timeframe;
+            ''', *[list(c) for c in columns])
+            if outbox and rows:
+                new_keys = {(row['symbol'], row['pivot_timestamp'], row['timeframe']) for row in rows}
+                payloads = []
+                for s in signals:
+                    key = (s['symbol'], int(s['timestamp']), s['timeframe'])
+                    if key in new_keys:
+                        new_keys.discard(key)
+                        payloads.append((json.dumps(dict(s), default=_json_default),))
+                await conn.executemany('INSERT INTO signal_outbox (payload) VALUES ($1::jsonb);', payloads)
+        return len(rows)
+
+async def claim_outbox_signals(limit: int, claim_timeout: int, max_attempts: int):
+    """
+    Đánh dấu đang gửi tối đa `limit` tín hiệu cũ nhất trong signal_outbox và trả về [(id, tín hiệu)] theo thứ tự ghi.
+    Hàng chưa ai nhận, hoặc đã nhận quá `claim_timeout` giây mà chưa xóa (tiến trình gửi chết giữa chừng),
+    được nhận lại; hàng đã nhận `max_attempts` lần được giữ lại trong bảng để kiểm tra, không gửi nữa.
+    """
+    async with db_pool.acquire() as conn:
+        rows = await conn.fetch('''
+            UPDATE signal_outbox SET claimed_at = NOW(), attempts = attempts + 1 WHERE id IN (
+                SELECT id FROM signal_outbox
+                WHERE (claimed_at IS NULL OR claimed_at < NOW() - make_interval(secs => $2)) AND attempts < $3
+                ORDER BY id LIMIT $1 FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, payload;
+        ''', limit, claim_timeout, max_attempts)
+        return [(row['id'], json.loads(row['payload'])) for row in sorted(rows, key=lambda row: row['id'])]
+
+async def complete_outbox_signals(ids: list):
+    """Xóa các tín hiệu đã gửi thành công khỏi signal_outbox."""
+    if not ids:
+        return
+    async with db_pool.acquire() as conn:
+        await conn.execute('DELETE FROM signal_outbox WHERE id = ANY($1::bigint[]);', ids)
@@ -0,0 +1,60 @@
+# fake_kline_server.py
+"""
+Server WebSocket giả lập combined stream kline của Binance, dùng để test chế độ stream.
+Phát lại các message kline đã ghi trong một file JSON lines (mỗi dòng là một message
+dạng {"stream": ..., "data": {...}}), chỉ gửi các stream mà client đăng ký.
+
+    python fake_kline_server.py recorded_klines.jsonl --port 8765 --speed 100
+    SCAN_MODE=stream BINANCE_STREAM_URL=ws://localhost:8765/stream python main.py
+"""
+import argparse
+import asyncio
+import json
+from urllib.parse import urlparse, parse_qs
+import websockets
+
+
+def load_messages(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def event_time(message):
+    data = message.get('data', message)
+    return data.get('E', data['k']['T'])
+
+async def replay(ws, messages, streams, speed):
+    previous = None
+    for message in messages:
+        if streams and message.get('stream') not in streams:
+            continue
+        current = event_time(message)
+        if previous is not None and speed > 0:
+            await asyncio.sleep(max(0, current - previous) / 1000 / speed)
+        previous = current
+        await ws.send(json.dumps(message))
+    # Giữ kết nối mở như server thật sau khi phát hết dữ liệu
+    await ws.wait_closed()
+
+def make_handler(messages, speed):
+    async def handler(ws, path=None):
+        # websockets cũ truyền path/ws.path, bản mới dùng ws.request.path
+        path = path or getattr(ws, 'path', None) or ws.request.path
+        streams = set(parse_qs(urlparse(path).query).get('streams', [''])[0].split('/')) - {''}
+        print(f"Client đăng ký {len(streams)} stream.")
+        await replay(ws, messages, streams, speed)
+    return handler
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fake Binance kline WebSocket server")
+    parser.add_argument('recording', help="File JSON lines chứa các message kline đã ghi")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--speed', type=float, default=0, help="Hệ số tăng tốc theo thời gian sự kiện (0 = gửi ngay)")
+    args = parser.parse_args()
+    messages = load_messages(args.recording)
+    async with websockets.serve(make_handler(messages, args.speed), args.host, args.port):
+        print(f"Fake kline server chạy tại ws://{args.host}:{args.port}/stream ({len(messages)} message)")
+        await asyncio.Future()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,242 @@
+# indicators.py
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+from numpy.lib.stride_tricks import sliding_window_view
+from cvd import delta_for, taker_buy_of
+import kernels
+
+# --- CẤU HÌNH ---
+VERIFY_TAIL = 200        # Số nến cuối dùng để đối chiếu với pandas_ta
+VERIFY_RTOL = 1e-6
+VERIFY_ATOL = 1e-8
+BUFFER_GROWTH = 2        # Bộ đệm chỉ báo chứa gấp đôi số nến để nối nến mới tại chỗ, chỉ cấp phát lại khi đầy
+SERIES = ('delta', 'cvd', 'ema50', 'stoch_raw', 'stoch_k')
+
+
+# --- CÔNG THỨC ĐẦY ĐỦ (TƯƠNG ĐƯƠNG pandas_ta) ---
+def ema(values, length):
+    """EMA giống ta.ema: giá trị đầu tiên là SMA của `length` nến, sau đó ewm(adjust=False)."""
+    if kernels.active():
+        return kernels.ema(values, length)
+    values = np.asarray(values, dtype=float).copy()
+    if len(values) < length:
+        return np.full(len(values), np.nan)
+    values[length - 1] = values[:length].mean()
+    values[:length - 1] = np.nan
+    return pd.Series(values).ewm(span=length, adjust=False).mean().to_numpy()
+
+def stoch_raw(high, low, close, k):
+    """%K thô (trước khi làm mượt) = 100 * (close - LL) / (HH - LL) trên cửa sổ k nến."""
+    raw = np.full(len(close), np.nan)
+    if len(close) < k:
+        return raw
+    lowest_low = sliding_window_view(low, k).min(axis=1)
+    highest_high = sliding_window_view(high, k).max(axis=1)
+    price_range = highest_high - lowest_low
+    price_range[price_range == 0] = np.finfo(float).eps
+    raw[k - 1:] = 100 * (close[k - 1:] - lowest_low) / price_range
+    return raw
+
+def sma(values, length):
+    out = np.full(len(values), np.nan)
+    if len(values) >= length:
+        out[length - 1:] = sliding_window_view(values, length).mean(axis=1)
+    return out
+
+def stoch(high, low, close, k, smooth_k):
+    """Trả về (%K thô, %K làm mượt bằng SMA smooth_k nến) như ta.stoch."""
+    if kernels.active():
+        return kernels.stoch(high, low, close, k, smooth_k)
+    raw = stoch_raw(np.asarray(high, dtype=float), np.asarray(low, dtype=float), np.asarray(close, dtype=float), k)
+    smoothed = np.full(len(raw), np.nan)
+    if len(raw) > k - 1:
+        smoothed[k - 1:] = sma(raw[k - 1:], smooth_k)
+    return raw, smoothed
+
+
+# --- TRẠNG THÁI CHỈ BÁO TĂNG DẦN THEO TỪNG MÃ / KHUNG ---
+class IndicatorState:
+    """
+    Giữ delta/CVD/EMA50/Stoch %K của một (symbol, interval) giữa các chu kỳ quét.
+    Mỗi lần update chỉ tính lại các nến kể từ nến đã đóng cuối cùng (mỗi nến mới O(stoch_k) vì phải quét lại
+    cửa sổ high/low của Stoch), nến cuối cùng luôn được tính tạm vì có thể vẫn đang chạy.
+    Nếu dữ liệu không nối liền với trạng thái cũ, hoặc phần trùng quá ngắn để các chỉ báo đã ổn định, thì tính lại toàn bộ.
+    Các nến đầu khung (chưa đủ nến khởi động) là NaN giống như khi tính lại toàn bộ.
+    delta_method: 'shape' hoặc 'taker' (xem cvd.py); delta chỉ phụ thuộc từng nến nên cập nhật tăng dần như nhau.
+    Các chuỗi nằm trong bộ đệm cấp phát trước (BUFFER_GROWTH lần số nến): nến mới được ghi nối tiếp tại chỗ,
+    nến bị cắt ở đầu chỉ dịch vị trí bắt đầu. Mảng trả về là view vào bộ đệm; nến cuối (đang chạy) của view
+    cũ bị ghi đè ở lần update sau, nên chỉ dùng kết quả trong chu kỳ quét hiện tại.
+    """
+    def __init__(self, cvd_period, ema_period, stoch_k, stoch_smooth_k, delta_method='shape'):
+        self.cvd_period = cvd_period
+        self.delta_method = delta_method
+        self.ema_period = ema_period
+        self.stoch_k = stoch_k
+        self.stoch_smooth_k = stoch_smooth_k
+        # Số nến khởi động của từng chuỗi (giá trị trước đó là NaN), giống _full
+        self._warmup = {
+            'cvd': cvd_period - 1,
+            'ema50': ema_period - 1,
+            'stoch_raw': stoch_k - 1,
+            'stoch_k': stoch_k + stoch_smooth_k - 2,
+        }
+        self.arrays = None
+        self._buffers = None
+        self._start = self._end = 0
+
+    def update(self, df, verify=False):
+        """df: DataFrame hoặc structured array (kline_parser) có các cột OHLCV."""
+        timestamp = np.asarray(df['timestamp'])
+        high = np.asarray(df['high'], dtype=float)
+        low = np.asarray(df['low'], dtype=float)
+        close = np.asarray(df['close'], dtype=float)
+        volume = np.asarray(df['volume'], dtype=float)
+        taker_buy = taker_buy_of(df, self.delta_method)
+        arrays = self._incremental(timestamp, high, low, close, volume, taker_buy)
+        if arrays is None:
+            arrays = self._store(self._full(timestamp, high, low, close, volume, taker_buy))
+        if verify:
+            verified = self._verify(df, arrays)
+            if verified is not arrays:
+                arrays = self._store(verified)
+        self.arrays = arrays
+        return arrays
+
+    def _full(self, timestamp, high, low, close, volume, taker_buy):
+        delta = delta_for(self.delta_method, high, low, close, volume, taker_buy)
+        raw, stoch_k = stoch(high, low, close, self.stoch_k, self.stoch_smooth_k)
+        return {
+            'timestamp': timestamp,
+            'delta': delta,
+            'cvd': ema(delta, self.cvd_period),
+            'ema50': ema(close, self.ema_period),
+            'stoch_raw': raw,
+            'stoch_k': stoch_k,
+        }
+
+    def _store(self, arrays):
+        """Chép các chuỗi vào bộ đệm mới và trả về các view."""
+        size = len(arrays['timestamp'])
+        self._buffers = {name: self._allocate(size) for name in SERIES}
+        for name in SERIES:
+            self._buffers[name][:size] = arrays[name]
+        self._start, self._end = 0, size
+        return self._views(arrays['timestamp'])
+
+    def _allocate(self, size):
+        return np.empty(max(BUFFER_GROWTH * size, size + 1))
+
+    def _views(self, timestamp):
+        arrays = {'timestamp': timestamp}
+        for name in SERIES:
+            arrays[name] = self._buffers[name][self._start:self._end]
+        return arrays
+
+    def _incremental(self, timestamp, high, low, close, volume, taker_buy):
+        prev = self.arrays
+        if prev is None or len(prev['timestamp']) < 2 or len(timestamp) < self.stoch_k + self.stoch_smooth_k:
+            return None
+        # Nến đã đóng cuối cùng của trạng thái cũ phải có trong dữ liệu mới
+        last_closed_ts = prev['timestamp'][-2]
+        pos = int(np.searchsorted(timestamp, last_closed_ts))
+        if pos >= len(timestamp) or timestamp[pos] != last_closed_ts:
+            return None
+        # Nến đã đóng cuối cùng phải nằm sau phần khởi động của khung mới, nếu không cửa sổ Stoch của các nến mới
+        # (và giá trị tương ứng của _full) chưa đầy đủ
+        if pos < max(self._warmup.values()):
+            return None
+        # Chỉ cắt bớt phía đầu: nến đầu của dữ liệu mới phải là nến tương ứng trong trạng thái cũ. Nến liền mạch
+        # (candle_cache kiểm tra khoảng trống) nên khớp hai đầu là khớp cả đoạn, không cần so từng nến.
+        offset = len(prev['timestamp']) - 2 - pos
+        if offset < 0 or prev['timestamp'][offset] != timestamp[0]:
+            return None
+        closed_end = self._end - 1  # Vị trí trong bộ đệm ngay sau nến đã đóng cuối cùng
+        buffers = self._buffers
+        last_cvd, last_ema = buffers['cvd'][closed_end - 1], buffers['ema50'][closed_end - 1]
+        if np.isnan(last_cvd) or np.isnan(last_ema) or np.isnan(buffers['stoch_k'][closed_end - 1]):
+            return None
+
+        new_count = len(timestamp) - pos - 1
+        start = self._start + offset
+        if closed_end + new_count > len(buffers['cvd']):
+            # Hết chỗ: chuyển phần còn giữ sang bộ đệm mới (view của chu kỳ trước vẫn trỏ vào bộ đệm cũ)
+            kept = closed_end - start
+            fresh = {name: self._allocate(len(timestamp)) for name in SERIES}
+            for name in SERIES:
+                fresh[name][:kept] = buffers[name][start:closed_end]
+            buffers = self._buffers = fresh
+            start, closed_end = 0, kept
+
+        new = slice(pos + 1, None)
+        written = slice(closed_end, closed_end + new_count)
+        buffers['delta'][written] = delta = delta_for(self.delta_method, high[new], low[new], close[new], volume[new],
+                                                      None if taker_buy is None else taker_buy[new])
+        cvd, ema50 = buffers['cvd'][written], buffers['ema50'][written]
+        stoch_raw_new, stoch_new = buffers['stoch_raw'][written], buffers['stoch_k'][written]
+        raw_window = list(buffers['stoch_raw'][closed_end - self.stoch_smooth_k + 1:closed_end])
+        cvd_alpha, ema_alpha = 2 / (self.cvd_period + 1), 2 / (self.ema_period + 1)
+        prev_cvd, prev_ema = last_cvd, last_ema
+        for j in range(new_count):
+            i = pos + 1 + j
+            prev_cvd = cvd_alpha * delta[j] + (1 - cvd_alpha) * prev_cvd
+            prev_ema = ema_alpha * close[i] + (1 - ema_alpha) * prev_ema
+            cvd[j], ema50[j] = prev_cvd, prev_ema
+            lowest_low = low[i - self.stoch_k + 1:i + 1].min()
+            highest_high = high[i - self.stoch_k + 1:i + 1].max()
+            price_range = (highest_high - lowest_low) or np.finfo(float).eps
+            raw = 100 * (close[i] - lowest_low) / price_range
+            raw_window.append(raw)
+            stoch_raw_new[j] = raw
+            stoch_new[j] = sum(raw_window[-self.stoch_smooth_k:]) / self.stoch_smooth_k
+
+        if offset:
+            # Khung bị cắt ở đầu: các nến khởi động của khung mới là NaN như khi tính lại toàn bộ
+            for name, warmup in self._warmup.items():
+                buffers[name][start:start + warmup] = np.nan
+        self._start, self._end = start, closed_end + new_count
+        return self._views(timestamp)
+
+    def _verify(self, df, arrays):
+        """Đối chiếu phần cuối các mảng với pandas_ta tính lại toàn bộ; lệch thì dùng giá trị tham chiếu."""
+        reference = reference_indicators(df, self.cvd_period, self.ema_period, self.stoch_k, self.stoch_smooth_k, self.delta_method)
+        tail = slice(-VERIFY_TAIL, None)
+        for name, expected in reference.items():
+            if not np.allclose(arrays[name][tail], expected[tail], rtol=VERIFY_RTOL, atol=VERIFY_ATOL, equal_nan=True):
+                print(f"[Indicators] Lệch giá trị '{name}' so với pandas_ta, dùng kết quả tính lại toàn bộ.")
+                return {**arrays, **reference, 'stoch_raw': arrays['stoch_raw']}
+        return arrays
+
+
+def reference_indicators(df, cvd_period, ema_period, stoch_k, stoch_smooth_k, delta_method='shape'):
+    """Tính lại toàn bộ bằng pandas_ta (giống logic cũ) để kiểm tra trạng thái tăng dần."""
+    delta = pd.Series(delta_for(delta_method, df['high'], df['low'], df['close'], df['volume'], taker_buy_of(df, delta_method)))
+    close = pd.Series(np.asarray(df['close'], dtype=float))
+    stoch = pd.DataFrame({
+        'high': np.asarray(df['high'], dtype=float),
+        'low': np.asarray(df['low'], dtype=float),
+        'close': close.to_numpy(),
+    }).ta.stoch(k=stoch_k, smooth_k=stoch_smooth_k)
+    return {
+        'cvd': ta.ema(delta, length=cvd_period).to_numpy(dtype=float),
+        'ema50': ta.ema(close, length=ema_period).to_numpy(dtype=float),
+        'stoch_k': stoch.iloc[:, 0].to_numpy(dtype=float),
+    }
+
+
+class IndicatorStore:
+    """Quản lý IndicatorState cho từng (symbol, interval)."""
+    def __init__(self, **params):
+        self.params = params
+        self._states = {}
+
+    def update(self, symbol, interval, df, verify=False):
+        key = (symbol, interval)
+        if key not in self._states:
+            self._states[key] = IndicatorState(**self.params)
+        return self._states[key].update(df, verify=verify)
+
+    def prune(self, symbols):
+        keep = set(symbols)
+        for key in [k for k in self._states if k[0] not in keep]:
+            del self._states[key]
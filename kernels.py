@@ -0,0 +1,151 @@
+# kernels.py
+import numpy as np
+try:
+    import numba
+except ImportError:  # numba là tùy chọn, thiếu thì dùng bản NumPy
+    numba = None
+
+# --- BACKEND TÍNH CHỈ BÁO ---
+# 'numpy': các hàm vector hóa trong indicators.py / signal_engine.py (mặc định)
+# 'numba': các vòng lặp dưới đây được biên dịch bằng numba.njit, mỗi kernel đi một lượt trên mảng liền bộ nhớ
+BACKENDS = ('numpy', 'numba')
+EPS = np.finfo(float).eps
+WARMUP_CANDLES = 64  # Số nến giả dùng để biên dịch trước các kernel khi bật backend
+
+
+# --- VÒNG LẶP KERNEL (PYTHON THUẦN, NUMBA BIÊN DỊCH ĐƯỢC) ---
+def _ema_loop(values, length, seed):
+    """
+    EMA giống ta.ema: nến thứ `length` là `seed` (SMA của `length` nến đầu), sau đó ewm(adjust=False).
+    Giữ nguyên thứ tự phép tính và cách bỏ qua NaN của pandas để kết quả khớp từng bit.
+    """
+    size = len(values)
+    out = np.empty(size)
+    out[:length - 1] = np.nan
+    alpha = 1.0 / (1.0 + (length - 1) / 2.0)
+    old_wt_factor = 1.0 - alpha
+    weighted = seed
+    old_wt = 1.0
+    out[length - 1] = weighted
+    for i in range(length, size):
+        cur = values[i]
+        is_observation = cur == cur
+        if weighted == weighted:
+            old_wt *= old_wt_factor
+            if is_observation:
+                if weighted != cur:
+                    weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                old_wt = 1.0
+        elif is_observation:
+            weighted = cur
+        out[i] = weighted
+    return out
+
+def _stoch_loop(high, low, close, k, smooth_k):
+    """%K thô trên cửa sổ k nến và %K làm mượt (SMA smooth_k nến) trong cùng một lượt."""
+    size = len(close)
+    raw = np.full(size, np.nan)
+    stoch = np.full(size, np.nan)
+    for i in range(k - 1, size):
+        lowest_low, highest_high = low[i], high[i]
+        for j in range(i - k + 1, i):
+            if low[j] < lowest_low: lowest_low = low[j]
+            if high[j] > highest_high: highest_high = high[j]
+        price_range = highest_high - lowest_low
+        if price_range == 0: price_range = EPS
+        raw[i] = 100 * (close[i] - lowest_low) / price_range
+        if i >= k + smooth_k - 2:
+            total = 0.0
+            for j in range(i - smooth_k + 1, i + 1):
+                total += raw[j]
+            stoch[i] = total / smooth_k
+    return raw, stoch
+
+def _shape_delta_loop(high, low, close, volume):
+    """volume * (2*close - low - high) / (high - low), nến không có biên độ (hoặc NaN) cho 0."""
+    size = len(close)
+    delta = np.zeros(size)
+    for i in range(size):
+        price_range = high[i] - low[i]
+        if price_range > 0:
+            value = volume[i] * (2 * close[i] - low[i] - high[i]) / price_range
+            if value == value:
+                delta[i] = value
+    return delta
+
+def _pivot_loop(high, low, n):
+    """Đỉnh / đáy fractal trên cửa sổ tâm 2n+1 nến, chỉ xét các nến trong [n, len - n)."""
+    size = len(high)
+    pivot_high = np.zeros(size, dtype=np.bool_)
+    pivot_low = np.zeros(size, dtype=np.bool_)
+    for i in range(n, size - n):
+        is_high, is_low = True, True
+        for j in range(i - n, i + n + 1):
+            if high[j] > high[i]: is_high = False
+            if low[j] < low[i]: is_low = False
+        pivot_high[i], pivot_low[i] = is_high, is_low
+    return pivot_high, pivot_low
+
+_LOOPS = {'ema': _ema_loop, 'stoch': _stoch_loop, 'shape_delta': _shape_delta_loop, 'pivots': _pivot_loop}
+
+
+# --- CHỌN BACKEND ---
+backend = 'numpy'
+_compiled = None
+
+def set_backend(name):
+    """
+    Chọn backend cho indicators.py / signal_engine.py / cvd.py, trả về backend thực sự dùng.
+    'numba' khi chưa cài numba thì báo và dùng 'numpy'. Các kernel được biên dịch (cache=True nên
+    các lần chạy sau đọc lại từ __pycache__) và chạy thử ngay tại đây để chu kỳ quét đầu tiên không phải chờ JIT.
+    """
+    global backend, _compiled
+    if name not in BACKENDS:
+        raise ValueError(f"Backend chỉ báo không hợp lệ: {name} (chọn một trong {', '.join(BACKENDS)})")
+    if name == 'numba' and numba is None:
+        print("[Kernels] Chưa cài numba (pip install numba), dùng backend 'numpy'.")
+        name = 'numpy'
+    if name == 'numba':
+        _compiled = {key: numba.njit(cache=True, nogil=True)(loop) for key, loop in _LOOPS.items()}
+        _warmup()
+    else:
+        _compiled = None
+    backend = name
+    return name
+
+def active():
+    """True nếu đang dùng kernel biên dịch (backend 'numba')."""
+    return _compiled is not None
+
+def _warmup():
+    """Numba biên dịch riêng cho mảng chỉ đọc (candle_cache, cột DataFrame copy-on-write) và mảng ghi được."""
+    prices = 100 + np.cumsum(np.sin(np.arange(WARMUP_CANDLES, dtype=float)))
+    for writeable in (True, False):
+        high, low, close, volume = prices + 1, prices - 1, prices.copy(), np.ones(WARMUP_CANDLES)
+        for values in (high, low, close, volume):
+            values.flags.writeable = writeable
+        ema(close, 10)
+        stoch(high, low, close, 14, 3)
+        shape_delta(high, low, close, volume)
+        pivot_masks(high, low, 2)
+
+
+# --- HÀM GỌI KERNEL (CHỈ DÙNG KHI active()) ---
+def _contiguous(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+def ema(values, length):
+    values = _contiguous(values)
+    if len(values) < length:
+        return np.full(len(values), np.nan)
+    return _compiled['ema'](values, length, values[:length].mean())
+
+def stoch(high, low, close, k, smooth_k):
+    """Trả về (%K thô, %K làm mượt)."""
+    return _compiled['stoch'](_contiguous(high), _contiguous(low), _contiguous(close), k, smooth_k)
+
+def shape_delta(high, low, close, volume):
+    return _compiled['shape_delta'](_contiguous(high), _contiguous(low), _contiguous(close), _contiguous(volume))
+
+def pivot_masks(high, low, n):
+    return _compiled['pivots'](_contiguous(high), _contiguous(low), n)
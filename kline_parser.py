@@ -0,0 +1,78 @@
+# kline_parser.py
+"""
+Đọc kline thô của Binance thẳng vào mảng numpy có cấu trúc (structured array), chỉ giữ các cột mà
+bộ quét / backtest dùng (timestamp, OHLCV, taker buy) thay vì DataFrame 12 cột kiểu object.
+DataFrame chỉ được tạo khi thật sự cần (kline_frame).
+"""
+import json
+import operator
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, thiếu thì dùng json chuẩn
+    orjson = None
+
+# Các cột được giữ; close_time, quote volume, số lệnh... không dùng nên không giải mã
+KLINE_DTYPE = np.dtype([
+    ('timestamp', 'i8'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'f8'),
+    ('taker_buy_base_asset_volume', 'f8'),
+])
+KLINE_FIELDS = KLINE_DTYPE.names
+# Vị trí của các cột trên trong mỗi kline thô của REST /klines
+KLINE_REST_INDEX = (0, 1, 2, 3, 4, 5, 9)
+_pick_columns = operator.itemgetter(*KLINE_REST_INDEX)
+
+
+def loads(payload):
+    return orjson.loads(payload) if orjson is not None else json.loads(payload)
+
+def empty_klines():
+    return np.empty(0, dtype=KLINE_DTYPE)
+
+def kline_array(rows):
+    """
+    Danh sách kline dạng list (giá là chuỗi) -> structured array.
+    Chỉ lấy các cột cần dùng và giải mã tất cả trong một lần ép kiểu sang ma trận float
+    (timestamp ms < 2^53 nên qua float vẫn chính xác).
+    """
+    if not rows:
+        return empty_klines()
+    values = np.array(list(map(_pick_columns, rows)), dtype=float)
+    out = np.empty(len(rows), dtype=KLINE_DTYPE)
+    for i, name in enumerate(KLINE_FIELDS):
+        out[name] = values[:, i]
+    return out
+
+def parse_kline_payload(payload):
+    """Body JSON (bytes/str) của REST /klines -> structured array."""
+    return kline_array(loads(payload))
+
+def kline_row(row):
+    """Một nến dạng dict (ví dụ từ WebSocket) -> structured array 1 phần tử."""
+    return np.array([tuple(row[name] for name in KLINE_FIELDS)], dtype=KLINE_DTYPE)
+
+def from_columns(columns, size):
+    """Ghép các cột (dict tên -> mảng) thành structured array, cột không có thì để 0."""
+    out = np.zeros(size, dtype=KLINE_DTYPE)
+    for name, values in columns.items():
+        out[name] = values
+    return out
+
+def kline_frame(klines):
+    """Tạo DataFrame từ structured array; DataFrame giữ nguyên thì trả về luôn."""
+    if isinstance(klines, pd.DataFrame):
+        return klines
+    return pd.DataFrame({name: klines[name] for name in KLINE_FIELDS})
+
+def has_field(data, name):
+    """Kiểm tra cột cho cả DataFrame lẫn structured array."""
+    if isinstance(data, np.ndarray):
+        return name in (data.dtype.names or ())
+    return name in data
@@ -0,0 +1,199 @@
+# kline_store.py
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+from binance.helpers import interval_to_milliseconds
+from config import KLINE_STORE_DIR
+
+# --- CẤU HÌNH KHO NẾN ---
+PAGE_LIMIT = 1500  # Số nến tối đa mỗi request klines của Binance Futures
+FETCH_RETRIES = 3  # Số lần thử lại một trang nến bị lỗi trước khi báo lỗi cho cả lần cập nhật
+RETRY_BASE_SECONDS = 2  # Chờ 2, 4, 8... giây giữa các lần thử
+STORE_COLUMNS = {
+    'timestamp': 'int64',
+    'open': 'float64',
+    'high': 'float64',
+    'low': 'float64',
+    'close': 'float64',
+    'volume': 'float64',
+    'taker_buy_base_asset_volume': 'float64',
+}
+
+
+def _month_of(timestamp_ms):
+    return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).strftime('%Y-%m')
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+def to_store_frame(df):
+    """Chuẩn hóa frame về các cột dạng số của kho (cột khác, kể cả trong file tháng cũ, bị bỏ)."""
+    return df[list(STORE_COLUMNS)].apply(pd.to_numeric).astype(STORE_COLUMNS)
+
+
+class KlineStore:
+    """
+    Kho nến cục bộ dạng cột (Arrow IPC), mỗi (symbol, interval) chia thành file theo tháng:
+    <root>/<SYMBOL>/<interval>/<YYYY-MM>.arrow. File được đọc qua memory map nên không
+    phải đọc lại từ đĩa vào bộ nhớ khi backtest nhiều lần.
+    """
+    def __init__(self, root=KLINE_STORE_DIR):
+        self.root = root
+
+    def _dir(self, symbol, interval):
+        return os.path.join(self.root, symbol, interval)
+
+    def _path(self, symbol, interval, month):
+        return os.path.join(self._dir(symbol, interval), f"{month}.arrow")
+
+    def months(self, symbol, interval):
+        directory = self._dir(symbol, interval)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name[:-len('.arrow')] for name in os.listdir(directory) if name.endswith('.arrow'))
+
+    def _read_month(self, symbol, interval, month):
+        with pa.memory_map(self._path(symbol, interval, month)) as source:
+            return pa.ipc.open_file(source).read_all().select(list(STORE_COLUMNS))
+
+    def load(self, symbol, interval, start=None, end=None):
+        """Đọc các nến trong [start, end] (ms), chỉ mở các file tháng liên quan."""
+        months = self.months(symbol, interval)
+        if start is not None:
+            months = [m for m in months if m >= _month_of(start)]
+        if end is not None:
+            months = [m for m in months if m <= _month_of(end)]
+        if not months:
+            return pd.DataFrame(columns=list(STORE_COLUMNS))
+        table = pa.concat_tables([self._read_month(symbol, interval, m) for m in months])
+        df = table.to_pandas()
+        if start is not None:
+            df = df[df['timestamp'] >= start]
+        if end is not None:
+            df = df[df['timestamp'] <= end]
+        return df.reset_index(drop=True)
+
+    def last_timestamp(self, symbol, interval):
+        months = self.months(symbol, interval)
+        if not months:
+            return None
+        return int(self._read_month(symbol, interval, months[-1]).column('timestamp')[-1].as_py())
+
+    def first_timestamp(self, symbol, interval):
+        months = self.months(symbol, interval)
+        if not months:
+            return None
+        return int(self._read_month(symbol, interval, months[0]).column('timestamp')[0].as_py())
+
+    def write(self, symbol, interval, df):
+        """Gộp các nến mới vào file tháng tương ứng (trùng timestamp thì giữ bản mới)."""
+        if df.empty:
+            return
+        df = to_store_frame(df)
+        os.makedirs(self._dir(symbol, interval), exist_ok=True)
+        for month, part in df.groupby(df['timestamp'].map(_month_of)):
+            path = self._path(symbol, interval, month)
+            if os.path.exists(path):
+                part = pd.concat([self._read_month(symbol, interval, month).to_pandas(), part])
+            part = part.drop_duplicates('timestamp', keep='last').sort_values('timestamp')
+            table = pa.Table.from_pandas(part, preserve_index=False)
+            tmp_path = path + '.tmp'
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, path)
+
+
+# --- TẢI / CẬP NHẬT DỮ LIỆU TỪ BINANCE ---
+def _is_closed(df, interval):
+    """Mặt nạ các nến đã đóng (nến kết thúc trước thời điểm hiện tại)."""
+    return df['timestamp'] + interval_to_milliseconds(interval) <= _now_ms()
+
+async def _fetch_page(symbol, interval, **kwargs):
+    """
+    Một trang nến; lỗi mạng / API được thử lại rồi ném ra thay vì trả frame rỗng,
+    để lỗi giữa chừng không bị ghi thành lịch sử thiếu một đoạn.
+    """
+    from trading_logic import get_klines
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            return await get_klines(symbol, interval, limit=PAGE_LIMIT, raise_errors=True, **kwargs)
+        except Exception:
+            if attempt == FETCH_RETRIES: raise
+            await asyncio.sleep(RETRY_BASE_SECONDS * 2 ** attempt)
+
+async def download_history(store, symbol, interval, since, until=None):
+    """
+    Tải lùi từ `until` (mặc định hiện tại) về `since` (ms) theo từng trang PAGE_LIMIT nến, chỉ lưu nến đã đóng.
+    Chỉ ghi vào kho khi đã tải đủ mọi trang; lỗi được ném ra để lần chạy sau tải lại.
+    """
+    pages, end_time = [], until
+    while True:
+        df = await _fetch_page(symbol, interval, end_time=end_time)
+        if df.empty:
+            break
+        pages.append(df)
+        earliest = int(df['timestamp'].iloc[0])
+        if earliest <= since or len(df) < PAGE_LIMIT:
+            break
+        end_time = earliest - 1
+    if not pages:
+        return 0
+    df = pd.concat(pages[::-1], ignore_index=True)
+    df = df[(df['timestamp'] >= since) & _is_closed(df, interval)]
+    await asyncio.to_thread(store.write, symbol, interval, df)
+    print(f"[Store] {symbol} {interval}: đã tải {len(df)} nến lịch sử.")
+    return len(df)
+
+async def update_store(store, symbol, interval, history_days):
+    """
+    Đảm bảo kho có `history_days` ngày gần nhất: chưa có dữ liệu thì tải toàn bộ, kho bắt đầu muộn hơn
+    cửa sổ yêu cầu thì tải bù phần đầu, sau đó chỉ nối thêm các nến đã đóng sau nến cuối trong kho.
+    """
+    since = _now_ms() - history_days * 86_400_000
+    first_ts = store.first_timestamp(symbol, interval)
+    if first_ts is None:
+        return await download_history(store, symbol, interval, since)
+    added = 0
+    if since < first_ts - interval_to_milliseconds(interval):
+        added += await download_history(store, symbol, interval, since, until=first_ts - 1)
+    last_ts = store.last_timestamp(symbol, interval)
+    while True:
+        df = await _fetch_page(symbol, interval, start_time=last_ts + 1)
+        if df.empty:
+            break
+        df = df[_is_closed(df, interval)]
+        if df.empty:
+            break
+        await asyncio.to_thread(store.write, symbol, interval, df)
+        added += len(df)
+        last_ts = int(df['timestamp'].iloc[-1])
+        if len(df) < PAGE_LIMIT - 1:
+            break
+    return added
+
+
+# --- CHẠY ĐỘC LẬP: python kline_store.py BTCUSDT ETHUSDT --days 730 ---
+async def main():
+    from binance_client import init_binance_client, close_binance_client
+    from trading_logic import TIMEFRAME_M15, TIMEFRAME_H1
+    parser = argparse.ArgumentParser(description="Tải/cập nhật kho nến cục bộ cho backtest")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--intervals', nargs='+', default=[TIMEFRAME_M15, TIMEFRAME_H1])
+    parser.add_argument('--days', type=int, default=365, help="Số ngày lịch sử khi tải lần đầu")
+    args = parser.parse_args()
+    store = KlineStore()
+    await init_binance_client()
+    try:
+        for symbol in args.symbols:
+            for interval in args.intervals:
+                added = await update_store(store, symbol.upper(), interval, args.days)
+                print(f"--- {symbol.upper()} {interval}: +{added} nến ---")
+    finally:
+        await close_binance_client()
+
+if __name__ == "__main__":
+    asyncio.run(main())
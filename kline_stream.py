@@ -0,0 +1,86 @@
+# kline_stream.py
+import asyncio
+import json
+import websockets
+from config import BINANCE_STREAM_URL
+
+# --- CẤU HÌNH STREAM ---
+MAX_STREAMS_PER_CONNECTION = 200  # Giới hạn số stream trên một kết nối của Binance Futures
+RECONNECT_DELAY_SECONDS = 5
+
+
+def stream_name(symbol, interval):
+    return f"{symbol.lower()}@kline_{interval}"
+
+def parse_kline_message(message):
+    """
+    Đọc một message kline (combined stream hoặc stream đơn).
+    Trả về (symbol, interval, row, is_closed) với row có các cột số của kline_parser.KLINE_DTYPE, hoặc None.
+    """
+    payload = json.loads(message)
+    data = payload.get('data', payload)
+    if data.get('e') != 'kline':
+        return None
+    k = data['k']
+    row = {
+        'timestamp': int(k['t']),
+        'open': float(k['o']),
+        'high': float(k['h']),
+        'low': float(k['l']),
+        'close': float(k['c']),
+        'volume': float(k['v']),
+        'taker_buy_base_asset_volume': float(k['V']),
+    }
+    return k['s'], k['i'], row, bool(k['x'])
+
+
+class KlineStream:
+    """
+    Theo dõi kline của nhiều mã/khung qua combined stream của Binance.
+    Mỗi message được chuyển cho `on_kline(symbol, interval, row, is_closed)`.
+    Gọi `set_symbols` để đăng ký lại khi watchlist thay đổi.
+    """
+    def __init__(self, symbols, intervals, on_kline, url=BINANCE_STREAM_URL):
+        self.symbols = list(symbols)
+        self.intervals = list(intervals)
+        self.on_kline = on_kline
+        self.url = url
+        self._resubscribe = asyncio.Event()
+
+    def set_symbols(self, symbols):
+        if set(symbols) == set(self.symbols):
+            return
+        self.symbols = list(symbols)
+        self._resubscribe.set()
+
+    def _connection_groups(self):
+        streams = [stream_name(s, i) for s in self.symbols for i in self.intervals]
+        return [streams[i:i + MAX_STREAMS_PER_CONNECTION] for i in range(0, len(streams), MAX_STREAMS_PER_CONNECTION)]
+
+    async def run(self):
+        while True:
+            self._resubscribe.clear()
+            listeners = [asyncio.create_task(self._listen(group)) for group in self._connection_groups()]
+            print(f"[Stream] Đăng ký {len(self.symbols)} mã trên {len(listeners)} kết nối.")
+            waiter = asyncio.create_task(self._resubscribe.wait())
+            try:
+                await asyncio.wait([*listeners, waiter], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in [*listeners, waiter]:
+                    task.cancel()
+                await asyncio.gather(*listeners, waiter, return_exceptions=True)
+
+    async def _listen(self, streams):
+        url = f"{self.url}?streams={'/'.join(streams)}"
+        while True:
+            try:
+                async with websockets.connect(url) as ws:
+                    async for message in ws:
+                        parsed = parse_kline_message(message)
+                        if parsed:
+                            await self.on_kline(*parsed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Stream] Mất kết nối ({e}). Kết nối lại sau {RECONNECT_DELAY_SECONDS}s...")
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
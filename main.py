@@ -3,17 +3,22 @@
 import asyncio
 import logging
 from telegram.ext import Application, CommandHandler
-from config import TELEGRAM_TOKEN
+from config import TELEGRAM_TOKEN, METRICS_HOST, METRICS_PORT
 from bot_handler import (
     add_symbol, 
     remove_symbol, 
     list_symbols, 
     start, 
     backtest_command,
-    restart_bot
+    restart_bot,
+    profile_command
 )
-from trading_logic import run_signal_checker
+from trading_logic import run_signal_checker, signal_store
 from database import init_db, close_db_pool 
+from binance_client import init_binance_client, close_binance_client
+from backtester import close_process_pool
+from metrics import start_metrics_server
+from telegram_queue import telegram_queue
 
 # --- CẤU HÌNH LOGGING (Không đổi) ---
 logging.basicConfig(
@@ -26,13 +31,9 @@ logging.getLogger("telegram.ext").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
-# --- HÀM DỌN DẸP (Không đổi) ---
-async def post_shutdown_cleanup(application: Application):
-    """
-    Hàm dọn dẹp được gọi sau khi application đã dừng hoàn toàn.
-    """
-    logger.info("Bot is shutting down. Cleaning up background task and DB pool...")
-    
+# --- HÀM DỌN DẸP ---
+async def stop_scanner(application: Application):
+    """Hủy task quét tín hiệu (hoặc task gửi từ signal_outbox khi SCAN_ROLE=bot) và chờ nó dừng hẳn."""
     task = application.bot_data.get("watchlist_task")
     if task and not task.done():
         task.cancel()
@@ -40,7 +41,30 @@ async def post_shutdown_cleanup(application: Application):
             await task
         except asyncio.CancelledError:
             pass  # Lỗi này là bình thường khi hủy task
+
+
+async def post_shutdown_cleanup(application: Application):
+    """
+    Hàm dọn dẹp được gọi sau khi application đã dừng hoàn toàn.
+    """
+    logger.info("Bot is shutting down. Cleaning up background task, Binance client and DB pool...")
     
+    # Thường đã dừng trong main() trước telegram_queue.stop(); ở đây để chắc chắn
+    await stop_scanner(application)
+    
+    for job in list(application.bot_data.get("backtest_jobs", {}).values()):
+        job.cancel()
+        try:
+            await job
+        except asyncio.CancelledError:
+            pass
+
+    metrics_runner = application.bot_data.get("metrics_runner")
+    if metrics_runner:
+        await metrics_runner.cleanup()
+
+    close_process_pool()
+    await close_binance_client()
     await close_db_pool()
     
     logger.info("Cleanup complete.")
@@ -52,6 +76,7 @@ async def main() -> None:
     Khởi động bot và các tác vụ nền theo cách tương thích với asyncio.
     """
     await init_db()
+    await init_binance_client()
 
     if not TELEGRAM_TOKEN:
         logger.error("TELEGRAM_TOKEN không được tìm thấy!")
@@ -69,11 +94,16 @@ async def main() -> None:
     application.add_handler(CommandHandler("list", list_symbols))
     application.add_handler(CommandHandler("backtest", backtest_command))
     application.add_handler(CommandHandler("restart", restart_bot))
+    application.add_handler(CommandHandler("profile", profile_command))
     
     # 3. Khởi chạy bộ quét tín hiệu như cũ
     signal_checker_task = asyncio.create_task(run_signal_checker(application.bot))
     application.bot_data["watchlist_task"] = signal_checker_task
     
+    # Endpoint /metrics cho Prometheus (tắt bằng METRICS_PORT=0)
+    if METRICS_PORT:
+        application.bot_data["metrics_runner"] = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
     logger.info("Signal checker task created. Starting bot...")
 
     # 4. KHỞI CHẠY BOT THEO CÁCH MỚI (NON-BLOCKING)
@@ -84,6 +114,8 @@ async def main() -> None:
         await application.updater.start_polling()
         # Bắt đầu xử lý các tin nhắn đã nhận (chạy nền)
         await application.start()
+        # Task gửi tin Telegram chạy nền (bộ quét chỉ đưa tin vào hàng đợi)
+        telegram_queue.start(application.bot)
         
         logger.info("Bot is running successfully!")
         
@@ -98,6 +130,12 @@ async def main() -> None:
             await application.updater.stop()
         if application.running:
             await application.stop()
+        # Dừng bộ quét / task outbox trước để không còn tín hiệu mới được đưa vào hàng đợi,
+        # rồi gửi nốt các tin còn trong hàng đợi trước khi đóng bot
+        await stop_scanner(application)
+        await telegram_queue.stop()
+        # Tín hiệu chỉ được đánh dấu khi đã gửi xong: ghi nốt các tín hiệu vừa gửi khi xả hàng đợi
+        await signal_store.flush()
         
         # Lệnh shutdown sẽ kích hoạt hàm post_shutdown_cleanup của chúng ta
         await application.shutdown()
@@ -0,0 +1,236 @@
+# metrics.py
+import asyncio
+import cProfile
+import time
+from collections.abc import Coroutine
+from contextlib import contextmanager
+from contextvars import ContextVar
+from aiohttp import web
+import database
+from binance_client import weight_limiter
+
+# --- CẤU HÌNH ---
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+CYCLE_BUDGET_SECONDS = 15 * 60
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in sorted(self._values.items())]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        # callback() -> giá trị, đọc tại thời điểm /metrics được gọi (chỉ cho gauge không nhãn)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def _samples(self):
+        if self.callback is not None:
+            value = self.callback()
+            return [] if value is None else [f"{self.name} {value}"]
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.setdefault(key, {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state['counts'][i] += 1
+        state['sum'] += value
+        state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, state in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, state['counts']):
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, [('le', '+Inf')])} {state['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {state['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- CÁC METRIC CỦA BỘ QUÉT ---
+STAGE_SECONDS = registry.register(Histogram('scan_stage_seconds', 'Thời gian từng bước xử lý một mã', ['stage']))
+CYCLE_SECONDS = registry.register(Histogram('scan_cycle_seconds', 'Thời gian một chu kỳ quét toàn bộ watchlist'))
+CYCLE_LAST_SECONDS = registry.register(Gauge('scan_cycle_last_duration_seconds', 'Thời gian chu kỳ quét gần nhất'))
+CYCLE_BUDGET_RATIO = registry.register(Gauge('scan_cycle_budget_ratio', 'Tỷ lệ thời gian chu kỳ gần nhất so với ngân sách 15 phút'))
+CYCLE_SYMBOLS = registry.register(Gauge('scan_cycle_symbols', 'Số mã trong chu kỳ quét gần nhất'))
+CYCLE_CANDIDATES = registry.register(Gauge('scan_cycle_candidates', 'Số mã qua bộ lọc sơ bộ trong chu kỳ quét toàn thị trường gần nhất'))
+# Nhãn theo loại lỗi (tên exception), không theo mã: số series không tăng theo watchlist / toàn thị trường
+SYMBOL_ERRORS = registry.register(Counter('scan_symbol_errors_total', 'Số lỗi khi xử lý một mã, theo loại lỗi', ['error']))
+FETCH_ERRORS = registry.register(Counter('kline_fetch_errors_total', 'Số lần lấy nến từ Binance thất bại', ['interval']))
+SIGNALS_SENT = registry.register(Counter('signals_sent_total', 'Số tín hiệu đã đưa vào hàng đợi gửi lên channel', ['timeframe']))
+TELEGRAM_QUEUE_DEPTH = registry.register(Gauge('telegram_queue_depth', 'Số tin nhắn Telegram đang chờ gửi'))
+TELEGRAM_MESSAGES = registry.register(Counter('telegram_messages_total', 'Kết quả gửi tin Telegram (sent/retry/dropped)', ['result']))
+
+def _db_pool_stat(method):
+    pool = database.db_pool
+    return None if pool is None else getattr(pool, method)()
+
+BINANCE_WEIGHT = registry.register(Gauge('binance_used_weight_1m', 'Trọng số request Binance đã dùng trong phút hiện tại (theo header)', callback=lambda: weight_limiter.used_weight))
+DB_POOL_SIZE = registry.register(Gauge('db_pool_size', 'Số kết nối đang mở trong pool Postgres', callback=lambda: _db_pool_stat('get_size')))
+DB_POOL_IDLE = registry.register(Gauge('db_pool_idle', 'Số kết nối rảnh trong pool Postgres', callback=lambda: _db_pool_stat('get_idle_size')))
+
+def record_cycle(stats):
+    """Ghi thống kê một chu kỳ quét (từ scan_watchlist)."""
+    CYCLE_SECONDS.observe(stats['duration_seconds'])
+    CYCLE_LAST_SECONDS.set(stats['duration_seconds'])
+    CYCLE_BUDGET_RATIO.set(stats['duration_seconds'] / CYCLE_BUDGET_SECONDS)
+    CYCLE_SYMBOLS.set(stats['symbols'])
+    if 'candidates' in stats:
+        CYCLE_CANDIDATES.set(stats['candidates'])
+
+
+@contextmanager
+def stage(name):
+    """Đo thời gian một bước (rate_limit, fetch, parse, indicators, detection, enrichment, send)."""
+    with STAGE_SECONDS.time(stage=name):
+        yield
+
+
+# --- PROFILE MỘT COROUTINE (/profile) ---
+_profiling = ContextVar('profiling', default=None)
+
+class _ProfiledCoroutine(Coroutine):
+    """Bọc coroutine để profiler chỉ bật trong lúc nó chạy, tắt mỗi khi nó nhường event loop."""
+    def __init__(self, coro, profiler):
+        self._coro, self._profiler = coro, profiler
+
+    def send(self, value):
+        self._profiler.enable()
+        try:
+            return self._coro.send(value)
+        finally:
+            self._profiler.disable()
+
+    def throw(self, *args):
+        self._profiler.enable()
+        try:
+            return self._coro.throw(*args)
+        finally:
+            self._profiler.disable()
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+async def profile_coroutine(coro):
+    """
+    Chạy `coro` trong task riêng dưới cProfile và trả về (kết quả, profiler). Chỉ tính thời gian của task này
+    và các task nó tạo ra (asyncio.gather...), không tính các handler / bộ quét khác chạy xen trên cùng event loop.
+    """
+    loop = asyncio.get_running_loop()
+    profiler = cProfile.Profile()
+    previous_factory = loop.get_task_factory()
+
+    def task_factory(loop, task_coro, **kwargs):
+        if _profiling.get() is profiler:
+            task_coro = _ProfiledCoroutine(task_coro, profiler)
+        if previous_factory is not None:
+            return previous_factory(loop, task_coro, **kwargs)
+        return asyncio.Task(task_coro, loop=loop, **kwargs)
+
+    async def run():
+        _profiling.set(profiler)
+        return await coro
+
+    loop.set_task_factory(task_factory)
+    try:
+        # Context của task được chép khi tạo: _profiling chỉ có giá trị trong task này và các task con
+        result = await asyncio.create_task(_ProfiledCoroutine(run(), profiler))
+    finally:
+        loop.set_task_factory(previous_factory)
+    return result, profiler
+
+
+# --- HTTP /metrics ---
+async def start_metrics_server(host, port):
+    """Chạy endpoint /metrics (Prometheus text format) trên event loop hiện tại; trả về runner để dừng."""
+    async def handle_metrics(request):
+        return web.Response(body=registry.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Metrics endpoint is running at http://{host}:{port}/metrics")
+    return runner
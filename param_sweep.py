@@ -0,0 +1,207 @@
+# param_sweep.py
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import trading_logic as tl
+from indicators import ema, stoch
+from signal_engine import pivot_masks, pair_divergences
+from cvd import frame_delta, check_delta_method
+from trade_simulator import simulate_entries, performance_metrics, hold_bars_for, TAKE_PROFIT_PCT, STOP_LOSS_PCT
+
+# --- CẤU HÌNH SWEEP ---
+# Giá trị mặc định = cấu hình đang chạy live; truyền --grid để quét dải tham số khác
+DEFAULT_PARAMS = {
+    'fractal_periods': tl.FRACTAL_PERIODS,
+    'cvd_method': tl.CVD_METHOD,
+    'cvd_period': tl.CVD_PERIOD,
+    'ema_period': tl.EMA_TREND_PERIOD,
+    'stoch_k': tl.STOCH_K,
+    'stoch_smooth_k': tl.STOCH_SMOOTH_K,
+    'divergence_max_bars': tl.DIVERGENCE_MAX_BARS,
+    'stoch_m15_oversold': tl.STOCH_M15_OVERSOLD,
+    'stoch_m15_overbought': tl.STOCH_M15_OVERBOUGHT,
+    'stoch_h1_oversold': tl.STOCH_H1_OVERSOLD,
+    'stoch_h1_overbought': tl.STOCH_H1_OVERBOUGHT,
+    'take_profit': TAKE_PROFIT_PCT,
+    'stop_loss': STOP_LOSS_PCT,
+    'max_hold_bars': hold_bars_for(tl.TIMEFRAME_M15),  # Tính theo nến M15 (khung tín hiệu của sweep)
+}
+# Các tham số quyết định chỉ báo: tổ hợp được sắp theo nhóm này để tái dùng cache
+CACHE_KEYS = ('fractal_periods', 'ema_period', 'cvd_method', 'cvd_period', 'stoch_k', 'stoch_smooth_k')
+MIN_TRADES = 10  # Bỏ qua tổ hợp có quá ít lệnh khi xếp hạng
+SWEEP_WORKERS = os.cpu_count() or 1
+
+
+def expand_grid(grid):
+    """Sinh mọi tổ hợp từ {tên: [giá trị...]}, tham số không khai báo lấy DEFAULT_PARAMS."""
+    unknown = set(grid) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise ValueError(f"Tham số không hợp lệ: {', '.join(sorted(unknown))}")
+    for method in grid.get('cvd_method', []):
+        check_delta_method(method)
+    names = list(DEFAULT_PARAMS)
+    values = [grid.get(name, [DEFAULT_PARAMS[name]]) for name in names]
+    combos = [dict(zip(names, combo)) for combo in itertools.product(*values)]
+    return sorted(combos, key=lambda c: tuple(c[k] for k in CACHE_KEYS))
+
+
+# --- CACHE CHỈ BÁO THEO MÃ (DÙNG CHUNG GIỮA CÁC TỔ HỢP) ---
+class IndicatorCache:
+    """Tính mỗi chỉ báo một lần cho mỗi bộ chu kỳ, các tổ hợp dùng chung chu kỳ chỉ đọc lại."""
+    def __init__(self, m15_arrays, h1_arrays):
+        self.m15 = m15_arrays
+        self.h1 = h1_arrays
+        self._memo = {}
+
+    def _get(self, key, compute):
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def delta(self, method):
+        return self._get(('delta', method), lambda: frame_delta(self.m15, method))
+
+    def cvd(self, method, period):
+        return self._get(('cvd', method, period), lambda: ema(self.delta(method), period))
+
+    def ema(self, period):
+        return self._get(('ema', period), lambda: ema(self.m15['close'], period))
+
+    def pivots(self, n):
+        return self._get(('pivots', n), lambda: pivot_masks(self.m15['high'], self.m15['low'], n))
+
+    def stoch(self, timeframe, k, smooth_k):
+        def compute():
+            arrays = self.m15 if timeframe == 'm15' else self.h1
+            return stoch(arrays['high'], arrays['low'], arrays['close'], k, smooth_k)[1]
+        return self._get(('stoch', timeframe, k, smooth_k), compute)
+
+
+def evaluate_combo(cache, params):
+    """Chạy toàn bộ chiến lược (phân kỳ + lọc Stoch + mô phỏng lệnh) cho một tổ hợp trên một mã."""
+    m15, h1 = cache.m15, cache.h1
+    n = params['fractal_periods']
+    if len(m15['close']) < params['ema_period'] + n:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    ema_trend, cvd = cache.ema(params['ema_period']), cache.cvd(params['cvd_method'], params['cvd_period'])
+    pivot_high, pivot_low = cache.pivots(n)
+    up = np.flatnonzero(pivot_high & (m15['close'] > ema_trend))
+    down = np.flatnonzero(pivot_low & (m15['close'] < ema_trend))
+    shorts = up[1:][pair_divergences(up, m15['high'], cvd, True, params['divergence_max_bars'])]
+    longs = down[1:][pair_divergences(down, m15['low'], cvd, False, params['divergence_max_bars'])]
+    pivots = np.concatenate([shorts, longs])
+    is_long = np.concatenate([np.zeros(len(shorts), bool), np.ones(len(longs), bool)])
+    confirm_idx = pivots + n
+    confirm_ts = m15['timestamp'][confirm_idx]
+
+    stoch_m15 = cache.stoch('m15', params['stoch_k'], params['stoch_smooth_k'])[confirm_idx]
+    h1_pos = np.searchsorted(h1['timestamp'], confirm_ts, side='right') - 1
+    stoch_h1 = cache.stoch('h1', params['stoch_k'], params['stoch_smooth_k'])[np.maximum(h1_pos, 0)]
+    # Cùng điều kiện với classify_signal: nhóm 'M15' hoặc 'M15+H1' (bằng đúng ngưỡng H1 thì loại)
+    long_ok = is_long & (stoch_m15 < params['stoch_m15_oversold']) & (stoch_h1 != params['stoch_h1_oversold'])
+    short_ok = ~is_long & (stoch_m15 > params['stoch_m15_overbought']) & (stoch_h1 != params['stoch_h1_overbought'])
+    keep = (long_ok | short_ok) & (h1_pos >= 0) & ~np.isnan(stoch_h1)
+    if not keep.any():
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    reason_code, returns, _ = simulate_entries(
+        confirm_idx[keep], is_long[keep], m15, params['take_profit'], params['stop_loss'], params['max_hold_bars']
+    )
+    closed = reason_code != 0
+    return confirm_ts[keep][closed], returns[closed]
+
+def sweep_symbol(m15_arrays, h1_arrays, combos):
+    """Chạy trong tiến trình con: đánh giá một nhóm tổ hợp trên một mã, dùng chung cache chỉ báo."""
+    cache = IndicatorCache(m15_arrays, h1_arrays)
+    return [evaluate_combo(cache, params) for params in combos]
+
+
+# --- ĐIỀU PHỐI SONG SONG & XẾP HẠNG ---
+def _chunks(combos, count):
+    size = max(1, -(-len(combos) // count))
+    return [combos[i:i + size] for i in range(0, len(combos), size)]
+
+def run_sweep(data, grid, workers=SWEEP_WORKERS):
+    """
+    data: {symbol: (m15_arrays, h1_arrays)}. Chia (mã x nhóm tổ hợp) cho pool tiến trình,
+    gộp lệnh của mọi mã theo từng tổ hợp và trả về bảng kết quả đã xếp hạng.
+    """
+    combos = expand_grid(grid)
+    chunk_count = max(1, -(-workers // max(1, len(data))))
+    chunks = _chunks(combos, chunk_count)
+    trades = [[] for _ in combos]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = []
+        offset = 0
+        for chunk in chunks:
+            for m15_arrays, h1_arrays in data.values():
+                futures.append((offset, pool.submit(sweep_symbol, m15_arrays, h1_arrays, chunk)))
+            offset += len(chunk)
+        for start, future in futures:
+            for i, result in enumerate(future.result()):
+                trades[start + i].append(result)
+
+    return rank_results(combos, trades)
+
+def rank_results(combos, trades):
+    """
+    trades[i]: danh sách (timestamp, lợi nhuận) của tổ hợp combos[i] trên từng mã. Gộp theo thứ tự thời gian,
+    tính hiệu quả và xếp theo kỳ vọng rồi profit factor; tổ hợp ít hơn MIN_TRADES lệnh xếp cuối.
+    """
+    rows = []
+    for params, results in zip(combos, trades):
+        timestamps = np.concatenate([r[0] for r in results]) if results else np.empty(0)
+        returns = np.concatenate([r[1] for r in results]) if results else np.empty(0)
+        rows.append({**params, **performance_metrics(returns[np.argsort(timestamps, kind='stable')])})
+    table = pd.DataFrame(rows)
+    table['ranked'] = table['trades'] >= MIN_TRADES
+    return table.sort_values(['ranked', 'expectancy', 'profit_factor'], ascending=False).drop(columns='ranked').reset_index(drop=True)
+
+
+# --- CHẠY ĐỘC LẬP: python param_sweep.py BTCUSDT ETHUSDT --grid grid.json ---
+async def load_data(symbols, days):
+    from backtester import load_backtest_data, to_arrays
+    data = {}
+    for symbol in symbols:
+        m15_data, h1_data = await asyncio.gather(
+            load_backtest_data(symbol, tl.TIMEFRAME_M15, days),
+            load_backtest_data(symbol, tl.TIMEFRAME_H1, days)
+        )
+        if m15_data.empty or h1_data.empty:
+            print(f"--- [Sweep] Dữ liệu trống cho {symbol}, bỏ qua ---")
+            continue
+        data[symbol] = (to_arrays(m15_data), to_arrays(h1_data))
+    return data
+
+async def main():
+    from binance_client import init_binance_client, close_binance_client
+    parser = argparse.ArgumentParser(description="Quét lưới tham số chiến lược trên dữ liệu kho nến")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--grid', help='File JSON dạng {"cvd_period": [12, 24, 36], "cvd_method": ["shape", "taker"], ...}')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--workers', type=int, default=SWEEP_WORKERS)
+    parser.add_argument('--out', default='sweep_results.csv')
+    args = parser.parse_args()
+    grid = {}
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    await init_binance_client()
+    try:
+        data = await load_data([s.upper() for s in args.symbols], args.days)
+    finally:
+        await close_binance_client()
+    print(f"--- [Sweep] {len(expand_grid(grid))} tổ hợp x {len(data)} mã trên {args.workers} tiến trình ---")
+    table = await asyncio.to_thread(run_sweep, data, grid, args.workers)
+    table.to_csv(args.out, index=False)
+    print(table.head(20).to_string())
+    print(f"--- [Sweep] Đã ghi bảng kết quả vào {args.out} ---")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,294 @@
+# replay.py
+"""
+Replay bộ quét live trên nến đã lưu trong kho cục bộ (kline_store.py), nhanh hơn thời gian thực.
+Chạy đúng đường live (run_signal_checker -> candle_cache -> chỉ báo -> tìm tín hiệu -> chống trùng ->
+lọc Stoch -> hàng đợi Telegram) với đồng hồ ảo, nguồn nến đọc từ kho và bot Telegram giả ghi lại tin nhắn.
+Như REST, nguồn nến trả các nến đã đóng cộng nến đang chạy ở cuối; kho chỉ có nến đủ nên nến đang chạy
+được dựng như tick đầu của nến (open = high = low = close, khối lượng 0), giống lúc bộ quét chạy vài giây sau khi nến mở.
+--check vì vậy đo đúng độ lệch giữa live (xác nhận trên nến đang chạy) và backtest (trên nến đã đóng).
+
+    python kline_store.py BTCUSDT ETHUSDT --days 30       # tải dữ liệu trước
+    python replay.py BTCUSDT ETHUSDT --from 2024-05-01 --days 3 --check
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pytz
+from binance.helpers import interval_to_milliseconds
+from config import SCAN_MODE, SCAN_ROLE, SCAN_UNIVERSE
+from clock import clock, ReplayClock
+from kline_store import KlineStore
+from kline_parser import KLINE_FIELDS, from_columns, empty_klines
+from candle_cache import CandleCache
+from indicators import IndicatorStore
+from signal_store import SignalStore, signal_key
+from watchlist_manager import WatchlistManager
+from telegram_queue import telegram_queue
+from timeframes import base_interval, resample_candles, timeframe_label
+from backtester import backtest_symbol, to_arrays
+from trade_simulator import hold_bars_for
+import trading_logic as tl
+
+# --- CẤU HÌNH REPLAY ---
+DEFAULT_SPEED = 0         # Giới hạn số giây ảo cho mỗi giây thật, 0 = chạy nhanh nhất có thể
+DEFAULT_DAYS = 3
+SETTLE_YIELDS = 20        # Số lượt nhường event loop sau khi bộ quét ngủ, để hàng đợi Telegram chạy tới lượt chờ kế
+
+
+class ReplaySource:
+    """
+    Nguồn nến cho candle_cache khi replay (cùng chữ ký với get_kline_array).
+    Trả các nến khung gốc đã đóng tại clock.time() cộng nến đang chạy (open_bar) ở cuối, đếm số request như gọi REST.
+    """
+    def __init__(self, frames, interval):
+        self.frames = frames
+        self.interval = interval
+        self.interval_ms = interval_to_milliseconds(interval)
+        self.requests = 0
+
+    async def fetch(self, symbol, interval, limit=300, start_time=None, end_time=None):
+        if interval != self.interval:
+            raise ValueError(f"Replay chỉ có nến khung {self.interval}, không có {interval}")
+        self.requests += 1
+        data = self.frames.get(symbol)
+        if data is None:
+            return empty_klines()
+        ts = data['timestamp']
+        now_ms = int(clock.time() * 1000)
+        closed_end = int(np.searchsorted(ts, now_ms - self.interval_ms, side='right'))
+        # Nến đang chạy: nến kế tiếp trong kho đã mở tại now_ms
+        has_open = closed_end < len(data) and ts[closed_end] <= now_ms
+        if end_time is not None and end_time < now_ms:
+            closed_end = min(closed_end, int(np.searchsorted(ts, end_time - self.interval_ms, side='right')))
+            has_open = False
+        if start_time is not None:
+            start = int(np.searchsorted(ts, start_time))
+            closed = data[start:min(closed_end, start + limit)]
+            has_open = has_open and len(closed) < limit and start <= closed_end
+        else:
+            closed = data[max(0, closed_end - limit + has_open):closed_end]
+        if not has_open:
+            return closed
+        return np.concatenate([closed, open_bar(data[closed_end])])
+
+
+def open_bar(row):
+    """Nến đang chạy ngay sau khi mở: chỉ có giá mở cửa, chưa có khối lượng."""
+    bar = np.array([row], dtype=row.dtype)
+    for name in ('high', 'low', 'close'):
+        bar[name] = bar['open']
+    for name in ('volume', 'taker_buy_base_asset_volume'):
+        bar[name] = 0
+    return bar
+
+
+class StubBot:
+    """Bot Telegram giả: ghi lại tin nhắn (kèm thời điểm ảo) thay vì gửi."""
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        self.messages.append({'chat_id': chat_id, 'text': text, 'sent_at': clock.now().isoformat()})
+
+
+@contextlib.contextmanager
+def _quiet(verbose):
+    """Ẩn log print của bộ quét / backtester (mỗi chu kỳ in một dòng cho từng mã) trừ khi --verbose."""
+    if verbose:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+def load_frames(store, symbols, interval, start_ms, end_ms, warmup_bars):
+    """Nến khung gốc của từng mã trong [start - warmup, end] dưới dạng structured array."""
+    frames = {}
+    warmup_ms = warmup_bars * interval_to_milliseconds(interval)
+    for symbol in symbols:
+        df = store.load(symbol, interval, start_ms - warmup_ms, end_ms)
+        if df.empty:
+            print(f"   ⚠️ {symbol}: kho chưa có nến {interval}, chạy 'python kline_store.py {symbol}' trước. Bỏ qua.", file=sys.stderr)
+            continue
+        frames[symbol] = from_columns({name: df[name].to_numpy() for name in KLINE_FIELDS}, len(df))
+    return frames
+
+async def _settle(replay_clock, scanner=None):
+    """
+    Chờ đến khi bộ quét xong chu kỳ và ngủ trên đồng hồ ảo, rồi nhường event loop vài lượt cho các task phụ
+    (hàng đợi Telegram) chạy tới lượt chờ kế tiếp trước khi đồng hồ tiến.
+    """
+    while scanner is not None and not scanner.done() and not replay_clock.sleeping(scanner):
+        await asyncio.sleep(0)
+    for _ in range(SETTLE_YIELDS):
+        await asyncio.sleep(0)
+
+async def _run_until(replay_clock, scanner, end_ms):
+    """Tiến đồng hồ ảo từng sự kiện đến end_ms (hoặc đến khi bộ quét dừng)."""
+    while not scanner.done():
+        await _settle(replay_clock, scanner)
+        wakeup = replay_clock.next_wakeup()
+        if scanner.done() or wakeup is None or wakeup * 1000 >= end_ms:
+            return
+        await replay_clock.advance()
+
+async def _drain_telegram(replay_clock):
+    """Gửi nốt hàng đợi Telegram, tiến đồng hồ ảo cho các lượt chờ giới hạn tốc độ."""
+    stopping = asyncio.create_task(telegram_queue.stop())
+    while not stopping.done():
+        await _settle(replay_clock)
+        if not stopping.done():
+            await replay_clock.advance()
+    await stopping
+
+async def replay(frames, interval, start_ms, end_ms, speed=DEFAULT_SPEED, verbose=False):
+    """Chạy run_signal_checker trên đồng hồ ảo từ start_ms đến end_ms, trả về (thống kê, tín hiệu, tin nhắn)."""
+    source = ReplaySource(frames, interval)
+    bot = StubBot()
+    cycles = []
+    signal_store = SignalStore(persist=False)
+    # Thay các đối tượng dùng chung của bộ quét bằng bản replay (không mạng, không database, không đo tỷ lệ win
+    # bằng backtest qua mạng) và trả lại như cũ khi xong
+    replaced = {
+        'candle_cache': CandleCache(source.fetch),
+        'indicator_store': IndicatorStore(**tl.indicator_store.params),
+        'signal_store': signal_store,
+        'watchlist_manager': WatchlistManager(list(frames)),
+        'WIN_RATE_SOURCE': 'fixed',
+    }
+    originals = {name: getattr(tl, name) for name in replaced}
+
+    started = time.monotonic()
+    replay_clock = ReplayClock(start_ms / 1000, speed)
+    with _quiet(verbose):
+        for name, value in replaced.items():
+            setattr(tl, name, value)
+        clock.install(replay_clock)
+        try:
+            telegram_queue.start(bot)
+            task = asyncio.create_task(tl.run_signal_checker(bot, on_cycle=cycles.append))
+            await _run_until(replay_clock, task, end_ms)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+            await _drain_telegram(replay_clock)
+            # Tín hiệu được đánh dấu khi Telegram gửi xong: ghi nốt các tín hiệu gửi sau chu kỳ cuối
+            await signal_store.flush()
+        finally:
+            clock.reset()
+            for name, value in originals.items():
+                setattr(tl, name, value)
+    elapsed = time.monotonic() - started
+
+    durations = [c['duration_seconds'] for c in cycles]
+    # Bộ quét ngủ tới mốc 15 phút kế tiếp + SCAN_DELAY_SECONDS: đếm các mốc đó nằm trong khoảng replay
+    cycle_ms = 15 * 60 * 1000
+    first_scan_ms = (start_ms // cycle_ms + 1) * cycle_ms + tl.SCAN_DELAY_SECONDS * 1000
+    expected_cycles = max(0, (end_ms - 1 - first_scan_ms) // cycle_ms + 1)
+    stats = {
+        'symbols': len(frames),
+        'virtual_hours': (end_ms - start_ms) / 3_600_000,
+        'real_seconds': elapsed,
+        'effective_speed': (end_ms - start_ms) / 1000 / elapsed if elapsed > 0 else None,
+        'cycles': len(cycles),
+        'expected_cycles': expected_cycles,
+        'missed_cycles': max(0, expected_cycles - len(cycles)),
+        'cycle_seconds_max': max(durations, default=0.0),
+        'cycle_seconds_mean': float(np.mean(durations)) if durations else 0.0,
+        'kline_requests': source.requests,
+        'signals': len(signal_store.history),
+        'messages': len(bot.messages),
+    }
+    return stats, signal_store.history, bot.messages
+
+
+# --- ĐỐI CHIẾU VỚI BACKTEST ---
+def backtest_signals(frames, interval, verbose=False):
+    """Tín hiệu của find_all_signals_for_backtest (qua backtest_symbol) trên cùng dữ liệu, theo từng pipeline."""
+    signals = []
+    with _quiet(verbose):
+        for symbol, klines in frames.items():
+            data = {interval: klines}
+            for signal_interval, filter_interval in tl.pipelines_for(symbol):
+                for i in (signal_interval, filter_interval):
+                    if i not in data:
+                        data[i] = resample_candles(klines, interval, i)
+                signals += backtest_symbol(symbol, to_arrays(data[signal_interval]), to_arrays(data[filter_interval]),
+                                           tl.CVD_METHOD, (timeframe_label(signal_interval), timeframe_label(filter_interval)),
+                                           hold_bars_for(signal_interval))
+    return signals
+
+def compare_with_backtest(live, reference, start_ms, end_ms):
+    """
+    So tín hiệu live với backtest trong khoảng mà cả hai cùng thấy: nến xác nhận đóng sau start + 1 nến khung lớn nhất
+    và trước end - 1 nến đó. Khung lọc live là nến đang hình thành (backtest dùng nến đủ) nên nhóm
+    (tier) có thể khác: chỉ báo cáo riêng, không tính là sai khác.
+    """
+    margin = max(interval_to_milliseconds(i) for pipeline in tl.SIGNAL_PIPELINES for i in pipeline)
+    def in_window(signal):
+        return start_ms + margin <= signal['confirmation_timestamp'] <= end_ms - 2 * margin
+    live_by_key = {signal_key(s): s for s in live if in_window(s)}
+    reference_by_key = {signal_key(s): s for s in reference if in_window(s)}
+    missing = sorted(set(reference_by_key) - set(live_by_key))
+    extra = sorted(set(live_by_key) - set(reference_by_key))
+    tier_differences = sorted(key for key in set(live_by_key) & set(reference_by_key)
+                              if live_by_key[key].get('tier') != reference_by_key[key].get('tier'))
+    return {
+        'compared': len(reference_by_key),
+        'matched': len(set(live_by_key) & set(reference_by_key)),
+        'missing': [list(map(str, key)) for key in missing],
+        'extra': [list(map(str, key)) for key in extra],
+        'tier_differences': [list(map(str, key)) for key in tier_differences],
+    }
+
+
+def _parse_date(value):
+    return int(datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=pytz.utc).timestamp() * 1000)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay bộ quét live trên dữ liệu đã lưu, nhanh hơn thời gian thực")
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--from', dest='start', required=True, help="Ngày bắt đầu (YYYY-MM-DD, UTC)")
+    parser.add_argument('--days', type=float, default=DEFAULT_DAYS)
+    parser.add_argument('--speed', type=float, default=DEFAULT_SPEED, help="Giới hạn số giây ảo cho mỗi giây thật (0 = không giới hạn)")
+    parser.add_argument('--check', action='store_true', help="Đối chiếu tín hiệu live với find_all_signals_for_backtest")
+    parser.add_argument('--verbose', action='store_true', help="Hiện log của bộ quét")
+    parser.add_argument('--out', help="Ghi thống kê, tín hiệu và tin nhắn ra file JSON")
+    args = parser.parse_args()
+    if SCAN_MODE == 'stream' or SCAN_ROLE != 'all' or SCAN_UNIVERSE != 'watchlist':
+        raise SystemExit("Replay chạy bộ quét poll trên watchlist: cần SCAN_MODE=poll, SCAN_ROLE=all, SCAN_UNIVERSE=watchlist.")
+
+    interval = base_interval(tl.SIGNAL_PIPELINES)
+    start_ms = _parse_date(args.start)
+    end_ms = start_ms + int(args.days * 86_400_000)
+    symbols = [s.upper() for s in args.symbols]
+    frames = load_frames(KlineStore(), symbols, interval, start_ms, end_ms, tl.base_candle_limit(tl.SIGNAL_PIPELINES))
+    if not frames:
+        raise SystemExit("Không có dữ liệu để replay.")
+
+    print(f">> Replay {len(frames)} mã, {args.days:g} ngày từ {args.start}" + (f", tối đa x{args.speed:g}" if args.speed else "") + "...", file=sys.stderr)
+    stats, live_signals, messages = await replay(frames, interval, start_ms, end_ms, args.speed, args.verbose)
+    result = {'stats': stats}
+    if args.check:
+        result['backtest_check'] = compare_with_backtest(live_signals, backtest_signals(frames, interval, args.verbose), start_ms, end_ms)
+
+    print(json.dumps(result, indent=2, default=str))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({**result, 'signals': [dict(s) for s in live_signals], 'messages': messages}, f, indent=2, default=str)
+    if stats['missed_cycles']:
+        print(f"⚠️ {stats['missed_cycles']} chu kỳ không chạy: bộ quét dừng trước khi hết khoảng replay (xem --verbose).", file=sys.stderr)
+    check = result.get('backtest_check')
+    if check and (check['missing'] or check['extra']):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nReplay stopped by user.", file=sys.stderr)
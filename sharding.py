@@ -0,0 +1,113 @@
+# sharding.py
+import asyncio
+import os
+import zlib
+import database
+
+# --- CẤU HÌNH CHIA SHARD ---
+SHARD_LOCK_NAMESPACE = 0x5343  # Khóa advisory (namespace, shard) cho từng shard
+MEMBER_LOCK_NAMESPACE = 0x5357 # Khóa advisory dùng chung (namespace, 0): mỗi worker còn sống giữ một
+REBALANCE_SECONDS = 30         # Chu kỳ đếm lại số worker và giành / nhả shard
+UNSETTLED_REBALANCE_SECONDS = 2  # Chu kỳ ngắn khi còn shard không ai giữ hoặc worker này chưa nhận đủ phần
+
+
+def shard_of(symbol, shards):
+    """Shard cố định của một mã (crc32 không phụ thuộc tiến trình như hash() của Python)."""
+    return zlib.crc32(symbol.encode()) % shards
+
+
+class ShardCoordinator:
+    """
+    Chia watchlist giữa nhiều worker quét bằng advisory lock của Postgres.
+    Mỗi worker giữ một kết nối riêng trong suốt thời gian chạy: khóa thành viên (shared) để các worker
+    đếm được nhau qua pg_locks, và khóa của các shard nó phụ trách. Worker chết thì kết nối đóng, Postgres
+    tự nhả mọi khóa và các worker còn lại giành các shard đó ở lần rebalance tiếp theo.
+    Mỗi worker nhận tối đa ceil(shards / số worker) shard, nên worker mới vào cũng được chia việc.
+    Khi còn shard trống hoặc worker chưa đủ phần, rebalance chạy mỗi UNSETTLED_REBALANCE_SECONDS: shard do worker
+    khác vừa nhả được nhận lại sau vài giây thay vì bỏ trống đến hết chu kỳ REBALANCE_SECONDS.
+    """
+    def __init__(self, shards):
+        self.shards = shards
+        self.owned = set()
+        self._conn = None
+        self._task = None
+        # Mỗi worker bắt đầu dò shard trống từ một vị trí khác nhau để ít tranh chấp
+        self._offset = os.getpid() % shards
+        self._settled = False
+
+    async def start(self):
+        await self.rebalance()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._release_connection()
+
+    def owns(self, symbol):
+        return shard_of(symbol, self.shards) in self.owned
+
+    def filter(self, symbols):
+        """Các mã thuộc shard worker này đang giữ."""
+        return [s for s in symbols if self.owns(s)]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(REBALANCE_SECONDS if self._settled else UNSETTLED_REBALANCE_SECONDS)
+            await self.rebalance()
+
+    async def rebalance(self):
+        self._settled = False
+        try:
+            if self._conn is None:
+                self._conn = await database.db_pool.acquire()
+                await self._conn.execute('SELECT pg_advisory_lock_shared($1, 0);', MEMBER_LOCK_NAMESPACE)
+            workers = await self._conn.fetchval('''
+                SELECT count(DISTINCT pid) FROM pg_locks
+                WHERE locktype = 'advisory' AND granted AND classid = $1::int::oid AND objid = 0 AND objsubid = 2
+                  AND database = (SELECT oid FROM pg_database WHERE datname = current_database());
+            ''', MEMBER_LOCK_NAMESPACE)
+            target = -(-self.shards // max(1, workers))
+            released, claimed = [], []
+            for shard in sorted(self.owned, reverse=True)[:max(0, len(self.owned) - target)]:
+                await self._conn.execute('SELECT pg_advisory_unlock($1, $2);', SHARD_LOCK_NAMESPACE, shard)
+                self.owned.discard(shard)
+                released.append(shard)
+            for i in range(self.shards):
+                if len(self.owned) >= target: break
+                shard = (self._offset + i) % self.shards
+                if shard in self.owned: continue
+                if await self._conn.fetchval('SELECT pg_try_advisory_lock($1, $2);', SHARD_LOCK_NAMESPACE, shard):
+                    self.owned.add(shard)
+                    claimed.append(shard)
+            held = await self._conn.fetchval('''
+                SELECT count(DISTINCT objid) FROM pg_locks
+                WHERE locktype = 'advisory' AND granted AND classid = $1::int::oid AND objsubid = 2
+                  AND database = (SELECT oid FROM pg_database WHERE datname = current_database());
+            ''', SHARD_LOCK_NAMESPACE)
+            self._settled = len(self.owned) >= target and held >= self.shards
+            if released or claimed:
+                print(f"[Shards] {workers} worker(s), giữ {len(self.owned)}/{self.shards} shard (nhận {claimed}, nhả {released}).")
+        except Exception as e:
+            # Mất kết nối là mất khóa: thôi quét mọi shard cho đến khi kết nối lại được
+            print(f"[Shards] Lỗi khi rebalance, bỏ toàn bộ shard: {e}")
+            await self._release_connection()
+
+    async def _release_connection(self):
+        conn, self._conn = self._conn, None
+        self.owned = set()
+        if conn is None:
+            return
+        try:
+            await conn.execute('SELECT pg_advisory_unlock_all();')
+        except Exception:
+            conn.terminate()
+        try:
+            await database.db_pool.release(conn)
+        except Exception as e:
+            print(f"[Shards] Không trả được kết nối về pool: {e}")
@@ -0,0 +1,71 @@
+# signal_engine.py
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import kernels
+
+
+# --- BỘ MÁY TÌM FRACTAL / PHÂN KỲ DẠNG VECTOR (NUMPY) ---
+def compute_delta(high, low, close, volume):
+    """Ước lượng delta khối lượng từ hình dạng nến (giống hệt công thức cũ)."""
+    if kernels.active():
+        return kernels.shape_delta(high, low, close, volume)
+    high, low = np.asarray(high, dtype=float), np.asarray(low, dtype=float)
+    close, volume = np.asarray(close, dtype=float), np.asarray(volume, dtype=float)
+    price_range = high - low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(price_range > 0, volume * (2 * close - low - high) / price_range, 0.0)
+    delta[np.isnan(delta)] = 0.0
+    return delta
+
+def pivot_masks(high, low, n):
+    """
+    Đánh dấu các đỉnh/đáy fractal bằng cửa sổ trượt tâm (2n+1) nến.
+    Chỉ các nến trong khoảng [n, len - n) mới có thể là pivot, giống vòng lặp cũ.
+    """
+    if kernels.active():
+        return kernels.pivot_masks(high, low, n)
+    size = len(high)
+    pivot_high = np.zeros(size, dtype=bool)
+    pivot_low = np.zeros(size, dtype=bool)
+    window = 2 * n + 1
+    if size < window:
+        return pivot_high, pivot_low
+    center = slice(n, size - n)
+    pivot_high[center] = high[center] >= sliding_window_view(high, window).max(axis=1)
+    pivot_low[center] = low[center] <= sliding_window_view(low, window).min(axis=1)
+    return pivot_high, pivot_low
+
+def find_fractals(high, low, close, ema50, n):
+    """Trả về chỉ số các fractal tăng (đỉnh trong uptrend) và fractal giảm (đáy trong downtrend)."""
+    pivot_high, pivot_low = pivot_masks(high, low, n)
+    # So sánh với NaN (giai đoạn khởi động của EMA) luôn False, giống logic cũ
+    up_fractals = np.flatnonzero(pivot_high & (close > ema50))
+    down_fractals = np.flatnonzero(pivot_low & (close < ema50))
+    return up_fractals, down_fractals
+
+def pair_divergences(fractals, price, cvd, bearish, max_gap):
+    """
+    Ghép từng cặp fractal liên tiếp (prev, last) và trả về mask các cặp có phân kỳ.
+    - bearish=True: giá tạo đỉnh cao hơn nhưng CVD (dương) thấp hơn -> SHORT.
+    - bearish=False: giá tạo đáy thấp hơn nhưng CVD (âm) cao hơn -> LONG.
+    Phần tử thứ i của mask ứng với cặp (fractals[i], fractals[i + 1]).
+    """
+    if len(fractals) < 2:
+        return np.zeros(0, dtype=bool)
+    prev_idx, last_idx = fractals[:-1], fractals[1:]
+    prev_cvd, last_cvd = cvd[prev_idx], cvd[last_idx]
+    if bearish:
+        mask = (price[last_idx] > price[prev_idx]) & (last_cvd < prev_cvd) & (last_cvd > 0) & (prev_cvd > 0)
+    else:
+        mask = (price[last_idx] < price[prev_idx]) & (last_cvd > prev_cvd) & (last_cvd < 0) & (prev_cvd < 0)
+    return mask & ((last_idx - prev_idx) < max_gap)
+
+def detect_divergences(high, low, close, ema50, cvd, n, max_gap):
+    """
+    Chạy toàn bộ pipeline fractal + phân kỳ CVD trên các mảng numpy.
+    Trả về (up_fractals, short_mask, down_fractals, long_mask).
+    """
+    up_fractals, down_fractals = find_fractals(high, low, close, ema50, n)
+    short_mask = pair_divergences(up_fractals, high, cvd, bearish=True, max_gap=max_gap)
+    long_mask = pair_divergences(down_fractals, low, cvd, bearish=False, max_gap=max_gap)
+    return up_fractals, short_mask, down_fractals, long_mask
@@ -0,0 +1,78 @@
+# signal_record.py
+from collections.abc import Mapping
+
+# Nhãn hiển thị của hướng tín hiệu: chỉ tạo khi đọc 'type', bản ghi chỉ giữ số +1 / -1
+LONG, SHORT = 1, -1
+SIGNAL_TYPES = {LONG: 'LONG 📈', SHORT: 'SHORT 📉'}
+DIRECTIONS = {label: direction for direction, label in SIGNAL_TYPES.items()}
+
+
+class Signal(Mapping):
+    """
+    Bản ghi tín hiệu gọn nhẹ (__slots__, không có __dict__) thay cho dict theo từng tín hiệu.
+    Vẫn đọc được như dict chỉ đọc (signal['type'], signal.get('tier'), dict(signal)) nên code định dạng,
+    lưu DB và thống kê không phải đổi; trường chưa gán thì không có trong mapping.
+    Bản ghi không sửa được sau khi tạo (gán thuộc tính báo lỗi): bản ghi mới được tạo bằng replace(),
+    nên bản ghi đã trả cho nơi khác (cache tín hiệu, kết quả backtest) không bị đổi ngầm.
+    """
+    __slots__ = (
+        'direction', 'timestamp', 'price', 'confirmation_timestamp', 'confirmation_price', 'timeframe',
+        'symbol', 'filter_timeframe', 'stoch_m15', 'stoch_h1', 'tier', 'win_rate',
+        'exit_reason', 'return_pct', 'bars_held',
+    )
+
+    def __init__(self, direction, timestamp, price, confirmation_timestamp, confirmation_price, timeframe='M15', **fields):
+        fields.update(direction=direction, timestamp=timestamp, price=price, confirmation_timestamp=confirmation_timestamp,
+                      confirmation_price=confirmation_price, timeframe=timeframe)
+        self.__setstate__((None, fields))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Signal chỉ đọc, dùng replace({name}=...) để tạo bản ghi mới")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Signal chỉ đọc, không xóa được trường {name}")
+
+    def __setstate__(self, state):
+        # Dùng cho cả __init__ lẫn pickle (gửi kết quả backtest giữa các tiến trình): state = (None, {slot: giá trị})
+        for name, value in state[1].items():
+            object.__setattr__(self, name, value)
+
+    @property
+    def type(self):
+        return SIGNAL_TYPES[self.direction]
+
+    def __getitem__(self, key):
+        if key == 'type':
+            return self.type
+        if key == 'direction' or key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        yield 'type'
+        for name in self.__slots__[1:]:
+            if hasattr(self, name):
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def replace(self, **fields):
+        """Bản sao với các trường được thay / thêm."""
+        values = {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+        values.update(fields)
+        return Signal(**values)
+
+    def __repr__(self):
+        return f"Signal({', '.join(f'{k}={v!r}' for k, v in self.items())})"
+
+
+def as_signal(signal):
+    """Chuyển tín hiệu dạng dict (ví dụ từ signal_outbox hay bản tham chiếu của benchmark) thành Signal."""
+    if isinstance(signal, Signal):
+        return signal
+    fields = dict(signal)
+    return Signal(direction=DIRECTIONS[fields.pop('type')], **fields)
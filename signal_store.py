@@ -0,0 +1,103 @@
+# signal_store.py
+from database import get_recent_signal_keys, insert_signals
+from clock import clock
+
+# --- CẤU HÌNH CHỐNG TRÙNG TÍN HIỆU ---
+DEDUP_TTL_SECONDS = 24 * 3600  # Thời gian giữ khóa tín hiệu trong cache bộ nhớ
+DEDUP_MAX_KEYS = 50_000        # Giới hạn số khóa trong cache
+
+
+def signal_key(signal):
+    return (signal['symbol'], int(signal['timestamp']), signal['timeframe'])
+
+
+class SignalStore:
+    """
+    Chống gửi trùng tín hiệu: cache TTL trong bộ nhớ cho đường quét nóng, bảng `signals`
+    trong Postgres để nhớ qua các lần restart. Tín hiệu đã gửi được ghi xuống DB theo lô
+    (INSERT ... ON CONFLICT) khi gọi flush, thường là cuối mỗi chu kỳ quét.
+    record_when_delivered: chỉ đánh dấu khi Telegram xác nhận đã gửi, gửi thất bại thì chu kỳ sau thử lại.
+    outbox=True (worker quét): flush đồng thời đưa tín hiệu mới vào signal_outbox để tiến trình bot gửi.
+    persist=False (replay): không đọc / ghi DB, các tín hiệu đã flush được giữ trong `history`.
+    """
+    def __init__(self, ttl=DEDUP_TTL_SECONDS, max_keys=DEDUP_MAX_KEYS, outbox=False, persist=True):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.outbox = outbox
+        self.persist = persist
+        self.history = []
+        self._seen = {}
+        self._in_flight = set()  # Khóa tín hiệu đang chờ Telegram gửi
+        self._pending = []
+        self._warmed_up = False
+
+    async def warm_up(self):
+        """Nạp các tín hiệu gần đây từ DB vào cache (chỉ chạy một lần mỗi tiến trình)."""
+        if self._warmed_up or not self.persist:
+            return
+        since = int(clock.time() * 1000) - self.ttl * 1000
+        keys = await get_recent_signal_keys(since)
+        expires_at = clock.monotonic() + self.ttl
+        for key in keys:
+            self._seen[key] = expires_at
+        self._warmed_up = True
+        print(f"[Signals] Đã nạp {len(keys)} tín hiệu gần đây từ database.")
+
+    def seen(self, signal):
+        key = signal_key(signal)
+        if key in self._in_flight:
+            return True
+        expires_at = self._seen.get(key)
+        if expires_at is None:
+            return False
+        if expires_at < clock.monotonic():
+            del self._seen[key]
+            return False
+        return True
+
+    def record(self, signal):
+        """Đánh dấu tín hiệu đã gửi và xếp vào lô chờ ghi DB."""
+        if len(self._seen) >= self.max_keys:
+            self._evict()
+        self._seen[signal_key(signal)] = clock.monotonic() + self.ttl
+        self._pending.append(signal)
+
+    def record_when_delivered(self, signal, delivered):
+        """
+        delivered: future của telegram_queue.enqueue. Trong lúc chờ gửi, tín hiệu được coi là đã thấy để không
+        xếp hàng trùng; gửi được thì record, không gửi được thì bỏ đánh dấu để lần quét sau gửi lại.
+        """
+        key = signal_key(signal)
+        self._in_flight.add(key)
+
+        def on_done(future):
+            self._in_flight.discard(key)
+            if not future.cancelled() and future.result():
+                self.record(signal)
+            else:
+                print(f"[Signals] Chưa gửi được tín hiệu {signal['symbol']}, sẽ thử lại ở lần quét sau.")
+        delivered.add_done_callback(on_done)
+
+    def _evict(self):
+        now = clock.monotonic()
+        for key in [k for k, expires_at in self._seen.items() if expires_at < now]:
+            del self._seen[key]
+        # Vẫn đầy thì bỏ các khóa cũ nhất (dict giữ thứ tự chèn)
+        overflow = len(self._seen) - self.max_keys + 1
+        for key in list(self._seen)[:max(0, overflow)]:
+            del self._seen[key]
+
+    async def flush(self):
+        """Ghi lô tín hiệu đang chờ xuống DB; lỗi thì giữ lại để thử ở lần sau."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, []
+        if not self.persist:
+            self.history.extend(batch)
+            return len(batch)
+        try:
+            return await insert_signals(batch, outbox=self.outbox)
+        except Exception as e:
+            print(f"[Signals] Không ghi được {len(batch)} tín hiệu vào database: {e}")
+            self._pending = batch + self._pending
+            return 0
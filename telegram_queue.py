@@ -0,0 +1,194 @@
+# telegram_queue.py
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+from telegram.error import RetryAfter, NetworkError, TimedOut, BadRequest, Forbidden
+import metrics
+from clock import clock
+
+logger = logging.getLogger(__name__)
+
+# --- GIỚI HẠN GỬI CỦA TELEGRAM ---
+GLOBAL_PER_SECOND = 30        # Tối đa ~30 tin/giây cho toàn bot
+CHAT_MIN_INTERVAL = 1.0       # Tối đa 1 tin/giây trong một chat
+CHAT_PER_MINUTE = 20          # Tối đa 20 tin/phút trong một group/channel
+MAX_SEND_RETRIES = 5
+RETRY_BASE_SECONDS = 2        # Lỗi mạng: chờ 2, 4, 8... giây trước khi thử lại
+DIGEST_WINDOW_SECONDS = 1.0   # Gom các tin đến trong khoảng này thành một tin tổng hợp
+DIGEST_MAX_CHARS = 4000       # Telegram giới hạn 4096 ký tự mỗi tin
+DIGEST_SEPARATOR = "\n\n━━━━━━━━━━━━━━━\n\n"
+
+
+class TelegramQueue:
+    """
+    Hàng đợi tin nhắn gửi đi với một task gửi chạy nền.
+    Bộ quét chỉ gọi `enqueue` (không chờ mạng); task gửi gom các tin cùng chat đến gần nhau
+    thành tin tổng hợp, tuân thủ giới hạn tốc độ toàn cục / từng chat của Telegram
+    và thử lại theo retry_after khi bị 429.
+    """
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._bot = None
+        self._task = None
+        self._global_sent = deque()
+        self._chat_sent = {}
+        self._closed = False
+
+    def start(self, bot):
+        """Khởi động task gửi (cả sau stop(), ví dụ mỗi lần replay)."""
+        self._closed = False
+        self._ensure_running(bot)
+
+    def _ensure_running(self, bot):
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, bot, chat_id, text, parse_mode='HTML', digest=True):
+        """
+        Thêm tin vào hàng đợi và trả về ngay một Future: True khi tin (hoặc tin tổng hợp chứa nó) đã được
+        Telegram nhận, False nếu bị bỏ. Task gửi được khởi động ở lần gọi đầu tiên.
+        digest=False: luôn gửi thành tin riêng, không gộp với tin khác.
+        Sau stop() tin bị bỏ (không khởi động lại task gửi mà không ai dừng).
+        """
+        delivered = asyncio.get_running_loop().create_future()
+        if self._closed:
+            logger.warning("Hàng đợi Telegram đã dừng, bỏ tin mới.")
+            metrics.TELEGRAM_MESSAGES.inc(result='dropped')
+            delivered.set_result(False)
+            return delivered
+        self._ensure_running(bot)
+        self._queue.put_nowait({'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode, 'digest': digest, 'delivered': delivered})
+        metrics.TELEGRAM_QUEUE_DEPTH.set(self._queue.qsize())
+        return delivered
+
+    def pending(self):
+        return self._queue.qsize()
+
+    async def join(self):
+        """Chờ đến khi mọi tin trong hàng đợi đã được gửi (hoặc bỏ sau khi hết lượt thử)."""
+        await self._queue.join()
+
+    async def stop(self, timeout=10):
+        """Gửi nốt các tin còn lại (tối đa `timeout` giây) rồi dừng task gửi; enqueue sau đó bị bỏ qua."""
+        self._closed = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Còn {self._queue.qsize()} tin Telegram chưa gửi khi dừng.")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while not self._queue.empty():
+            _resolve([self._queue.get_nowait()['delivered']], False)
+            self._queue.task_done()
+        # Trạng thái mới cho lần start() sau: asyncio.Queue gắn với event loop đã dùng nó,
+        # mốc giới hạn tốc độ theo đồng hồ lúc đó (replay dùng đồng hồ ảo)
+        self._queue = asyncio.Queue()
+        self._global_sent.clear()
+        self._chat_sent.clear()
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            await clock.sleep(DIGEST_WINDOW_SECONDS)
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                for message in coalesce(batch):
+                    _resolve(message['delivered'], await self._send(message))
+            finally:
+                # Tin chưa gửi xong khi task bị hủy được báo là bị bỏ
+                _resolve([item['delivered'] for item in batch], False)
+                for _ in batch:
+                    self._queue.task_done()
+                metrics.TELEGRAM_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _wait_for_slot(self, chat_id):
+        chat_sent = self._chat_sent.setdefault(chat_id, deque())
+        while True:
+            now = clock.monotonic()
+            while self._global_sent and now - self._global_sent[0] >= 1:
+                self._global_sent.popleft()
+            while chat_sent and now - chat_sent[0] >= 60:
+                chat_sent.popleft()
+            wait = 0.0
+            if len(self._global_sent) >= GLOBAL_PER_SECOND:
+                wait = max(wait, 1 - (now - self._global_sent[0]))
+            if chat_sent:
+                wait = max(wait, CHAT_MIN_INTERVAL - (now - chat_sent[-1]))
+            if len(chat_sent) >= CHAT_PER_MINUTE:
+                wait = max(wait, 60 - (now - chat_sent[0]))
+            if wait <= 0:
+                self._global_sent.append(now)
+                chat_sent.append(now)
+                return
+            await clock.sleep(wait)
+
+    async def _send(self, message):
+        for attempt in range(MAX_SEND_RETRIES + 1):
+            await self._wait_for_slot(message['chat_id'])
+            try:
+                await self._bot.send_message(chat_id=message['chat_id'], text=message['text'], parse_mode=message['parse_mode'])
+                metrics.TELEGRAM_MESSAGES.inc(result='sent')
+                return True
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+                logger.warning(f"Telegram flood limit, chờ {delay:.1f}s rồi gửi lại...")
+                metrics.TELEGRAM_MESSAGES.inc(result='retry')
+                await clock.sleep(delay)
+            except (BadRequest, Forbidden) as e:
+                # Lỗi nội dung / quyền: gửi lại cũng không thành công
+                logger.error(f"❌ Gửi tin Telegram thất bại, bỏ qua: {e}")
+                break
+            except (TimedOut, NetworkError) as e:
+                if attempt == MAX_SEND_RETRIES: break
+                delay = RETRY_BASE_SECONDS * 2 ** attempt
+                logger.warning(f"Lỗi mạng khi gửi Telegram ({e}), thử lại sau {delay}s...")
+                metrics.TELEGRAM_MESSAGES.inc(result='retry')
+                await clock.sleep(delay)
+            except Exception as e:
+                logger.error(f"❌ Gửi tin Telegram thất bại, bỏ qua: {e}")
+                break
+        else:
+            logger.error("❌ Gửi tin Telegram thất bại sau nhiều lần thử, bỏ qua.")
+        metrics.TELEGRAM_MESSAGES.inc(result='dropped')
+        return False
+
+
+def _resolve(futures, delivered):
+    for future in futures:
+        if not future.done():
+            future.set_result(delivered)
+
+def coalesce(batch):
+    """
+    Gộp các tin cho phép digest của cùng (chat, parse_mode) thành tin tổng hợp không quá
+    DIGEST_MAX_CHARS ký tự, giữ nguyên thứ tự; tin quá dài hoặc digest=False được gửi riêng.
+    'delivered' của mỗi tin gửi đi là danh sách Future của các tin được gộp vào nó.
+    """
+    messages, open_digests = [], {}
+    for item in batch:
+        key = (item['chat_id'], item['parse_mode'])
+        current = open_digests.get(key)
+        if item['digest'] and current is not None and len(current['text']) + len(DIGEST_SEPARATOR) + len(item['text']) <= DIGEST_MAX_CHARS:
+            current['text'] += DIGEST_SEPARATOR + item['text']
+            current['delivered'].append(item['delivered'])
+            continue
+        message = dict(item, delivered=[item['delivered']])
+        messages.append(message)
+        if item['digest']:
+            open_digests[key] = message
+        else:
+            open_digests.pop(key, None)
+    return messages
+
+
+# Hàng đợi dùng chung cho toàn bộ bot
+telegram_queue = TelegramQueue()
@@ -0,0 +1,15 @@
+# tests/conftest.py
+import os
+import sys
+
+# config.py bắt buộc các biến môi trường này; test không gọi Telegram / Postgres thật
+os.environ.setdefault("TELEGRAM_TOKEN", "test-token")
+os.environ.setdefault("CHANNEL_ID", "test-channel")
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# CI không cài được pandas_ta thì dùng bản thay thế trong tests/stubs (chỉ các hàm bot dùng)
+try:
+    import pandas_ta  # noqa: F401
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stubs'))
@@ -0,0 +1,43 @@
+# tests/stubs/pandas_ta.py
+"""
+Bản thay thế tối thiểu của pandas_ta cho môi trường CI không cài được thư viện thật (conftest.py chỉ dùng khi
+`import pandas_ta` lỗi). Chỉ có ta.ema, ta.stoch và accessor df.ta.stoch mà bot dùng, viết lại bằng
+pandas rolling / ewm theo công thức của pandas_ta (không dùng indicators.py để phép đối chiếu vẫn có nghĩa).
+"""
+import numpy as np
+import pandas as pd
+
+
+def ema(close, length=10, **kwargs):
+    """Nến thứ `length` là SMA của `length` nến đầu, sau đó ewm(adjust=False) như ta.ema(presma=True)."""
+    close = pd.Series(close, dtype=float).copy()
+    if len(close) < length:
+        return None
+    seed = close.iloc[:length].mean()
+    close.iloc[:length - 1] = np.nan
+    close.iloc[length - 1] = seed
+    return close.ewm(span=length, adjust=False).mean()
+
+def _sma_from_first_valid(series, length):
+    first = series.first_valid_index()
+    if first is None:
+        return series * np.nan
+    return series.loc[first:].rolling(length).mean().reindex(series.index)
+
+def stoch(high, low, close, k=14, d=3, smooth_k=3, **kwargs):
+    lowest_low = low.rolling(k).min()
+    highest_high = high.rolling(k).max()
+    price_range = (highest_high - lowest_low).replace(0, np.finfo(float).eps)
+    raw = 100 * (close - lowest_low) / price_range
+    stoch_k = _sma_from_first_valid(raw, smooth_k)
+    stoch_d = _sma_from_first_valid(stoch_k, d)
+    return pd.DataFrame({f"STOCHk_{k}_{d}_{smooth_k}": stoch_k, f"STOCHd_{k}_{d}_{smooth_k}": stoch_d})
+
+
+@pd.api.extensions.register_dataframe_accessor("ta")
+class AnalysisAccessor:
+    def __init__(self, df):
+        self._df = df
+
+    def stoch(self, k=14, d=3, smooth_k=3, **kwargs):
+        return stoch(self._df['high'], self._df['low'], self._df['close'], k=k, d=d, smooth_k=smooth_k)
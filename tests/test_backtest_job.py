@@ -0,0 +1,32 @@
+# tests/test_backtest_job.py
+import asyncio
+import bot_handler
+from signal_record import Signal, LONG
+from telegram_queue import telegram_queue
+
+
+class StatusMessage:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_text(self, text):
+        self.edits.append(text)
+
+
+def test_backtest_reports_summary_without_posting_signals_to_the_channel(monkeypatch):
+    signals = [Signal(LONG, 1_704_067_200_000 + i, 1.0, 1_704_070_800_000 + i, 1.1, symbol='BTCUSDT') for i in range(300)]
+
+    async def fake_backtest(on_progress=None, **options):
+        on_progress(1, 1, 'BTCUSDT', False)
+        return signals
+    monkeypatch.setattr(bot_handler, 'run_backtest_logic', fake_backtest)
+    monkeypatch.setattr(bot_handler, 'summarize_trades', lambda found: {'trades': len(found)})
+    monkeypatch.setattr(bot_handler, 'format_summary', lambda summary: f"Lệnh: {summary['trades']}")
+    enqueued = []
+    monkeypatch.setattr(telegram_queue, 'enqueue', lambda *args, **kwargs: enqueued.append(args))
+
+    status = StatusMessage()
+    options = bot_handler.parse_backtest_args(['BTCUSDT', 'days=365'])
+    asyncio.run(bot_handler._backtest_job(status, options))
+    assert enqueued == []
+    assert '300 tín hiệu' in status.edits[-1] and 'Lệnh: 300' in status.edits[-1]
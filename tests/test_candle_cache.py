@@ -0,0 +1,79 @@
+# tests/test_candle_cache.py
+import asyncio
+import pytest
+from benchmark import synthetic_klines
+from candle_cache import CandleCache, MAX_TOPUP_CANDLES
+from clock import clock, ReplayClock
+from kline_parser import KLINE_FIELDS, from_columns
+
+INTERVAL = '15m'
+INTERVAL_MS = 15 * 60_000
+LIMIT = 200
+
+
+class FakeRest:
+    """Trả các nến đã mở tại clock.time() như REST (nến cuối đang chạy), ghi lại các request."""
+    def __init__(self, data):
+        self.data, self.calls, self.drop = data, [], None
+
+    async def fetch(self, symbol, interval, limit=300, start_time=None, end_time=None):
+        self.calls.append((limit, start_time))
+        visible = self.data[self.data['timestamp'] <= int(clock.time() * 1000)]
+        if self.drop is not None:
+            visible = visible[visible['timestamp'] != self.drop]
+        if start_time is not None:
+            return visible[visible['timestamp'] >= start_time][:limit]
+        return visible[-limit:]
+
+
+@pytest.fixture
+def rest():
+    df = synthetic_klines(600, seed=4)
+    data = from_columns({name: df[name].to_numpy() for name in KLINE_FIELDS}, len(df))
+    yield FakeRest(data)
+    clock.reset()
+
+def at_candle(rest, index):
+    """Đồng hồ ở 15 giây sau khi nến `index` mở."""
+    clock.install(ReplayClock(int(rest.data['timestamp'][index]) / 1000 + 15))
+
+
+def test_cache_tops_up_only_new_candles(rest):
+    cache = CandleCache(rest.fetch)
+    at_candle(rest, 300)
+    first = asyncio.run(cache.get('BTCUSDT', INTERVAL, LIMIT))
+    at_candle(rest, 303)
+    topped = asyncio.run(cache.get('BTCUSDT', INTERVAL, LIMIT))
+    assert rest.calls == [(LIMIT, None), (MAX_TOPUP_CANDLES, int(first['timestamp'][-1]))]
+    assert topped['timestamp'].tolist() == rest.data['timestamp'][104:304].tolist()
+    # Nến đang chạy lần trước được thay bằng bản mới, mảng đã trả ra không bị đổi
+    assert (topped[-4:] == rest.data[300:304]).all() and first['timestamp'][-1] == rest.data['timestamp'][300]
+    assert not topped.flags.writeable
+
+
+def test_cache_reloads_on_gap_or_long_absence(rest):
+    cache = CandleCache(rest.fetch)
+    at_candle(rest, 300)
+    asyncio.run(cache.get('BTCUSDT', INTERVAL, LIMIT))
+    rest.drop = int(rest.data['timestamp'][302])
+    at_candle(rest, 303)
+    reloaded = asyncio.run(cache.get('BTCUSDT', INTERVAL, LIMIT))
+    assert rest.calls[-2:] == [(MAX_TOPUP_CANDLES, int(rest.data['timestamp'][300])), (LIMIT, None)]
+    assert len(reloaded) == LIMIT
+
+    rest.drop = None
+    at_candle(rest, 303 + MAX_TOPUP_CANDLES)
+    reloaded = asyncio.run(cache.get('BTCUSDT', INTERVAL, LIMIT))
+    # Thiếu quá nhiều nến cho một request nhỏ: tải lại toàn bộ, không gọi top-up
+    assert rest.calls[-1] == (LIMIT, None)
+    assert reloaded['timestamp'][-1] == rest.data['timestamp'][303 + MAX_TOPUP_CANDLES]
+
+
+def test_new_listing_keeps_topping_up_until_the_limit(rest):
+    cache = CandleCache(rest.fetch)
+    at_candle(rest, 100)
+    assert len(asyncio.run(cache.get('BTCUSDT', INTERVAL, LIMIT))) == 101
+    at_candle(rest, 102)
+    grown = asyncio.run(cache.get('BTCUSDT', INTERVAL, LIMIT))
+    assert rest.calls[-1] == (MAX_TOPUP_CANDLES, int(rest.data['timestamp'][100]))
+    assert grown['timestamp'].tolist() == rest.data['timestamp'][:103].tolist()
@@ -0,0 +1,36 @@
+# tests/test_equivalence.py
+"""
+Đối chiếu tín hiệu của bản hiện tại với cài đặt tham chiếu (vòng lặp) trong benchmark.py trên dữ liệu
+tổng hợp có seed cố định, giống `python benchmark.py` nhưng chạy trong CI. Mọi backend chỉ báo
+(kernels.py) phải cho cùng tập tín hiệu.
+"""
+import pytest
+import benchmark
+import kernels
+import trading_logic as tl
+from benchmark import BENCH_SEED, synthetic_klines, verify_equivalence
+
+EQUIVALENCE_CANDLES = 3_000
+EQUIVALENCE_WINDOWS = 10  # Bản tham chiếu tìm fractal bằng vòng lặp pandas (~1s mỗi cửa sổ live)
+
+
+@pytest.fixture(scope='module')
+def synthetic_df():
+    return synthetic_klines(EQUIVALENCE_CANDLES, BENCH_SEED)
+
+
+@pytest.fixture(params=kernels.BACKENDS)
+def backend(request):
+    if request.param == 'numba':
+        pytest.importorskip('numba')
+    kernels.set_backend(request.param)
+    yield request.param
+    kernels.set_backend(tl.KERNEL_BACKEND)
+
+
+def test_signals_match_reference_implementation(synthetic_df, backend, monkeypatch):
+    monkeypatch.setattr(benchmark, 'VERIFY_WINDOWS', EQUIVALENCE_WINDOWS)
+    result = verify_equivalence('synthetic', synthetic_df)
+    assert result['backend'] == backend
+    assert result['signals'] > 0
+    assert result['mismatches'] == []
@@ -0,0 +1,40 @@
+# tests/test_indicators.py
+import numpy as np
+import pytest
+import trading_logic as tl
+from benchmark import synthetic_klines
+from indicators import IndicatorState
+
+FIRST_FRAME = 300
+
+
+def _state():
+    return IndicatorState(cvd_period=tl.CVD_PERIOD, ema_period=tl.EMA_TREND_PERIOD, stoch_k=tl.STOCH_K,
+                          stoch_smooth_k=tl.STOCH_SMOOTH_K, delta_method='shape')
+
+
+@pytest.mark.parametrize('start,end,carried', [
+    (296, 330, False),   # Khung mới chỉ trùng phần đuôi của trạng thái cũ: tính lại toàn bộ
+    (260, 330, False),   # Trùng ngắn hơn phần khởi động của Stoch: tính lại toàn bộ
+    (100, 330, True),    # Cửa sổ trượt: cắt đầu, thêm nến mới
+    (200, 301, True),    # Cửa sổ co lại, thêm một nến
+    (0, 330, True),      # Chỉ nối thêm nến
+])
+def test_incremental_update_matches_full_recompute(start, end, carried):
+    df = synthetic_klines(400, seed=5)
+    state = _state()
+    state.update(df.iloc[:FIRST_FRAME])
+    frame = df.iloc[start:end]
+    arrays = state.update(frame)
+
+    fresh = _state().update(frame)
+    for name in ('stoch_raw', 'stoch_k'):
+        np.testing.assert_allclose(arrays[name], fresh[name], rtol=1e-9, atol=1e-9, equal_nan=True)
+    # EMA mang trạng thái qua các chu kỳ nên khớp với tính lại trên toàn bộ lịch sử liền mạch,
+    # còn phần khởi động của khung vẫn là NaN như tính lại trên riêng khung đó
+    history = _state().update(df.iloc[:end]) if carried else {name: np.r_[np.full(start, np.nan), fresh[name]] for name in fresh}
+    for name in ('cvd', 'ema50'):
+        warm = ~np.isnan(fresh[name])
+        assert np.isnan(arrays[name][~warm]).all()
+        np.testing.assert_allclose(arrays[name][warm], history[name][start:][warm], rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(arrays['timestamp'], frame['timestamp'].to_numpy())
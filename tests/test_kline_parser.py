@@ -0,0 +1,15 @@
+# tests/test_kline_parser.py
+import numpy as np
+from benchmark import synthetic_klines, to_payload
+from kline_parser import KLINE_FIELDS, parse_kline_payload
+
+
+def test_payload_decodes_only_the_used_columns():
+    df = synthetic_klines(50, seed=2)
+    klines = parse_kline_payload(to_payload(df))
+    assert klines.dtype.names == KLINE_FIELDS
+    assert 'close_time' not in KLINE_FIELDS and 'quote_asset_volume' not in KLINE_FIELDS
+    np.testing.assert_array_equal(klines['timestamp'], df['timestamp'].to_numpy())
+    for name in KLINE_FIELDS[1:]:
+        np.testing.assert_allclose(klines[name], df[name].to_numpy(), rtol=1e-15)
+    assert len(parse_kline_payload(b'[]')) == 0
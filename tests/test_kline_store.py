@@ -0,0 +1,81 @@
+# tests/test_kline_store.py
+import asyncio
+import pandas as pd
+import pytest
+import kline_store
+import trading_logic as tl
+from benchmark import synthetic_klines
+from kline_store import KlineStore, update_store
+
+INTERVAL_MS = 15 * 60_000
+NOW_MS = 1_760_000_400_000  # Đầu một nến 15m, cố định để số nến trong cửa sổ `history_days` không phụ thuộc giờ chạy
+
+
+def klines_until_now(candles):
+    """Nến 15m liên tiếp, nến cuối vừa đóng tại NOW_MS."""
+    df = synthetic_klines(candles, seed=3)
+    shift = NOW_MS - candles * INTERVAL_MS - int(df['timestamp'].iloc[0])
+    df['timestamp'] += shift
+    df['close_time'] += shift
+    return df
+
+
+class FakeBinance:
+    """get_klines giả: trả các nến trong khoảng yêu cầu, ném lỗi ở các lần gọi trong `fail_calls`."""
+    def __init__(self, df, fail_calls=()):
+        self.df, self.fail_calls, self.calls = df, set(fail_calls), []
+
+    async def get_klines(self, symbol, interval, limit=300, start_time=None, end_time=None, raise_errors=False):
+        self.calls.append((start_time, end_time))
+        if len(self.calls) in self.fail_calls:
+            raise ConnectionError("mất kết nối")
+        df = self.df
+        if start_time is not None:
+            return df[df['timestamp'] >= start_time].head(limit).reset_index(drop=True)
+        if end_time is not None:
+            df = df[df['timestamp'] <= end_time]
+        return df.tail(limit).reset_index(drop=True)
+
+
+@pytest.fixture
+def binance(monkeypatch):
+    monkeypatch.setattr(kline_store, 'PAGE_LIMIT', 100)
+    monkeypatch.setattr(kline_store, 'RETRY_BASE_SECONDS', 0)
+    monkeypatch.setattr(kline_store, '_now_ms', lambda: NOW_MS)
+
+    def install(df, fail_calls=()):
+        fake = FakeBinance(df, fail_calls)
+        monkeypatch.setattr(tl, 'get_klines', fake.get_klines)
+        return fake
+    return install
+
+
+def test_failed_page_is_raised_and_nothing_is_written(tmp_path, binance):
+    fake = binance(klines_until_now(350), fail_calls=range(2, 2 + kline_store.FETCH_RETRIES + 1))
+    store = KlineStore(tmp_path)
+    with pytest.raises(ConnectionError):
+        asyncio.run(update_store(store, 'BTCUSDT', '15m', history_days=3))
+    assert store.months('BTCUSDT', '15m') == []
+    assert len(fake.calls) == 2 + kline_store.FETCH_RETRIES
+
+
+def test_transient_error_is_retried(tmp_path, binance):
+    df = klines_until_now(350)
+    binance(df, fail_calls=[2])
+    store = KlineStore(tmp_path)
+    added = asyncio.run(update_store(store, 'BTCUSDT', '15m', history_days=3))
+    assert added == 3 * 96
+    assert store.load('BTCUSDT', '15m')['timestamp'].tolist() == df['timestamp'].iloc[-added:].tolist()
+
+
+def test_update_backfills_window_before_stored_data(tmp_path, binance):
+    df = klines_until_now(350)
+    binance(df)
+    store = KlineStore(tmp_path)
+    asyncio.run(update_store(store, 'BTCUSDT', '15m', history_days=1))
+    assert len(store.load('BTCUSDT', '15m')) == 96
+    added = asyncio.run(update_store(store, 'BTCUSDT', '15m', history_days=3))
+    assert added == 2 * 96
+    stored = store.load('BTCUSDT', '15m')['timestamp']
+    assert stored.tolist() == df['timestamp'].iloc[-3 * 96:].tolist()
+    assert stored.diff().dropna().eq(INTERVAL_MS).all()
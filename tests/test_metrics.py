@@ -0,0 +1,53 @@
+# tests/test_metrics.py
+import asyncio
+import aiohttp
+import metrics
+import trading_logic as tl
+
+
+def _stage_sum(name):
+    return metrics.STAGE_SECONDS._values.get((name,), {}).get('sum', 0.0)
+
+
+def test_rate_limit_wait_is_not_reported_as_fetch_time(monkeypatch):
+    async def slow_acquire(weight):
+        await asyncio.sleep(0.2)
+
+    async def fetch(client, params, spot=False):
+        return b'[]'
+    monkeypatch.setattr(tl.weight_limiter, 'acquire', slow_acquire)
+    monkeypatch.setattr(tl, 'fetch_klines_payload', fetch)
+    monkeypatch.setattr(tl, 'record_used_weight', lambda client: None)
+    waited, fetched = _stage_sum('rate_limit'), _stage_sum('fetch')
+    assert asyncio.run(tl._request_klines(object(), 'BTCUSDT', '15m', 100)) == b'[]'
+    assert _stage_sum('rate_limit') - waited >= 0.2
+    assert _stage_sum('fetch') - fetched < 0.1
+
+
+def test_metrics_endpoint_renders_prometheus_text():
+    registry = metrics.Registry()
+    errors = registry.register(metrics.Counter('errors_total', 'Lỗi', ['error']))
+    latency = registry.register(metrics.Histogram('latency_seconds', 'Độ trễ', buckets=(0.1, 1)))
+    errors.inc(error='Value"Error\n')
+    latency.observe(0.5)
+    latency.observe(2)
+    assert registry.render().splitlines() == [
+        '# HELP errors_total Lỗi', '# TYPE errors_total counter',
+        'errors_total{error="Value\\"Error\\n"} 1',
+        '# HELP latency_seconds Độ trễ', '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{le="0.1"} 0', 'latency_seconds_bucket{le="1"} 1',
+        'latency_seconds_bucket{le="+Inf"} 2', 'latency_seconds_sum 2.5', 'latency_seconds_count 2',
+    ]
+
+    async def scrape():
+        runner = await metrics.start_metrics_server('127.0.0.1', 0)
+        try:
+            port = runner.addresses[0][1]
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f'http://127.0.0.1:{port}/metrics') as response:
+                    return response.status, response.headers['Content-Type'], await response.text()
+        finally:
+            await runner.cleanup()
+    status, content_type, body = asyncio.run(scrape())
+    assert status == 200 and content_type == metrics.CONTENT_TYPE
+    assert '# TYPE scan_stage_seconds histogram' in body and body.endswith('\n')
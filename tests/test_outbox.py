@@ -0,0 +1,63 @@
+# tests/test_outbox.py
+import asyncio
+import contextlib
+import trading_logic as tl
+from telegram_queue import telegram_queue
+
+
+def outbox_signal(symbol):
+    return {'symbol': symbol, 'type': 'LONG 📈', 'timeframe': 'M15', 'filter_timeframe': 'H1', 'timestamp': 1_704_067_200_000,
+            'confirmation_timestamp': 1_704_070_800_000, 'price': 1.0, 'confirmation_price': 1.0,
+            'stoch_m15': 10.0, 'stoch_h1': 10.0, 'tier': 'M15+H1', 'win_rate': '80%'}
+
+
+class FlakyBot:
+    """Lần gửi đầu thất bại (Telegram từ chối), các lần sau thành công."""
+    def __init__(self):
+        self.messages, self.calls = [], 0
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("Telegram không nhận tin")
+        self.messages.append(text)
+
+
+def test_outbox_rows_are_deleted_only_after_delivery(monkeypatch):
+    rows = {1: outbox_signal('BTCUSDT'), 2: outbox_signal('ETHUSDT')}
+    claims, completed = [], []
+
+    async def claim_outbox_signals(limit, claim_timeout, max_attempts):
+        # Hàng chưa xóa được nhận lại ở lần đọc sau (như khi hết claim_timeout)
+        claims.append(sorted(rows))
+        return sorted(rows.items())[:limit]
+
+    async def complete_outbox_signals(ids):
+        completed.append(sorted(ids))
+        for outbox_id in ids:
+            rows.pop(outbox_id)
+
+    monkeypatch.setattr(tl, 'claim_outbox_signals', claim_outbox_signals)
+    monkeypatch.setattr(tl, 'complete_outbox_signals', complete_outbox_signals)
+    monkeypatch.setattr(tl, 'OUTBOX_POLL_SECONDS', 0.01)
+    monkeypatch.setattr('telegram_queue.DIGEST_WINDOW_SECONDS', 0.01)
+    monkeypatch.setattr('telegram_queue.CHAT_MIN_INTERVAL', 0)
+
+    async def run():
+        bot = FlakyBot()
+        telegram_queue.start(bot)
+        task = asyncio.create_task(tl.run_outbox_sender(bot))
+        async with asyncio.timeout(10):
+            while rows:
+                await asyncio.sleep(0.01)
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        await telegram_queue.stop()
+        return bot
+
+    bot = asyncio.run(run())
+    # Lần đầu cả hai tín hiệu nằm trong một tin tổng hợp bị từ chối: không xóa, lần sau gửi lại và xóa
+    assert claims[:2] == [[1, 2], [1, 2]]
+    assert completed == [[], [1, 2]]
+    assert sum(text.count('Token:') for text in bot.messages) == 2
@@ -0,0 +1,39 @@
+# tests/test_param_sweep.py
+import numpy as np
+import pytest
+import param_sweep
+from benchmark import synthetic_klines
+from backtester import to_arrays
+from param_sweep import IndicatorCache, evaluate_combo, expand_grid, rank_results
+from timeframes import resample_candles
+
+
+def trades_of(returns, start=0):
+    return (np.arange(start, start + len(returns), dtype=np.int64), np.array(returns, dtype=float))
+
+
+def test_ranking_by_expectancy_with_too_few_trades_last(monkeypatch):
+    monkeypatch.setattr(param_sweep, 'MIN_TRADES', 4)
+    combos = [{'name': 'few'}, {'name': 'good'}, {'name': 'bad'}, {'name': 'tie'}]
+    trades = [
+        [trades_of([1.0, 1.0])],                                  # Kỳ vọng cao nhất nhưng chỉ 2 lệnh
+        [trades_of([0.5, -0.25]), trades_of([0.25, 0.5], 10)],    # Lệnh của hai mã được gộp
+        [trades_of([-0.25, -0.25, 0.5, -0.25])],
+        [trades_of([0.75, -0.5, 0.75, 0.0])],
+    ]
+    table = rank_results(combos, trades)
+    assert table['name'].tolist() == ['good', 'tie', 'bad', 'few']
+    assert table.loc[0, 'trades'] == 4 and table.loc[0, 'expectancy'] == table.loc[1, 'expectancy'] == 0.25
+    # Cùng kỳ vọng thì profit factor cao hơn xếp trước
+    assert (table.loc[0, 'profit_factor'], table.loc[1, 'profit_factor']) == (5.0, 3.0)
+
+
+def test_grid_is_validated_and_default_combo_runs():
+    with pytest.raises(ValueError):
+        expand_grid({'unknown': [1]})
+    combos = expand_grid({'ema_period': [20, 50]})
+    assert [c['ema_period'] for c in combos] == [20, 50]
+    df = synthetic_klines(3000, seed=1)
+    cache = IndicatorCache(to_arrays(df), to_arrays(resample_candles(df, '15m', '1h')))
+    timestamps, returns = evaluate_combo(cache, combos[1])
+    assert len(timestamps) == len(returns) > 0 and np.all(np.diff(np.sort(timestamps)) >= 0)
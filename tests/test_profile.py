@@ -0,0 +1,46 @@
+# tests/test_profile.py
+import asyncio
+import pstats
+import metrics
+
+
+def scan_work():
+    return sum(i * i for i in range(20_000))
+
+def other_work():
+    return sum(i * i for i in range(20_000))
+
+
+def profiled_functions(profiler):
+    return {name for _, _, name in pstats.Stats(profiler).stats}
+
+
+def test_profile_coroutine_only_measures_the_profiled_task_and_its_children():
+    async def symbol(i):
+        await asyncio.sleep(0)
+        return scan_work()
+
+    async def scan():
+        return len(await asyncio.gather(*(symbol(i) for i in range(3))))
+
+    async def other_handler(stop):
+        while not stop.is_set():
+            other_work()
+            await asyncio.sleep(0)
+
+    async def run():
+        stop = asyncio.Event()
+        other = asyncio.create_task(other_handler(stop))
+        await asyncio.sleep(0)
+        result, profiler = await metrics.profile_coroutine(scan())
+        stop.set()
+        await other
+        # Task tạo sau khi profile xong không còn bị bọc
+        assert type(asyncio.create_task(asyncio.sleep(0)).get_coro()).__name__ == 'coroutine'
+        return result, profiler
+
+    result, profiler = asyncio.run(run())
+    names = profiled_functions(profiler)
+    assert result == 3
+    assert 'scan_work' in names
+    assert 'other_work' not in names
@@ -0,0 +1,94 @@
+# tests/test_replay.py
+"""
+Replay bộ quét live (poll) trên nến tổng hợp và đối chiếu với backtest bằng --check (compare_with_backtest).
+Nguồn replay trả nến đang chạy ở cuối như REST nên live xác nhận fractal trên tick đầu của nến xác nhận;
+khi nến đó đóng và phá fractal (backtest thấy), --check phải báo sai khác.
+"""
+import asyncio
+import numpy as np
+import pytest
+import replay
+import trading_logic as tl
+from benchmark import synthetic_klines
+from kline_parser import KLINE_FIELDS, from_columns
+from signal_store import signal_key
+
+SYMBOL = 'BTCUSDT'
+INTERVAL = '15m'
+INTERVAL_MS = 15 * 60_000
+HOURS_BEFORE, HOURS_AFTER = 4, 6  # compare_with_backtest bỏ 1 nến H1 đầu và 2 nến H1 cuối khoảng replay
+
+
+@pytest.fixture
+def frames():
+    limit = tl.base_candle_limit(tl.SIGNAL_PIPELINES)
+    df = synthetic_klines(limit + 600, seed=1)
+    return {SYMBOL: from_columns({name: df[name].to_numpy() for name in KLINE_FIELDS}, len(df))}
+
+
+def first_backtest_signal(frames):
+    """Tín hiệu backtest đầu tiên có đủ nến khởi động cho cửa sổ live."""
+    earliest = frames[SYMBOL]['timestamp'][tl.base_candle_limit(tl.SIGNAL_PIPELINES)] + HOURS_BEFORE * 3_600_000
+    return next(s for s in replay.backtest_signals(frames, INTERVAL) if s['confirmation_timestamp'] >= earliest)
+
+def replay_check(frames, confirmation_ms):
+    start = confirmation_ms - HOURS_BEFORE * 3_600_000
+    end = confirmation_ms + HOURS_AFTER * 3_600_000
+    _, live, _ = asyncio.run(replay.replay(frames, INTERVAL, start, end))
+    return live, replay.compare_with_backtest(live, replay.backtest_signals(frames, INTERVAL), start, end)
+
+
+def test_replay_serves_open_candle_like_rest(frames):
+    source = replay.ReplaySource(frames, INTERVAL)
+    data = frames[SYMBOL]
+    now_ms = int(data['timestamp'][500]) + 15_000
+    replay.clock.install(replay.ReplayClock(now_ms / 1000, 1))
+    try:
+        rows = asyncio.run(source.fetch(SYMBOL, INTERVAL, limit=10))
+        topup = asyncio.run(source.fetch(SYMBOL, INTERVAL, limit=99, start_time=int(data['timestamp'][498])))
+    finally:
+        replay.clock.reset()
+    assert rows['timestamp'].tolist() == data['timestamp'][491:501].tolist()
+    assert np.array_equal(rows[:-1], data[491:500])
+    last = rows[-1]
+    assert last['open'] == last['high'] == last['low'] == last['close'] == data[500]['open'] and last['volume'] == 0
+    assert topup['timestamp'].tolist() == data['timestamp'][498:501].tolist()
+
+
+def test_replay_steps_every_cycle_and_restores_the_scanner(frames, monkeypatch):
+    monkeypatch.setattr(tl, 'WIN_RATE_SOURCE', 'backtest')
+    originals = {name: getattr(tl, name) for name in ('candle_cache', 'indicator_store', 'signal_store', 'watchlist_manager')}
+    calibrations = []
+    monkeypatch.setattr(tl, '_calibrate_win_rates', lambda: calibrations.append(1) or asyncio.sleep(0))
+    start = int(frames[SYMBOL]['timestamp'][tl.base_candle_limit(tl.SIGNAL_PIPELINES)])
+    end = start + HOURS_AFTER * 3_600_000
+    runs = [asyncio.run(replay.replay(frames, INTERVAL, start, end)) for _ in range(2)]
+    stats = runs[0][0]
+    assert stats['cycles'] == stats['expected_cycles'] and stats['missed_cycles'] == 0
+    # Đồng hồ ảo tiến theo sự kiện nên hai lần chạy cho cùng tín hiệu và tin nhắn
+    assert [dict(s) for s in runs[0][1]] == [dict(s) for s in runs[1][1]] and runs[0][2] == runs[1][2]
+    assert {name: getattr(tl, name) for name in originals} == originals and tl.WIN_RATE_SOURCE == 'backtest'
+    assert calibrations == []
+    assert replay.clock.source.__class__.__name__ == 'SystemClock'
+
+
+def test_check_agrees_then_reports_signal_repainted_by_the_confirmation_candle(frames):
+    signal = first_backtest_signal(frames)
+    live, check = replay_check(frames, signal['confirmation_timestamp'])
+    assert signal_key(signal) in {signal_key(s) for s in live}
+    assert check['compared'] >= 1 and not check['missing'] and not check['extra']
+
+    # Nến xác nhận đóng vượt đỉnh (SHORT) / thủng đáy (LONG) của pivot: backtest không còn fractal,
+    # còn live đã phát tín hiệu từ tick đầu của nến đó
+    data = frames[SYMBOL].copy()
+    ts = data['timestamp']
+    pivot = int(np.searchsorted(ts, signal['timestamp']))
+    confirm = int(np.searchsorted(ts, signal['confirmation_timestamp']))
+    if 'SHORT' in signal['type']:
+        data['high'][confirm] = data['high'][pivot] * 1.01
+    else:
+        data['low'][confirm] = data['low'][pivot] * 0.99
+    data.flags.writeable = False
+    live, check = replay_check({SYMBOL: data}, signal['confirmation_timestamp'])
+    assert signal_key(signal) in {signal_key(s) for s in live}
+    assert list(map(str, signal_key(signal))) in check['extra']
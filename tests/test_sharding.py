@@ -0,0 +1,96 @@
+# tests/test_sharding.py
+import asyncio
+import itertools
+import pytest
+import database
+from sharding import ShardCoordinator, shard_of
+
+SHARDS = 4
+
+
+class FakePostgres:
+    """Advisory lock của Postgres đủ cho ShardCoordinator: khóa thành viên (shared) và khóa shard theo kết nối."""
+    def __init__(self):
+        self.members = set()
+        self.shard_owner = {}
+        self._pids = itertools.count(1)
+
+    async def acquire(self):
+        return FakeConnection(self, next(self._pids))
+
+    async def release(self, conn):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, server, pid):
+        self.server, self.pid = server, pid
+
+    async def execute(self, query, *args):
+        server = self.server
+        if 'pg_advisory_lock_shared' in query:
+            server.members.add(self.pid)
+        elif 'pg_advisory_unlock_all' in query:
+            server.members.discard(self.pid)
+            server.shard_owner = {s: pid for s, pid in server.shard_owner.items() if pid != self.pid}
+        elif 'pg_advisory_unlock' in query:
+            assert server.shard_owner.pop(args[1]) == self.pid
+
+    async def fetchval(self, query, *args):
+        server = self.server
+        if 'pg_try_advisory_lock' in query:
+            if args[1] in server.shard_owner:
+                return False
+            server.shard_owner[args[1]] = self.pid
+            return True
+        if 'count(DISTINCT pid)' in query:
+            return len(server.members)
+        if 'count(DISTINCT objid)' in query:
+            return len(server.shard_owner)
+        raise AssertionError(query)
+
+
+@pytest.fixture
+def postgres(monkeypatch):
+    server = FakePostgres()
+    monkeypatch.setattr(database, 'db_pool', server)
+    return server
+
+
+def test_workers_split_shards_and_take_over_released_ones(postgres):
+    async def scenario():
+        first, second = ShardCoordinator(SHARDS), ShardCoordinator(SHARDS)
+        await first.rebalance()
+        assert first.owned == set(range(SHARDS)) and first._settled
+
+        # Worker thứ hai vào: chưa có shard trống nên chờ ở chu kỳ ngắn cho đến khi worker đầu nhả bớt
+        await second.rebalance()
+        assert second.owned == set() and not second._settled
+        await first.rebalance()
+        assert len(first.owned) == SHARDS // 2
+        await second.rebalance()
+        assert first.owned.isdisjoint(second.owned) and first.owned | second.owned == set(range(SHARDS))
+        assert first._settled is False and second._settled
+
+        symbols = [f"COIN{i}USDT" for i in range(50)]
+        assert sorted(first.filter(symbols) + second.filter(symbols)) == sorted(symbols)
+        assert all(shard_of(s, SHARDS) in second.owned for s in second.filter(symbols))
+
+        # Worker đầu dừng: khóa được nhả, worker còn lại nhận hết ở lần rebalance kế
+        await first.stop()
+        await second.rebalance()
+        assert second.owned == set(range(SHARDS)) and second._settled
+    asyncio.run(scenario())
+
+
+def test_lost_connection_drops_every_shard(postgres, monkeypatch):
+    async def scenario():
+        coordinator = ShardCoordinator(SHARDS)
+        await coordinator.rebalance()
+
+        async def broken(*args):
+            raise ConnectionError("mất kết nối")
+        monkeypatch.setattr(coordinator._conn, 'fetchval', broken)
+        await coordinator.rebalance()
+        assert coordinator.owned == set() and coordinator._conn is None
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+# tests/test_signal_record.py
+import copy
+import pickle
+import pytest
+from signal_record import Signal, LONG
+
+
+def test_signal_is_read_only_and_replace_returns_a_new_record():
+    signal = Signal(LONG, 1_704_067_200_000, 1.0, 1_704_070_800_000, 1.1, tier='M15')
+    with pytest.raises(AttributeError):
+        signal.symbol = 'BTCUSDT'
+    with pytest.raises(AttributeError):
+        del signal.tier
+    named = signal.replace(symbol='BTCUSDT')
+    assert named['symbol'] == 'BTCUSDT' and 'symbol' not in signal
+    assert dict(named) == {**dict(signal), 'symbol': 'BTCUSDT'}
+
+
+def test_signal_survives_pickle_and_copy():
+    # Kết quả backtest được gửi từ tiến trình con về bằng pickle
+    signal = Signal(LONG, 1, 1.0, 2, 1.1, symbol='BTCUSDT', win_rate='80%')
+    for restored in (pickle.loads(pickle.dumps(signal)), copy.deepcopy(signal)):
+        assert restored == signal
+        with pytest.raises(AttributeError):
+            restored.price = 2.0
@@ -0,0 +1,64 @@
+# tests/test_signal_store.py
+import asyncio
+import signal_store
+from clock import clock, ReplayClock
+from signal_record import Signal, LONG
+from signal_store import SignalStore
+
+
+def make_signal(timestamp=1_704_067_200_000):
+    return Signal(LONG, timestamp, 1.0, timestamp + 3_600_000, 1.1, symbol='BTCUSDT', timeframe='M15')
+
+
+def test_signal_is_recorded_only_after_delivery():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        store = SignalStore(persist=False)
+        failed, sent = make_signal(), make_signal(1_704_070_800_000)
+        failed_delivery, sent_delivery = loop.create_future(), loop.create_future()
+        store.record_when_delivered(failed, failed_delivery)
+        store.record_when_delivered(sent, sent_delivery)
+        # Đang chờ gửi: không xếp hàng trùng
+        assert store.seen(failed) and store.seen(sent)
+        failed_delivery.set_result(False)
+        sent_delivery.set_result(True)
+        await asyncio.sleep(0)
+        assert not store.seen(failed) and store.seen(sent)
+        assert await store.flush() == 1 and store.history == [sent]
+    asyncio.run(scenario())
+
+
+def test_dedup_keys_expire_after_ttl():
+    try:
+        clock.install(ReplayClock(1_000_000, 0))
+        store = SignalStore(ttl=60, persist=False)
+        signal = make_signal()
+        store.record(signal)
+        assert store.seen(signal)
+        clock.install(ReplayClock(1_000_061, 0))
+        assert not store.seen(signal)
+    finally:
+        clock.reset()
+
+
+def test_flush_writes_batches_and_keeps_them_after_a_database_error(monkeypatch):
+    batches = []
+
+    async def insert_signals(batch, outbox=False):
+        if not batches:
+            batches.append(None)
+            raise ConnectionError("database down")
+        batches.append((list(batch), outbox))
+        return len(batch)
+    monkeypatch.setattr(signal_store, 'insert_signals', insert_signals)
+
+    async def scenario():
+        store = SignalStore(outbox=True)
+        first, second = make_signal(), make_signal(1_704_070_800_000)
+        store.record(first)
+        assert await store.flush() == 0
+        store.record(second)
+        assert await store.flush() == 2
+        assert await store.flush() == 0
+    asyncio.run(scenario())
+    assert batches[1] == ([make_signal(), make_signal(1_704_070_800_000)], True)
@@ -0,0 +1,131 @@
+# tests/test_stream.py
+"""
+Chạy run_stream_checker với fake_kline_server phát lại một file kline đã ghi (.jsonl) và so các tín hiệu
+phát ra với tín hiệu mà bộ quét poll thấy trên cùng dữ liệu (nến đã đóng + nến đang chạy ở cuối).
+
+Fixture stream_btcusdt_15m.jsonl có định dạng combined stream của Binance: mỗi nến một message tick đầu
+(x=false) và một message đóng nến (x=true). Dữ liệu được sinh từ benchmark.synthetic_klines(520, seed=1)
+vì môi trường CI không gọi được Binance.
+"""
+import asyncio
+import json
+import contextlib
+import functools
+from pathlib import Path
+import numpy as np
+import websockets
+import trading_logic as tl
+from candle_cache import CandleCache
+from fake_kline_server import load_messages, make_handler
+from indicators import IndicatorStore
+from kline_parser import kline_row
+from kline_stream import KlineStream, parse_kline_message
+from signal_store import SignalStore, signal_key
+from telegram_queue import telegram_queue
+from timeframes import parse_pipelines, timeframe_label
+from watchlist_manager import WatchlistManager
+
+FIXTURE = Path(__file__).parent / 'fixtures' / 'stream_btcusdt_15m.jsonl'
+SYMBOL = 'BTCUSDT'
+BASE = '15m'
+HISTORY_CANDLES = 300  # Số nến nạp qua "REST" trước khi nhận stream
+TIMEOUT_SECONDS = 60
+
+
+class StubBot:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        self.messages.append(text)
+
+
+def recorded_candles():
+    """(các message, nến đã đóng, tick đầu của từng nến) theo thứ tự nến."""
+    messages = load_messages(FIXTURE)
+    closed, ticks = [], []
+    for message in messages:
+        _, _, row, is_closed = parse_kline_message(json.dumps(message))
+        (closed if is_closed else ticks).append(kline_row(row))
+    return messages, np.concatenate(closed), np.concatenate(ticks)
+
+def poll_signals(closed, ticks, limit, pipelines):
+    """
+    Tín hiệu bộ quét poll phát ra nếu chạy ngay sau mỗi nến đóng: dữ liệu REST là `limit` nến mà nến cuối
+    là tick đầu của nến kế tiếp. Dùng IndicatorStore riêng, lọc trùng như _evaluate_symbol.
+    """
+    store = IndicatorStore(**tl.indicator_store.params)
+    seen, signals = set(), []
+    for c in range(HISTORY_CANDLES, len(closed) - 1):
+        window = np.concatenate([closed[max(0, c + 2 - limit):c + 1], ticks[c + 1:c + 2]])
+        frames = tl._pipeline_frames(window, BASE, pipelines)
+        for signal_interval, filter_interval in pipelines:
+            signal_indicators = store.update(SYMBOL, signal_interval, frames[signal_interval])
+            filter_indicators = store.update(SYMBOL, filter_interval, frames[filter_interval])
+            signal = tl.find_latest_confirmed_signal(frames[signal_interval], signal_indicators, timeframe_label(signal_interval))
+            if signal is None: continue
+            signal = signal.replace(symbol=SYMBOL)
+            if signal_key(signal) in seen: continue
+            enriched = tl.enrich_signals([signal], signal_indicators, filter_indicators, timeframe_label(filter_interval))
+            if enriched:
+                seen.add(signal_key(signal))
+                signals.append(enriched[0])
+    return signals
+
+
+def test_stream_checker_matches_poll_signals(monkeypatch):
+    messages, closed, ticks = recorded_candles()
+    pipelines = parse_pipelines('15m:1h')
+    monkeypatch.setattr(tl, 'SIGNAL_PIPELINES', pipelines)
+    monkeypatch.setattr(tl, 'LIVE_CANDLE_LIMIT', HISTORY_CANDLES)
+    monkeypatch.setattr(tl, 'SIGNAL_MIN_BARS', 100)
+    limit = tl.base_candle_limit(pipelines)
+    # REST trả `limit` nến, nến cuối là nến đang chạy (tick đầu của nến HISTORY_CANDLES)
+    history = np.concatenate([closed[:HISTORY_CANDLES], ticks[HISTORY_CANDLES:HISTORY_CANDLES + 1]])
+    history.flags.writeable = False
+
+    async def fetch(symbol, interval, limit=300, start_time=None, end_time=None):
+        return history[-limit:]
+
+    # Stream bắt đầu từ message đóng của nến đang chạy trong dữ liệu REST
+    first_stream = 2 * HISTORY_CANDLES + 1
+    evaluated = []
+    evaluate_pipelines = tl._evaluate_pipelines
+
+    async def counting_evaluate(*args):
+        await evaluate_pipelines(*args)
+        evaluated.append(args[1])
+
+    monkeypatch.setattr(tl, '_evaluate_pipelines', counting_evaluate)
+    monkeypatch.setattr(tl, 'candle_cache', CandleCache(fetch))
+    monkeypatch.setattr(tl, 'indicator_store', IndicatorStore(**tl.indicator_store.params))
+    monkeypatch.setattr(tl, 'signal_store', SignalStore(persist=False))
+    monkeypatch.setattr(tl, 'watchlist_manager', WatchlistManager([SYMBOL]))
+
+    async def run():
+        bot = StubBot()
+        async with websockets.serve(make_handler(messages[first_stream:], 0), 'localhost', 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            monkeypatch.setattr(tl, 'KlineStream', functools.partial(KlineStream, url=f"ws://localhost:{port}/stream"))
+            telegram_queue.start(bot)
+            task = asyncio.create_task(tl.run_stream_checker(bot))
+            # Mỗi nến đóng trong stream (trừ nến cuối, chưa có tick kế tiếp) được đánh giá đúng một lần
+            expected_evaluations = len(closed) - 1 - HISTORY_CANDLES
+            async with asyncio.timeout(TIMEOUT_SECONDS):
+                while len(evaluated) < expected_evaluations:
+                    await asyncio.sleep(0.05)
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        await telegram_queue.stop()
+        # Như main.py: tín hiệu được đánh dấu khi gửi xong, ghi nốt sau khi xả hàng đợi
+        await tl.signal_store.flush()
+        return bot
+
+    bot = asyncio.run(run())
+    expected = poll_signals(closed, ticks, limit, pipelines)
+    emitted = tl.signal_store.history
+    assert expected, "fixture phải có tín hiệu trong phần stream"
+    assert [(signal_key(s), s['tier']) for s in emitted] == [(signal_key(s), s['tier']) for s in expected]
+    # telegram_queue có thể gộp nhiều tín hiệu vào một tin tổng hợp
+    assert sum(text.count('Token:') for text in bot.messages) == len(expected)
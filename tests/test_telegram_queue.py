@@ -0,0 +1,54 @@
+# tests/test_telegram_queue.py
+import asyncio
+from telegram.error import BadRequest
+import telegram_queue
+from telegram_queue import TelegramQueue
+
+
+class StubBot:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        self.messages.append(text)
+
+
+def test_enqueue_after_stop_does_not_restart_sender():
+    async def run():
+        queue, bot = TelegramQueue(), StubBot()
+        queue.enqueue(bot, 'channel', 'trước khi dừng')
+        await queue.stop()
+        queue.enqueue(bot, 'channel', 'sau khi dừng')
+        assert queue._task is None and queue.pending() == 0
+        queue.start(bot)
+        queue.enqueue(bot, 'channel', 'sau khi khởi động lại')
+        await queue.stop()
+        return bot.messages
+
+    assert asyncio.run(run()) == ['trước khi dừng', 'sau khi khởi động lại']
+
+
+class FailingBot(StubBot):
+    """Telegram từ chối mọi tin có chữ 'lỗi'."""
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        if 'lỗi' in text:
+            raise BadRequest("Message is malformed")
+        await super().send_message(chat_id, text, parse_mode)
+
+
+def test_enqueue_reports_delivery_of_digested_messages(monkeypatch):
+    monkeypatch.setattr(telegram_queue, 'DIGEST_WINDOW_SECONDS', 0.01)
+
+    async def run():
+        queue, bot = TelegramQueue(), FailingBot()
+        digested = [queue.enqueue(bot, 'channel', f'tín hiệu {i}') for i in range(3)]
+        separate = queue.enqueue(bot, 'channel', 'tin lỗi', digest=False)
+        results = await asyncio.gather(*digested, separate)
+        await queue.stop()
+        after_stop = await queue.enqueue(bot, 'channel', 'sau khi dừng')
+        return results, after_stop, bot.messages
+
+    results, after_stop, messages = asyncio.run(run())
+    assert results == [True, True, True, False]
+    assert after_stop is False
+    assert len(messages) == 1 and messages[0].count('tín hiệu') == 3
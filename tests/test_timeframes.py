@@ -0,0 +1,15 @@
+# tests/test_timeframes.py
+import pytest
+import trading_logic as tl
+from timeframes import parse_pipelines
+
+
+def test_parse_pipelines_rejects_signal_timeframe_without_enough_history():
+    with pytest.raises(ValueError, match="1h chỉ có 125 nến"):
+        parse_pipelines("5m:15m,15m:1h,1h:4h", tl.SIGNAL_MIN_BARS, tl.MAX_KLINE_LIMIT)
+
+
+def test_accepted_pipelines_fit_in_one_request():
+    for spec in ("15m:1h", "15m:1h,1h:4h", "5m:15m,15m:1h"):
+        pipelines = parse_pipelines(spec, tl.SIGNAL_MIN_BARS, tl.MAX_KLINE_LIMIT)
+        assert tl.base_candle_limit(pipelines) <= tl.MAX_KLINE_LIMIT
@@ -0,0 +1,57 @@
+# tests/test_trade_simulator.py
+import numpy as np
+import pytest
+from signal_record import Signal, LONG
+from trade_simulator import (EXIT_REASONS, MAX_HOLD_HOURS, hold_bars_for, measured_win_rates, performance_metrics,
+                             simulate_entries, simulate_trades, summarize_trades)
+
+HOUR_MS = 3_600_000
+
+
+def flat_arrays(candles, interval_ms):
+    close = np.full(candles, 100.0)
+    return {'timestamp': np.arange(candles, dtype=np.int64) * interval_ms, 'high': close + 0.1, 'low': close - 0.1, 'close': close}
+
+
+def test_time_exit_is_measured_in_hours_of_the_signal_timeframe():
+    assert hold_bars_for('15m') == MAX_HOLD_HOURS * 4
+    assert hold_bars_for('1h') == MAX_HOLD_HOURS
+    assert hold_bars_for('1d') == 1
+    arrays = flat_arrays(100, HOUR_MS)
+    signal = Signal(LONG, 0, 100.0, 10 * HOUR_MS, 100.0)
+    [trade] = simulate_trades([signal], arrays, max_hold_bars=hold_bars_for('1h'))
+    assert trade['exit_reason'] == 'time' and trade['bars_held'] == MAX_HOLD_HOURS
+
+
+def test_take_profit_stop_loss_and_open_trades():
+    arrays = flat_arrays(60, 15 * 60_000)
+    arrays['high'][5] = 102.5   # LONG vào tại nến 2: chạm TP 2% ở nến 5
+    arrays['low'][12] = 98.5    # LONG vào tại nến 10: chạm SL 1% ở nến 12
+    arrays['high'][22] = 103.0  # Cùng nến chạm cả TP và SL: tính là SL
+    arrays['low'][22] = 98.0
+    entries = np.array([2, 10, 20, 55])
+    reason, returns, bars = simulate_entries(entries, np.ones(4, bool), arrays, take_profit=0.02, stop_loss=0.01, max_hold_bars=10)
+    assert [EXIT_REASONS[r] for r in reason] == ['tp', 'sl', 'sl', 'open']
+    np.testing.assert_allclose(returns[:3], [0.02, -0.01, -0.01])
+    assert bars[:3].tolist() == [3, 2, 2] and np.isnan(returns[3])
+    # SHORT: giá giảm là có lời
+    reason, returns, _ = simulate_entries(np.array([2]), np.zeros(1, bool), {**arrays, 'high': arrays['close'] + 0.1}, 0.02, 0.01, 10)
+    assert EXIT_REASONS[reason[0]] == 'time' and returns[0] == 0.0
+
+
+def test_performance_metrics_and_summary():
+    metrics = performance_metrics([0.02, -0.01, 0.02, -0.01, -0.01])
+    assert metrics['trades'] == 5 and metrics['win_rate'] == pytest.approx(0.4)
+    assert metrics['expectancy'] == pytest.approx(0.002) and metrics['profit_factor'] == pytest.approx(4 / 3)
+    assert metrics['max_drawdown'] == pytest.approx(0.02) and metrics['total_return'] == pytest.approx(0.01)
+    assert performance_metrics([])['trades'] == 0
+
+    trades = [
+        {'type': 'LONG', 'tier': 'M15', 'confirmation_timestamp': 2, 'exit_reason': 'tp', 'return_pct': 0.02},
+        {'type': 'LONG', 'tier': 'M15', 'confirmation_timestamp': 1, 'exit_reason': 'sl', 'return_pct': -0.01},
+        {'type': 'SHORT', 'tier': 'M15+H1', 'confirmation_timestamp': 3, 'exit_reason': 'open', 'return_pct': float('nan')},
+    ]
+    summary = summarize_trades(trades)
+    assert summary['overall']['trades'] == 2 and summary['open_trades'] == 1
+    assert summary['buckets'][('LONG', 'M15')]['win_rate'] == 0.5
+    assert measured_win_rates(summary) == {'M15': '50%'}
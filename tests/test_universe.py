@@ -0,0 +1,36 @@
+# tests/test_universe.py
+import trading_logic as tl
+from benchmark import synthetic_klines
+from indicators import stoch
+from universe import liquid_symbols, stoch_extreme_mask, tradable_symbols
+
+OVERSOLD, OVERBOUGHT = 20, 80
+
+
+def test_prefilter_matches_full_stochastic_on_the_last_candle():
+    frames = [synthetic_klines(300, seed=seed) for seed in range(40)]
+    frames.append(synthetic_klines(tl.STOCH_K + tl.STOCH_SMOOTH_K - 2, seed=99))  # Không đủ nến cho Stoch
+    mask = stoch_extreme_mask(frames, tl.STOCH_K, tl.STOCH_SMOOTH_K, OVERSOLD, OVERBOUGHT)
+    expected = []
+    for df in frames:
+        last = stoch(df['high'].to_numpy(), df['low'].to_numpy(), df['close'].to_numpy(), tl.STOCH_K, tl.STOCH_SMOOTH_K)[1][-1]
+        expected.append(bool(last < OVERSOLD or last > OVERBOUGHT))
+    assert mask.tolist() == expected
+    assert 0 < mask.sum() < len(frames) - 1 and not mask[-1]
+
+
+def test_tradable_and_liquid_symbols():
+    info = {'symbols': [
+        {'symbol': 'BTCUSDT', 'status': 'TRADING', 'contractType': 'PERPETUAL', 'quoteAsset': 'USDT'},
+        {'symbol': 'ETHUSDT', 'status': 'TRADING', 'contractType': 'PERPETUAL', 'quoteAsset': 'USDT'},
+        {'symbol': 'XRPUSDT', 'status': 'TRADING', 'contractType': 'PERPETUAL', 'quoteAsset': 'USDT'},
+        {'symbol': 'BTCUSDT_250627', 'status': 'TRADING', 'contractType': 'CURRENT_QUARTER', 'quoteAsset': 'USDT'},
+        {'symbol': 'ETHBTC', 'status': 'TRADING', 'contractType': 'PERPETUAL', 'quoteAsset': 'BTC'},
+        {'symbol': 'OLDUSDT', 'status': 'SETTLING', 'contractType': 'PERPETUAL', 'quoteAsset': 'USDT'},
+    ]}
+    symbols = tradable_symbols(info)
+    assert symbols == ['BTCUSDT', 'ETHUSDT', 'XRPUSDT']
+    tickers = [{'symbol': 'BTCUSDT', 'quoteVolume': '9e9'}, {'symbol': 'XRPUSDT', 'quoteVolume': '2e8'},
+               {'symbol': 'ETHUSDT', 'quoteVolume': '5e7'}]
+    assert liquid_symbols(symbols, tickers, 1e8) == ['BTCUSDT', 'XRPUSDT']
+    assert liquid_symbols(symbols, [], 0) == symbols
@@ -0,0 +1,32 @@
+# tests/test_win_rates.py
+import asyncio
+import backtester
+import trading_logic as tl
+
+
+def trade(side, tier, return_pct, timestamp):
+    return {'type': side, 'tier': tier, 'exit_reason': 'tp' if return_pct > 0 else 'sl',
+            'return_pct': return_pct, 'confirmation_timestamp': timestamp}
+
+
+def test_calibrate_win_rates_replaces_displayed_rates(monkeypatch):
+    trades = [
+        trade('LONG 📈', 'M15', 0.02, 1), trade('SHORT 📉', 'M15', -0.01, 2),
+        trade('LONG 📈', 'M15', -0.01, 3), trade('SHORT 📉', 'M15', -0.01, 4),
+        trade('LONG 📈', 'M15+H1', 0.02, 5), trade('SHORT 📉', 'M15+H1', 0.02, 6),
+        trade('SHORT 📉', 'M15+H1', -0.01, 7),
+    ]
+    requested = []
+
+    async def run_backtest_logic(symbols=None):
+        requested.append(symbols)
+        return trades
+
+    monkeypatch.setattr(backtester, 'run_backtest_logic', run_backtest_logic)
+    monkeypatch.setattr(tl, 'WIN_RATES', dict(tl.WIN_RATES))
+    measured = asyncio.run(backtester.calibrate_win_rates(['BTCUSDT']))
+    assert requested == [['BTCUSDT']]
+    assert measured == {'M15': '25%', 'M15+H1': '67%'}
+    assert tl.WIN_RATES == measured
+    signal = tl.apply_stoch_filter(tl.Signal(tl.LONG, 0, 1.0, 0, 1.0), 10.0, 10.0, filter_timeframe='H1')
+    assert signal['win_rate'] == '67%'
@@ -0,0 +1,93 @@
+# timeframes.py
+import numpy as np
+import pandas as pd
+from binance.helpers import interval_to_milliseconds
+from kline_parser import has_field, from_columns
+
+# --- NHÃN HIỂN THỊ CỦA CÁC KHUNG THỜI GIAN ---
+TIMEFRAME_LABELS = {
+    '1m': 'M1', '3m': 'M3', '5m': 'M5', '15m': 'M15', '30m': 'M30',
+    '1h': 'H1', '2h': 'H2', '4h': 'H4', '6h': 'H6', '8h': 'H8', '12h': 'H12', '1d': 'D1',
+}
+
+
+def timeframe_label(interval):
+    return TIMEFRAME_LABELS.get(interval, interval)
+
+def parse_pipelines(spec, min_bars=None, max_base_candles=None):
+    """
+    Đọc cấu hình dạng "15m:1h,1h:4h": mỗi cặp là (khung tìm tín hiệu, khung lọc Stoch).
+    Khung lọc phải lớn hơn hoặc bằng khung tín hiệu và là bội số của nó.
+    min_bars / max_base_candles: báo lỗi nếu `max_base_candles` nến khung gốc (khung nhỏ nhất) không
+    resample ra đủ `min_bars` nến cho mọi khung tín hiệu, ví dụ "5m:15m,1h:4h" với 1500 nến 5m chỉ có 125 nến 1h.
+    """
+    pipelines = []
+    for item in spec.split(','):
+        signal_interval, filter_interval = (part.strip() for part in item.split(':'))
+        for interval in (signal_interval, filter_interval):
+            if interval not in TIMEFRAME_LABELS:
+                raise ValueError(f"Khung thời gian không hỗ trợ: {interval}")
+        if interval_to_milliseconds(filter_interval) % interval_to_milliseconds(signal_interval):
+            raise ValueError(f"Khung lọc {filter_interval} phải là bội số của khung tín hiệu {signal_interval}")
+        pipelines.append((signal_interval, filter_interval))
+    if min_bars and max_base_candles:
+        base = base_interval(pipelines)
+        for signal_interval, _ in pipelines:
+            available = max_base_candles * interval_to_milliseconds(base) // interval_to_milliseconds(signal_interval)
+            if available < min_bars:
+                raise ValueError(
+                    f"Khung tín hiệu {signal_interval} chỉ có {available} nến từ {max_base_candles} nến {base} (cần {min_bars}); "
+                    f"bỏ khung nhỏ {base} hoặc tách {signal_interval} sang cấu hình riêng"
+                )
+    return pipelines
+
+def base_interval(pipelines):
+    """Khung nhỏ nhất trong các pipeline: chỉ khung này được tải, các khung khác resample từ nó."""
+    intervals = {i for pipeline in pipelines for i in pipeline}
+    return min(intervals, key=interval_to_milliseconds)
+
+
+# --- RESAMPLE NẾN TỪ KHUNG NHỎ LÊN KHUNG LỚN ---
+def resample_candles(df, source_interval, target_interval):
+    """
+    Gộp nến khung nhỏ thành khung lớn theo mốc thời gian UTC (giống cách Binance chia nến).
+    Nhóm đầu tiên bị bỏ nếu thiếu nến (bộ đệm bắt đầu giữa chừng), nhóm cuối được giữ
+    kể cả khi chưa đủ nến, tương đương nến đang chạy của REST.
+    Nhận DataFrame hoặc structured array (kline_parser) và trả về cùng kiểu.
+    """
+    if source_interval == target_interval or len(df) == 0:
+        return df
+    target_ms = interval_to_milliseconds(target_interval)
+    timestamp = np.asarray(df['timestamp'], dtype=np.int64)
+    bucket = timestamp // target_ms * target_ms
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    if timestamp[0] != bucket[0] and len(starts) > 1:
+        starts = starts[1:]
+    high = np.asarray(df['high'], dtype=float)
+    low = np.asarray(df['low'], dtype=float)
+    volume = np.asarray(df['volume'], dtype=float)
+    ends = np.r_[starts[1:], len(df)] - 1
+    out = {
+        'timestamp': bucket[starts],
+        'open': np.asarray(df['open'], dtype=float)[starts],
+        'high': np.maximum.reduceat(high[starts[0]:], starts - starts[0]),
+        'low': np.minimum.reduceat(low[starts[0]:], starts - starts[0]),
+        'close': np.asarray(df['close'], dtype=float)[ends],
+        'volume': np.add.reduceat(volume[starts[0]:], starts - starts[0]),
+    }
+    if has_field(df, 'taker_buy_base_asset_volume'):
+        taker = pd.to_numeric(df['taker_buy_base_asset_volume']) if isinstance(df, pd.DataFrame) else df['taker_buy_base_asset_volume']
+        taker = np.asarray(taker, dtype=float)
+        out['taker_buy_base_asset_volume'] = np.add.reduceat(taker[starts[0]:], starts - starts[0])
+    if isinstance(df, np.ndarray):
+        return from_columns(out, len(starts))
+    return pd.DataFrame(out)
+
+
+# --- AS-OF JOIN TRÊN MẢNG TIMESTAMP ĐÃ SẮP XẾP ---
+def asof_indices(source_timestamps, target_timestamps):
+    """
+    Với mỗi timestamp trong target, trả về chỉ số nến cuối cùng của source có timestamp <= nó
+    (-1 nếu không có). Tương đương source.loc[source.index <= ts].iloc[-1] nhưng O(log n).
+    """
+    return np.searchsorted(source_timestamps, target_timestamps, side='right') - 1
@@ -0,0 +1,131 @@
+# trade_simulator.py
+import numpy as np
+from binance.helpers import interval_to_milliseconds
+from signal_record import as_signal
+
+# --- CẤU HÌNH MÔ PHỎNG LỆNH ---
+TAKE_PROFIT_PCT = 0.02  # Chốt lời khi giá đi đúng hướng 2%
+STOP_LOSS_PCT = 0.01    # Cắt lỗ khi giá đi ngược 1%
+MAX_HOLD_HOURS = 12     # Đóng lệnh theo thời gian sau 12 giờ (48 nến M15, 12 nến H1...)
+
+
+def hold_bars_for(interval):
+    """Số nến của khung tín hiệu `interval` tương ứng MAX_HOLD_HOURS (ít nhất 1 nến)."""
+    return max(1, MAX_HOLD_HOURS * 3_600_000 // interval_to_milliseconds(interval))
+
+MAX_HOLD_BARS = hold_bars_for('15m')  # Mặc định cho mảng nến khung M15
+
+
+# --- MÔ PHỎNG LỆNH DẠNG VECTOR ---
+EXIT_REASONS = np.array(['open', 'sl', 'tp', 'time'])
+
+def simulate_entries(entry_idx, is_long, arrays, take_profit=TAKE_PROFIT_PCT, stop_loss=STOP_LOSS_PCT, max_hold_bars=MAX_HOLD_BARS):
+    """
+    Vào lệnh tại giá đóng cửa nến `entry_idx` và đi tiếp tối đa `max_hold_bars` nến (của chính mảng nến `arrays`,
+    tức khung tín hiệu) để tìm TP/SL.
+    Mọi lệnh được xử lý cùng lúc trên ma trận (số lệnh x số nến giữ lệnh).
+    Nếu TP và SL cùng chạm trong một nến thì tính là SL (giả định bảo thủ).
+    Trả về (mã lý do thoát theo EXIT_REASONS, lợi nhuận %, số nến giữ lệnh).
+    """
+    high, low, close = arrays['high'], arrays['low'], arrays['close']
+    last_bar = len(close) - 1
+    entry_idx = np.minimum(np.asarray(entry_idx), last_bar)
+    is_long = np.asarray(is_long, dtype=bool)
+    direction = np.where(is_long, 1.0, -1.0)
+    entry = close[entry_idx]
+
+    future_idx = entry_idx[:, None] + np.arange(1, max_hold_bars + 1)[None, :]
+    available = future_idx <= last_bar
+    future_idx = np.minimum(future_idx, last_bar)
+    future_high, future_low = high[future_idx], low[future_idx]
+
+    tp_price = entry * (1 + direction * take_profit)
+    sl_price = entry * (1 - direction * stop_loss)
+    tp_hit = np.where(is_long[:, None], future_high >= tp_price[:, None], future_low <= tp_price[:, None]) & available
+    sl_hit = np.where(is_long[:, None], future_low <= sl_price[:, None], future_high >= sl_price[:, None]) & available
+    first_tp = np.where(tp_hit.any(axis=1), tp_hit.argmax(axis=1), max_hold_bars)
+    first_sl = np.where(sl_hit.any(axis=1), sl_hit.argmax(axis=1), max_hold_bars)
+    bars_available = available.sum(axis=1)
+
+    is_sl = (first_sl < max_hold_bars) & (first_sl <= first_tp)
+    is_tp = (first_tp < max_hold_bars) & (first_tp < first_sl)
+    is_time = ~is_sl & ~is_tp & (bars_available == max_hold_bars)
+    time_exit_price = close[np.minimum(entry_idx + max_hold_bars, last_bar)]
+    exit_price = np.select([is_sl, is_tp, is_time], [sl_price, tp_price, time_exit_price], default=np.nan)
+    reason_code = np.select([is_sl, is_tp, is_time], [1, 2, 3], default=0)
+    bars_held = np.select([is_sl, is_tp, is_time], [first_sl + 1, first_tp + 1, max_hold_bars], default=bars_available)
+    returns = direction * (exit_price - entry) / entry
+    return reason_code, returns, bars_held
+
+def simulate_trades(signals, arrays, take_profit=TAKE_PROFIT_PCT, stop_loss=STOP_LOSS_PCT, max_hold_bars=MAX_HOLD_BARS):
+    """
+    Mô phỏng lệnh cho các tín hiệu (Signal hoặc dict) trên mảng nến khung tín hiệu, xem simulate_entries;
+    max_hold_bars tính theo nến của khung đó (hold_bars_for).
+    Trả về bản sao các tín hiệu kèm 'exit_reason' ('tp', 'sl', 'time' hoặc 'open'),
+    'return_pct' và 'bars_held'. Lệnh 'open' (chưa đủ dữ liệu để đóng) không tính vào thống kê.
+    """
+    if not signals:
+        return []
+    entry_idx = np.searchsorted(arrays['timestamp'], np.array([s['confirmation_timestamp'] for s in signals]))
+    is_long = np.array(['LONG' in s['type'] for s in signals])
+    reason_code, returns, bars_held = simulate_entries(entry_idx, is_long, arrays, take_profit, stop_loss, max_hold_bars)
+    return [
+        as_signal(signal).replace(exit_reason=str(EXIT_REASONS[reason_code[i]]), return_pct=float(returns[i]), bars_held=int(bars_held[i]))
+        for i, signal in enumerate(signals)
+    ]
+
+
+# --- THỐNG KÊ HIỆU QUẢ ---
+def performance_metrics(returns):
+    """Win rate, kỳ vọng, profit factor và max drawdown (cộng dồn % lợi nhuận) của một chuỗi lệnh."""
+    returns = np.asarray(returns, dtype=float)
+    if len(returns) == 0:
+        return {'trades': 0, 'win_rate': 0.0, 'expectancy': 0.0, 'profit_factor': 0.0, 'max_drawdown': 0.0, 'total_return': 0.0}
+    gross_profit = returns[returns > 0].sum()
+    gross_loss = -returns[returns < 0].sum()
+    equity = np.cumsum(returns)
+    peak = np.maximum.accumulate(np.concatenate([[0.0], equity]))[1:]
+    return {
+        'trades': len(returns),
+        'win_rate': float((returns > 0).mean()),
+        'expectancy': float(returns.mean()),
+        'profit_factor': float(gross_profit / gross_loss) if gross_loss > 0 else float('inf'),
+        'max_drawdown': float((peak - equity).max()),
+        'total_return': float(equity[-1]),
+    }
+
+def summarize_trades(signals):
+    """Thống kê tổng và theo từng nhóm (chiều lệnh, nhóm Stoch M15/H1), theo thứ tự thời gian xác nhận."""
+    closed = sorted((s for s in signals if s.get('exit_reason') not in (None, 'open')), key=lambda s: s['confirmation_timestamp'])
+    buckets = {}
+    for signal in closed:
+        buckets.setdefault((signal['type'], signal.get('tier', 'N/A')), []).append(signal['return_pct'])
+    return {
+        'overall': performance_metrics([s['return_pct'] for s in closed]),
+        'open_trades': sum(1 for s in signals if s.get('exit_reason') == 'open'),
+        'buckets': {key: performance_metrics(returns) for key, returns in sorted(buckets.items())},
+    }
+
+def measured_win_rates(summary):
+    """Tỷ lệ win đo được theo nhóm Stoch (gộp LONG/SHORT), cùng định dạng với WIN_RATES trong trading_logic."""
+    wins, totals = {}, {}
+    for (_, tier), metrics in summary['buckets'].items():
+        wins[tier] = wins.get(tier, 0) + metrics['win_rate'] * metrics['trades']
+        totals[tier] = totals.get(tier, 0) + metrics['trades']
+    return {tier: f"{wins[tier] / totals[tier] * 100:.0f}%" for tier in totals if totals[tier]}
+
+def _format_metrics(metrics):
+    return (f"{metrics['trades']} lệnh | Win {metrics['win_rate'] * 100:.1f}% | "
+            f"Kỳ vọng {metrics['expectancy'] * 100:+.2f}% | PF {metrics['profit_factor']:.2f} | "
+            f"MaxDD {metrics['max_drawdown'] * 100:.2f}%")
+
+def format_summary(summary):
+    lines = [
+        f"📊 Kết quả mô phỏng (TP {TAKE_PROFIT_PCT * 100:.1f}% / SL {STOP_LOSS_PCT * 100:.1f}% / tối đa {MAX_HOLD_HOURS} giờ)",
+        f"Tổng: {_format_metrics(summary['overall'])}",
+    ]
+    for (signal_type, tier), metrics in summary['buckets'].items():
+        lines.append(f"{signal_type} [{tier}]: {_format_metrics(metrics)}")
+    if summary['open_trades']:
+        lines.append(f"Lệnh chưa đóng (không tính): {summary['open_trades']}")
+    return "\n".join(lines)
@@ -1,5 +1,6 @@
 # trading_logic.py
 import asyncio
+import time
 from datetime import datetime, timedelta
 import pytz
 import pandas as pd
@@ -7,7 +8,33 @@ import numpy as np
 import pandas_ta as ta
 from binance.async_client import AsyncClient
 from binance.exceptions import BinanceAPIException
-from database import get_watchlist_from_db
+from watchlist_manager import watchlist_manager
+from candle_cache import CandleCache
+from indicators import IndicatorStore
+from signal_store import SignalStore
+from config import SCAN_MODE, SIGNAL_TIMEFRAMES, CVD_DELTA_METHOD, SCAN_UNIVERSE, UNIVERSE_MIN_QUOTE_VOLUME, SCAN_ROLE, SCAN_SHARDS, INDICATOR_BACKEND, WIN_RATE_SOURCE
+from timeframes import parse_pipelines, base_interval, resample_candles, asof_indices, timeframe_label
+from binance.helpers import interval_to_milliseconds
+from kline_stream import KlineStream
+from binance_client import (
+    get_binance_client,
+    weight_limiter,
+    kline_request_weight,
+    record_used_weight,
+    retry_after_seconds,
+    fetch_klines_payload,
+    MAX_RATE_LIMIT_RETRIES
+)
+from signal_engine import detect_divergences
+from cvd import check_delta_method, frame_delta
+from kline_parser import kline_array, kline_frame, parse_kline_payload, empty_klines
+from signal_record import Signal, LONG, SHORT, as_signal
+from universe import MarketUniverse, stoch_extreme_mask
+from sharding import ShardCoordinator
+from database import claim_outbox_signals, complete_outbox_signals
+import kernels
+import metrics
+from clock import clock
 
 # --- CẤU HÌNH ---
 TIMEFRAME_M15 = AsyncClient.KLINE_INTERVAL_15MINUTE
@@ -17,113 +44,457 @@ CVD_PERIOD = 24
 STOCH_K = 16
 STOCH_SMOOTH_K = 16
 STOCH_D = 8
+EMA_TREND_PERIOD = 50
+CVD_METHOD = check_delta_method(CVD_DELTA_METHOD) # 'shape' hoặc 'taker', xem cvd.py
+KERNEL_BACKEND = kernels.set_backend(INDICATOR_BACKEND) # 'numpy' hoặc 'numba', xem kernels.py
+# Ngưỡng Stochastic của bộ lọc tín hiệu
+STOCH_M15_OVERSOLD = 20
+STOCH_M15_OVERBOUGHT = 80
+STOCH_H1_OVERSOLD = 25
+STOCH_H1_OVERBOUGHT = 75
+DIVERGENCE_MAX_BARS = 30 # Khoảng cách tối đa (số nến) giữa 2 fractal để xét phân kỳ
 SCAN_DELAY_SECONDS = 15
+SCAN_CONCURRENCY = 10 # Số mã được quét đồng thời trong mỗi chu kỳ
+SIGNAL_FLUSH_SECONDS = 5 # Chế độ stream: chu kỳ ghi lô tín hiệu đã gửi xuống database
+OUTBOX_POLL_SECONDS = 2 # SCAN_ROLE=bot: chu kỳ đọc signal_outbox khi hàng đợi trống
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_CLAIM_TIMEOUT_SECONDS = 300 # Tín hiệu đã nhận mà chưa gửi xong sau ngần này giây được nhận lại (tiến trình bot chết giữa chừng)
+OUTBOX_MAX_ATTEMPTS = 5 # Số lần nhận tối đa một tín hiệu trong signal_outbox trước khi bỏ
 
 # <<< SỬA ĐỔI Ở ĐÂY: Tăng giới hạn dữ liệu để ổn định chỉ báo >>>
 LIVE_CANDLE_LIMIT = 1000
+SIGNAL_MIN_BARS = 250 # Số nến tối thiểu của khung tín hiệu sau khi resample
+MAX_KLINE_LIMIT = 1500 # Giới hạn số nến mỗi request của Binance Futures
+
+# Các pipeline (khung tín hiệu, khung lọc); chỉ khung nhỏ nhất được tải, khung lớn được resample.
+# Cấu hình mà một request MAX_KLINE_LIMIT nến khung gốc không đủ SIGNAL_MIN_BARS nến khung tín hiệu bị từ chối.
+SIGNAL_PIPELINES = parse_pipelines(SIGNAL_TIMEFRAMES, SIGNAL_MIN_BARS, MAX_KLINE_LIMIT)
+# Ghi đè pipeline theo từng mã, ví dụ {'BTCUSDT': parse_pipelines("5m:15m,15m:1h", SIGNAL_MIN_BARS, MAX_KLINE_LIMIT)}
+SYMBOL_PIPELINES = {}
+# Bật để đối chiếu chỉ báo tăng dần với pandas_ta tính lại toàn bộ mỗi chu kỳ (tốn CPU)
+INDICATOR_VERIFY = False
 BACKTEST_CANDLE_LIMIT = 1500
 
 
 # --- CÁC HÀM TIỆN ÍCH (KHÔNG ĐỔI) ---
-async def get_klines(symbol, interval, limit=300): # Mặc định vẫn là 300
-    # ... (giữ nguyên code của hàm này) ...
-    client = None
+async def _request_klines(client, symbol, interval, limit, spot=False, start_time=None, end_time=None):
+    """Gọi REST klines qua bộ giới hạn trọng số, tự chờ và thử lại khi bị 429/418. Trả về body JSON thô."""
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        # Thời gian chờ bộ giới hạn trọng số đo riêng, để 'fetch' chỉ là thời gian gọi mạng
+        with metrics.stage('rate_limit'):
+            await weight_limiter.acquire(kline_request_weight(limit))
+        try:
+            params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+            if start_time is not None: params['startTime'] = start_time
+            if end_time is not None: params['endTime'] = end_time
+            with metrics.stage('fetch'):
+                payload = await fetch_klines_payload(client, params, spot=spot)
+            record_used_weight(client)
+            return payload
+        except BinanceAPIException as e:
+            if e.status_code not in (418, 429) or attempt == MAX_RATE_LIMIT_RETRIES: raise e
+            retry_after = retry_after_seconds(e)
+            print(f"Binance rate limit ({e.status_code}) cho {symbol}, tạm dừng {retry_after:.0f}s...")
+            weight_limiter.backoff(retry_after)
+
+# Thứ tự cột của kline thô trong response REST
+KLINE_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore']
+
+def parse_klines(klines):
+    """Chuyển danh sách kline thô của REST (giá dạng chuỗi) thành DataFrame các cột số."""
+    return kline_frame(kline_array(klines))
+
+async def get_kline_array(symbol, interval, limit=300, start_time=None, end_time=None, raise_errors=False):
+    """
+    Tải nến và đọc thẳng body JSON vào structured array (xem kline_parser.KLINE_DTYPE).
+    Trả về mảng rỗng nếu lỗi, hoặc ném lại lỗi nếu raise_errors=True (kho nến cần phân biệt lỗi với
+    "không còn nến"). Bộ quét live dùng trực tiếp mảng này, không tạo DataFrame.
+    """
+    # Dùng client Binance dùng chung (xem binance_client.py) thay vì tạo mới mỗi lần gọi
     try:
-        client = await AsyncClient.create()
-        klines = None
+        client = await get_binance_client()
+        payload = None
         try:
-            klines = await client.futures_klines(symbol=symbol, interval=interval, limit=limit)
+            payload = await _request_klines(client, symbol, interval, limit, start_time=start_time, end_time=end_time)
         except BinanceAPIException as e:
             if e.code == -1121:
                 print(f"'{symbol}' không tìm thấy trên Futures, thử trên Spot...")
-                klines = await client.get_klines(symbol=symbol, interval=interval, limit=limit)
+                payload = await _request_klines(client, symbol, interval, limit, spot=True, start_time=start_time, end_time=end_time)
             else: raise e
-        if klines is None: raise ValueError("Không thể lấy dữ liệu nến từ bất kỳ thị trường nào.")
-        df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'])
-        numeric_cols = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
-        df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric)
-        return df
+        if payload is None: raise ValueError("Không thể lấy dữ liệu nến từ bất kỳ thị trường nào.")
+        with metrics.stage('parse'):
+            return parse_kline_payload(payload)
     except Exception as e:
+        metrics.FETCH_ERRORS.inc(interval=interval)
         print(f"Lỗi khi lấy dữ liệu cho {symbol} trên khung {interval}: {e}")
-        return pd.DataFrame()
-    finally:
-        if client: await client.close_connection()
+        if raise_errors: raise
+        return empty_klines()
+
+async def get_klines(symbol, interval, limit=300, start_time=None, end_time=None, raise_errors=False): # Mặc định vẫn là 300
+    """Như get_kline_array nhưng trả về DataFrame (cho backtest / kho nến)."""
+    return kline_frame(await get_kline_array(symbol, interval, limit, start_time=start_time, end_time=end_time, raise_errors=raise_errors))
 
 def calculate_stochastic(df):
-    # ... (giữ nguyên code của hàm này) ...
-    if df.empty: return None
-    df_reset = df.reset_index(drop=True) if 'timestamp' in df.index.names else df.copy()
-    stoch = df_reset.ta.stoch(k=STOCH_K, d=STOCH_D, smooth_k=STOCH_SMOOTH_K)
+    """
+    Stoch %K của DataFrame / structured array / dict mảng (index 0..n-1).
+    Chỉ đọc các cột high/low/close, không sao chép hay sửa dữ liệu đầu vào.
+    """
+    if len(df['timestamp']) == 0: return None
+    if kernels.active():
+        return pd.Series(kernels.stoch(df['high'], df['low'], df['close'], STOCH_K, STOCH_SMOOTH_K)[1])
+    high, low, close = (pd.Series(np.asarray(df[name], dtype=float)) for name in ('high', 'low', 'close'))
+    stoch = ta.stoch(high, low, close, k=STOCH_K, d=STOCH_D, smooth_k=STOCH_SMOOTH_K)
     if stoch is not None and not stoch.empty:
         return stoch[f'STOCHk_{STOCH_K}_{STOCH_D}_{STOCH_SMOOTH_K}']
     return None
 
-# --- LOGIC TÌM TÍN HIỆU (KHÔNG ĐỔI) ---
-def find_all_signals_for_backtest(df: pd.DataFrame):
-    # ... (giữ nguyên code của hàm này) ...
+# Cache nến cho bộ quét live: chỉ tải nến mới sau lần quét đầu tiên
+candle_cache = CandleCache(get_kline_array)
+# Chống gửi trùng tín hiệu, giữ nguyên qua các lần khởi động lại task quét
+# Worker quét không gửi Telegram: tín hiệu mới đi qua signal_outbox khi flush
+signal_store = SignalStore(outbox=SCAN_ROLE == 'worker')
+# Trạng thái chỉ báo (CVD, EMA50, Stoch) giữ giữa các chu kỳ, chỉ cập nhật nến mới
+indicator_store = IndicatorStore(cvd_period=CVD_PERIOD, ema_period=EMA_TREND_PERIOD, stoch_k=STOCH_K, stoch_smooth_k=STOCH_SMOOTH_K, delta_method=CVD_METHOD)
+
+# --- LOGIC TÌM TÍN HIỆU (DÙNG CHUNG BỘ MÁY VECTOR TRONG signal_engine) ---
+def _prepare_signal_arrays(df: pd.DataFrame, indicators=None, delta_method=CVD_METHOD):
+    """
+    Trả về các mảng numpy cần cho bộ máy phân kỳ (giá + CVD/EMA50) mà không sửa df.
+    df có thể là DataFrame, structured array của kline_parser hoặc dict mảng; các cột giá là view, không sao chép.
+    Nếu có `indicators` (từ IndicatorStore) thì dùng lại CVD/EMA50, không tính lại.
+    """
+    arrays = {
+        'timestamp': np.asarray(df['timestamp']),
+        'high': np.asarray(df['high'], dtype=float),
+        'low': np.asarray(df['low'], dtype=float),
+        'close': np.asarray(df['close'], dtype=float),
+    }
+    if indicators is not None:
+        arrays['cvd'], arrays['ema50'] = indicators['cvd'], indicators['ema50']
+    elif kernels.active():
+        # Cùng công thức với ta.ema (xem indicators.ema), tính bằng kernel biên dịch
+        arrays['cvd'] = kernels.ema(frame_delta(df, delta_method), CVD_PERIOD)
+        arrays['ema50'] = kernels.ema(arrays['close'], EMA_TREND_PERIOD)
+    else:
+        arrays['cvd'] = ta.ema(pd.Series(frame_delta(df, delta_method)), length=CVD_PERIOD).to_numpy(dtype=float)
+        arrays['ema50'] = ta.ema(pd.Series(arrays['close']), length=EMA_TREND_PERIOD).to_numpy(dtype=float)
+    return arrays
+
+def _build_signal(arrays, pivot_idx, direction, timeframe='M15'):
+    confirm_idx = pivot_idx + FRACTAL_PERIODS
+    return Signal(direction, int(arrays['timestamp'][pivot_idx]), float(arrays['close'][pivot_idx]),
+                  int(arrays['timestamp'][confirm_idx]), float(arrays['close'][confirm_idx]), timeframe)
+
+def find_all_signals_for_backtest(df: pd.DataFrame, delta_method=CVD_METHOD, timeframe='M15'):
     n = FRACTAL_PERIODS
-    if len(df) < 50 + n: return []
-    price_range = df['high'] - df['low']
-    df['delta'] = np.where(price_range > 0, df['volume'] * (2 * df['close'] - df['low'] - df['high']) / price_range, 0)
-    df['delta'] = df['delta'].fillna(0)
-    df['cvd'] = ta.ema(df['delta'], length=CVD_PERIOD)
-    df['ema50'] = ta.ema(df['close'], length=50)
-    up_fractals, down_fractals = [], []
-    for i in range(n, len(df) - n):
-        is_uptrend = df['close'].iloc[i] > df['ema50'].iloc[i]
-        is_downtrend = df['close'].iloc[i] < df['ema50'].iloc[i]
-        is_pivot_high = df['high'].iloc[i] >= df['high'].iloc[i-n:i+n+1].max()
-        is_pivot_low = df['low'].iloc[i] <= df['low'].iloc[i-n:i+n+1].min()
-        if is_pivot_high and is_uptrend: up_fractals.append(i)
-        if is_pivot_low and is_downtrend: down_fractals.append(i)
-    all_signals = []
-    for i in range(1, len(up_fractals)):
-        last_pivot_idx, prev_pivot_idx = up_fractals[i], up_fractals[i-1]
-        if (df['high'].iloc[last_pivot_idx] > df['high'].iloc[prev_pivot_idx]) and (df['cvd'].iloc[last_pivot_idx] < df['cvd'].iloc[prev_pivot_idx]) and (df['cvd'].iloc[last_pivot_idx] > 0 and df['cvd'].iloc[prev_pivot_idx] > 0) and ((last_pivot_idx - prev_pivot_idx) < 30):
-            all_signals.append({'type': 'SHORT 📉', 'price': df['close'].iloc[last_pivot_idx], 'timestamp': df['timestamp'].iloc[last_pivot_idx], 'confirmation_timestamp': df['timestamp'].iloc[last_pivot_idx + n], 'confirmation_price': df['close'].iloc[last_pivot_idx + n], 'timeframe': 'M15'})
-    for i in range(1, len(down_fractals)):
-        last_pivot_idx, prev_pivot_idx = down_fractals[i], down_fractals[i-1]
-        if (df['low'].iloc[last_pivot_idx] < df['low'].iloc[prev_pivot_idx]) and (df['cvd'].iloc[last_pivot_idx] > df['cvd'].iloc[prev_pivot_idx]) and (df['cvd'].iloc[last_pivot_idx] < 0 and df['cvd'].iloc[prev_pivot_idx] < 0) and ((last_pivot_idx - prev_pivot_idx) < 30):
-            all_signals.append({'type': 'LONG 📈', 'price': df['close'].iloc[last_pivot_idx], 'timestamp': df['timestamp'].iloc[last_pivot_idx], 'confirmation_timestamp': df['timestamp'].iloc[last_pivot_idx + n], 'confirmation_price': df['close'].iloc[last_pivot_idx + n], 'timeframe': 'M15'})
+    if len(df['timestamp']) < EMA_TREND_PERIOD + n: return []
+    arrays = _prepare_signal_arrays(df, delta_method=delta_method)
+    up_fractals, short_mask, down_fractals, long_mask = detect_divergences(
+        arrays['high'], arrays['low'], arrays['close'], arrays['ema50'], arrays['cvd'], n, DIVERGENCE_MAX_BARS
+    )
+    all_signals = [_build_signal(arrays, idx, SHORT, timeframe) for idx in up_fractals[1:][short_mask]]
+    all_signals += [_build_signal(arrays, idx, LONG, timeframe) for idx in down_fractals[1:][long_mask]]
     return all_signals
 
-def find_latest_confirmed_signal(df: pd.DataFrame):
-    # ... (giữ nguyên code của hàm này) ...
+def find_latest_confirmed_signal(df: pd.DataFrame, indicators=None, timeframe='M15', delta_method=CVD_METHOD):
+    """
+    Tín hiệu có pivot vừa được xác nhận ở nến cuối của df. Bộ quét live (poll lẫn stream) luôn truyền vào dữ liệu
+    có nến cuối là nến đang chạy, vừa mở: pivot được xác nhận bởi n - 1 nến đã đóng cộng tick đầu của nến kế tiếp.
+    """
     n = FRACTAL_PERIODS
-    if len(df) < 50 + n: return None
-    price_range = df['high'] - df['low']
-    df['delta'] = np.where(price_range > 0, df['volume'] * (2 * df['close'] - df['low'] - df['high']) / price_range, 0)
-    df['delta'] = df['delta'].fillna(0)
-    df['cvd'] = ta.ema(df['delta'], length=CVD_PERIOD)
-    df['ema50'] = ta.ema(df['close'], length=50)
-    up_fractals, down_fractals = [], []
-    for i in range(n, len(df) - n):
-        is_uptrend = df['close'].iloc[i] > df['ema50'].iloc[i]
-        is_downtrend = df['close'].iloc[i] < df['ema50'].iloc[i]
-        is_pivot_high = df['high'].iloc[i] >= df['high'].iloc[i-n:i+n+1].max()
-        is_pivot_low = df['low'].iloc[i] <= df['low'].iloc[i-n:i+n+1].min()
-        if is_pivot_high and is_uptrend: up_fractals.append(i)
-        if is_pivot_low and is_downtrend: down_fractals.append(i)
-    signal = None
-    if len(up_fractals) >= 2:
-        last_pivot_idx, prev_pivot_idx = up_fractals[-1], up_fractals[-2]
-        if (last_pivot_idx + n) == (len(df) - 1):
-            if (df['high'].iloc[last_pivot_idx] > df['high'].iloc[prev_pivot_idx]) and (df['cvd'].iloc[last_pivot_idx] < df['cvd'].iloc[prev_pivot_idx]) and (df['cvd'].iloc[last_pivot_idx] > 0 and df['cvd'].iloc[prev_pivot_idx] > 0) and ((last_pivot_idx - prev_pivot_idx) < 30):
-                signal = {'type': 'SHORT 📉', 'price': df['close'].iloc[last_pivot_idx], 'timestamp': df['timestamp'].iloc[last_pivot_idx], 'confirmation_timestamp': df['timestamp'].iloc[last_pivot_idx + n], 'confirmation_price': df['close'].iloc[last_pivot_idx + n], 'timeframe': 'M15'}
-    if not signal and len(down_fractals) >= 2:
-        last_pivot_idx, prev_pivot_idx = down_fractals[-1], down_fractals[-2]
-        if (last_pivot_idx + n) == (len(df) - 1):
-            if (df['low'].iloc[last_pivot_idx] < df['low'].iloc[prev_pivot_idx]) and (df['cvd'].iloc[last_pivot_idx] > df['cvd'].iloc[prev_pivot_idx]) and (df['cvd'].iloc[last_pivot_idx] < 0 and df['cvd'].iloc[prev_pivot_idx] < 0) and ((last_pivot_idx - prev_pivot_idx) < 30):
-                signal = {'type': 'LONG 📈', 'price': df['close'].iloc[last_pivot_idx], 'timestamp': df['timestamp'].iloc[last_pivot_idx], 'confirmation_timestamp': df['timestamp'].iloc[last_pivot_idx + n], 'confirmation_price': df['close'].iloc[last_pivot_idx + n], 'timeframe': 'M15'}
-    return signal
-
-# --- BỘ QUÉT TÍN HIỆU LIVE (SỬA LỖI) ---
-async def run_signal_checker(bot):
+    if len(df['timestamp']) < EMA_TREND_PERIOD + n: return None
+    arrays = _prepare_signal_arrays(df, indicators, delta_method)
+    up_fractals, short_mask, down_fractals, long_mask = detect_divergences(
+        arrays['high'], arrays['low'], arrays['close'], arrays['ema50'], arrays['cvd'], n, DIVERGENCE_MAX_BARS
+    )
+    # Chỉ xét cặp fractal cuối cùng, và pivot phải vừa được xác nhận ở nến cuối
+    last_bar = len(arrays['timestamp']) - 1
+    if len(up_fractals) >= 2 and up_fractals[-1] + n == last_bar and short_mask[-1]:
+        return _build_signal(arrays, up_fractals[-1], SHORT, timeframe)
+    if len(down_fractals) >= 2 and down_fractals[-1] + n == last_bar and long_mask[-1]:
+        return _build_signal(arrays, down_fractals[-1], LONG, timeframe)
+    return None
+
+# --- BỘ LỌC STOCHASTIC ---
+# Tỷ lệ win hiển thị theo nhóm tín hiệu; WIN_RATE_SOURCE=backtest thay bằng số đo từ backtest qua update_win_rates
+WIN_RATES = {'M15': '60%', 'M15+H1': '80%'}
+
+def classify_signal(signal_type, stoch_m15, stoch_h1):
+    """
+    Xếp nhóm tín hiệu theo Stoch: 'M15' khi chỉ khung tín hiệu quá mua/bán, 'M15+H1' khi cả khung lọc
+    cùng chiều (tên nhóm giữ theo pipeline mặc định M15/H1). Trả về None nếu tín hiệu không qua bộ lọc.
+    """
+    if signal_type == 'LONG 📈' and stoch_m15 < STOCH_M15_OVERSOLD:
+        if stoch_h1 > STOCH_H1_OVERSOLD: return 'M15'
+        if stoch_h1 < STOCH_H1_OVERSOLD: return 'M15+H1'
+    elif signal_type == 'SHORT 📉' and stoch_m15 > STOCH_M15_OVERBOUGHT:
+        if stoch_h1 < STOCH_H1_OVERBOUGHT: return 'M15'
+        if stoch_h1 > STOCH_H1_OVERBOUGHT: return 'M15+H1'
+    return None
+
+def apply_stoch_filter(signal, stoch_m15, stoch_h1, **fields):
+    """Bản ghi Signal mới kèm giá trị Stoch, nhóm, tỷ lệ win (và `fields`); None nếu bị loại."""
+    tier = classify_signal(signal['type'], stoch_m15, stoch_h1)
+    if tier is None: return None
+    return as_signal(signal).replace(stoch_m15=float(stoch_m15), stoch_h1=float(stoch_h1), tier=tier, win_rate=WIN_RATES[tier], **fields)
+
+def enrich_signals(signals, signal_arrays, filter_arrays, filter_timeframe='H1'):
+    """
+    Gắn Stoch khung tín hiệu (đúng nến xác nhận) và Stoch khung lọc (nến cuối <= nến xác nhận)
+    cho cả lô tín hiệu bằng một lần searchsorted, rồi áp dụng bộ lọc Stoch.
+    signal_arrays / filter_arrays: dict có 'timestamp' và 'stoch_k' (mảng numpy cùng độ dài).
+    """
+    if not signals: return []
+    confirm_ts = np.array([s['confirmation_timestamp'] for s in signals], dtype=np.int64)
+    signal_ts = np.asarray(signal_arrays['timestamp'])
+    signal_idx = np.minimum(np.searchsorted(signal_ts, confirm_ts), len(signal_ts) - 1)
+    filter_idx = asof_indices(np.asarray(filter_arrays['timestamp']), confirm_ts)
+    valid = (signal_ts[signal_idx] == confirm_ts) & (filter_idx >= 0)
+    stoch_signal = np.asarray(signal_arrays['stoch_k'], dtype=float)[signal_idx]
+    stoch_filter = np.asarray(filter_arrays['stoch_k'], dtype=float)[np.maximum(filter_idx, 0)]
+    final_signals = []
+    for i in np.flatnonzero(valid):
+        final_signal = apply_stoch_filter(signals[i], stoch_signal[i], stoch_filter[i], filter_timeframe=filter_timeframe)
+        if final_signal: final_signals.append(final_signal)
+    return final_signals
+
+def update_win_rates(measured):
+    """Thay tỷ lệ win mặc định bằng tỷ lệ đo được, ví dụ từ trade_simulator.measured_win_rates."""
+    WIN_RATES.update(measured)
+
+# --- BỘ QUÉT TÍN HIỆU LIVE (QUÉT ĐỒNG THỜI) ---
+# Thời gian của chu kỳ quét gần nhất, để theo dõi/hiển thị
+last_scan_stats = {}
+
+def pipelines_for(symbol):
+    return SYMBOL_PIPELINES.get(symbol, SIGNAL_PIPELINES)
+
+def base_candle_limit(pipelines):
+    """Số nến khung gốc cần tải để mỗi khung tín hiệu resample ra đủ SIGNAL_MIN_BARS nến."""
+    base_ms = interval_to_milliseconds(base_interval(pipelines))
+    needed = max(SIGNAL_MIN_BARS * interval_to_milliseconds(signal_interval) // base_ms for signal_interval, _ in pipelines)
+    return min(MAX_KLINE_LIMIT, max(LIVE_CANDLE_LIMIT, needed))
+
+async def _scan_symbol(bot, symbol, store=None):
+    print(f"   -> Scanning {symbol}...")
+    pipelines = pipelines_for(symbol)
+    base = base_interval(pipelines)
+    # <<< SỬA ĐỔI Ở ĐÂY: Chỉ tải khung gốc qua cache nến, các khung lớn hơn được resample >>>
+    base_data = await candle_cache.get(symbol, base, base_candle_limit(pipelines))
+    if len(base_data) == 0: return
+    await _evaluate_pipelines(bot, symbol, base_data, base, pipelines, store)
+
+def _pipeline_frames(base_data, base, pipelines):
+    """Resample khung gốc ra mọi khung mà các pipeline cần (mỗi khung chỉ một lần)."""
+    frames = {base: base_data}
+    for pipeline in pipelines:
+        for interval in pipeline:
+            if interval not in frames:
+                frames[interval] = resample_candles(base_data, base, interval)
+    return frames
+
+async def _evaluate_pipelines(bot, symbol, base_data, base, pipelines, store=None):
+    """Resample khung gốc cho từng pipeline (mỗi khung chỉ một lần) rồi đánh giá tín hiệu."""
+    frames = _pipeline_frames(base_data, base, pipelines)
+    for signal_interval, filter_interval in pipelines:
+        await _evaluate_symbol(bot, symbol, frames[signal_interval], frames[filter_interval], signal_interval, filter_interval, store)
+
+async def _evaluate_symbol(bot, symbol, signal_data, filter_data, signal_interval=TIMEFRAME_M15, filter_interval=TIMEFRAME_H1, store=None):
+    """
+    Tìm tín hiệu vừa xác nhận trên nến cuối của khung tín hiệu, lọc bằng Stoch khung tín hiệu/khung lọc và gửi đi.
+    bot=None: không gửi (worker quét, hoặc /profile); store: SignalStore thay cho signal_store dùng chung.
+    """
     from bot_handler import send_formatted_signal
+    if store is None: store = signal_store
+    if len(signal_data) == 0 or len(filter_data) == 0: return
+    with metrics.stage('indicators'):
+        signal_indicators = indicator_store.update(symbol, signal_interval, signal_data, verify=INDICATOR_VERIFY)
+        filter_indicators = indicator_store.update(symbol, filter_interval, filter_data, verify=INDICATOR_VERIFY)
+    with metrics.stage('detection'):
+        recent_signal = find_latest_confirmed_signal(signal_data, signal_indicators, timeframe_label(signal_interval))
+    if not recent_signal: return
+    recent_signal = recent_signal.replace(symbol=symbol)
+    if store.seen(recent_signal):
+        print(f"      - Signal for {symbol} at pivot {datetime.fromtimestamp(recent_signal['timestamp']/1000).strftime('%H:%M')} already processed. Skipping.")
+        return
+    print(f"      🔥 Found a confirmed {recent_signal['timeframe']} signal for {symbol}! Pivot at {datetime.fromtimestamp(recent_signal['timestamp']/1000, tz=pytz.utc).astimezone(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%H:%M %d-%m')}, Confirmed at {datetime.fromtimestamp(recent_signal['confirmation_timestamp']/1000, tz=pytz.utc).astimezone(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%H:%M %d-%m')}")
+    with metrics.stage('enrichment'):
+        enriched = enrich_signals([recent_signal], signal_indicators, filter_indicators, timeframe_label(filter_interval))
+    final_signal = enriched[0] if enriched else None
+    if final_signal:
+        if SCAN_ROLE != 'worker' and bot is not None:
+            with metrics.stage('send'):
+                delivered = await send_formatted_signal(bot, final_signal)
+            metrics.SIGNALS_SENT.inc(timeframe=final_signal['timeframe'])
+            # Chỉ đánh dấu đã xử lý khi Telegram xác nhận đã gửi (không chờ ở đây để không chặn chu kỳ quét)
+            store.record_when_delivered(final_signal, delivered)
+        else:
+            # Worker: tín hiệu vào signal_outbox khi flush, tiến trình bot xóa khỏi outbox sau khi gửi được
+            store.record(final_signal)
+
+async def scan_watchlist(bot, watchlist, store=None):
+    """
+    Quét toàn bộ watchlist đồng thời, giới hạn bởi SCAN_CONCURRENCY, và trả về thống kê thời gian.
+    bot=None và store=SignalStore(persist=False): chạy thử không gửi tin, không đánh dấu tín hiệu đã gửi (/profile).
+    """
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+    errors = 0
+
+    async def worker(symbol):
+        nonlocal errors
+        async with semaphore:
+            try:
+                await _scan_symbol(bot, symbol, store)
+            except Exception as e:
+                errors += 1
+                metrics.SYMBOL_ERRORS.inc(error=type(e).__name__)
+                print(f"Error processing {symbol}: {e}")
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(symbol) for symbol in watchlist))
+    return {
+        'symbols': len(watchlist),
+        'errors': errors,
+        'duration_seconds': time.monotonic() - started,
+        'used_weight': weight_limiter.used_weight,
+    }
+
+# --- CHẾ ĐỘ QUÉT TOÀN THỊ TRƯỜNG ---
+# Các hợp đồng USDT-M đủ thanh khoản, làm mới từ exchange info mỗi ngày (xem universe.py)
+market_universe = MarketUniverse(UNIVERSE_MIN_QUOTE_VOLUME)
+
+def prefilter_candidates(symbol_frames):
+    """
+    Bộ lọc sơ bộ cho cả lô mã: chỉ giữ các (mã, pipeline) có Stoch khung tín hiệu ở nến cuối
+    đang quá mua/quá bán, vì chỉ khi đó tín hiệu vừa xác nhận mới qua được bộ lọc Stoch.
+    symbol_frames: {symbol: {interval: mảng nến}}. Trả về danh sách (symbol, pipeline).
+    """
+    jobs = [(symbol, pipeline) for symbol in symbol_frames for pipeline in pipelines_for(symbol)]
+    if not jobs: return []
+    mask = stoch_extreme_mask(
+        [symbol_frames[symbol][pipeline[0]] for symbol, pipeline in jobs],
+        STOCH_K, STOCH_SMOOTH_K, STOCH_M15_OVERSOLD, STOCH_M15_OVERBOUGHT
+    )
+    return [job for job, keep in zip(jobs, mask) if keep]
+
+async def scan_universe(bot, symbols):
+    """
+    Quét toàn thị trường: tải nến khung gốc cho mọi mã (qua candle_cache, giới hạn bởi SCAN_CONCURRENCY),
+    lọc sơ bộ theo Stoch trên cả lô bằng numpy, rồi chỉ chạy chỉ báo + tìm phân kỳ đầy đủ cho các mã ứng viên.
+    """
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+    errors = 0
+    base_frames = {}
+
+    async def load(symbol):
+        nonlocal errors
+        pipelines = pipelines_for(symbol)
+        async with semaphore:
+            try:
+                data = await candle_cache.get(symbol, base_interval(pipelines), base_candle_limit(pipelines))
+                if len(data): base_frames[symbol] = data
+            except Exception as e:
+                errors += 1
+                metrics.SYMBOL_ERRORS.inc(error=type(e).__name__)
+                print(f"Error loading {symbol}: {e}")
+
+    started = time.monotonic()
+    await asyncio.gather(*(load(symbol) for symbol in symbols))
+    with metrics.stage('prefilter'):
+        symbol_frames = {
+            symbol: _pipeline_frames(data, base_interval(pipelines_for(symbol)), pipelines_for(symbol))
+            for symbol, data in base_frames.items()
+        }
+        candidates = prefilter_candidates(symbol_frames)
+    print(f"   -> Prefilter: {len(candidates)} candidate(s) out of {len(symbol_frames)} symbols.")
+    for symbol, (signal_interval, filter_interval) in candidates:
+        frames = symbol_frames[symbol]
+        try:
+            await _evaluate_symbol(bot, symbol, frames[signal_interval], frames[filter_interval], signal_interval, filter_interval)
+        except Exception as e:
+            errors += 1
+            metrics.SYMBOL_ERRORS.inc(error=type(e).__name__)
+            print(f"Error processing {symbol}: {e}")
+    return {
+        'symbols': len(symbols),
+        'candidates': len(candidates),
+        'errors': errors,
+        'duration_seconds': time.monotonic() - started,
+        'used_weight': weight_limiter.used_weight,
+    }
+
+# --- NHIỀU WORKER QUÉT (SCAN_ROLE=worker / bot) ---
+# Chỉ dùng khi SCAN_ROLE=worker: giữ các shard của watchlist qua advisory lock (xem sharding.py)
+shard_coordinator = ShardCoordinator(SCAN_SHARDS)
+
+async def run_outbox_sender(bot):
+    """
+    SCAN_ROLE=bot: không quét, chỉ lấy tín hiệu các worker ghi vào signal_outbox và gửi lên channel.
+    Tín hiệu chỉ bị xóa khỏi outbox sau khi Telegram đã nhận; bot chết giữa chừng thì tín hiệu được nhận lại
+    sau OUTBOX_CLAIM_TIMEOUT_SECONDS (có thể gửi trùng một lần, không mất tín hiệu).
+    """
+    from bot_handler import send_formatted_signal
+    print("🚀 Signal sender is running, waiting for signals from scanner workers...")
+    while True:
+        try:
+            claimed = await claim_outbox_signals(OUTBOX_BATCH_SIZE, OUTBOX_CLAIM_TIMEOUT_SECONDS, OUTBOX_MAX_ATTEMPTS)
+        except Exception as e:
+            print(f"Lỗi khi đọc signal_outbox: {e}")
+            claimed = []
+        deliveries = []
+        for outbox_id, signal in claimed:
+            deliveries.append((outbox_id, await send_formatted_signal(bot, signal)))
+            metrics.SIGNALS_SENT.inc(timeframe=signal['timeframe'])
+        if deliveries:
+            results = await asyncio.gather(*(delivered for _, delivered in deliveries))
+            try:
+                await complete_outbox_signals([outbox_id for (outbox_id, _), sent in zip(deliveries, results) if sent])
+            except Exception as e:
+                print(f"Lỗi khi xóa tín hiệu đã gửi khỏi signal_outbox (sẽ gửi lại): {e}")
+        if len(claimed) < OUTBOX_BATCH_SIZE:
+            await asyncio.sleep(OUTBOX_POLL_SECONDS)
+
+async def run_signal_checker(bot, on_cycle=None):
+    """on_cycle(stats): gọi sau mỗi chu kỳ quét ở chế độ poll (ví dụ replay.py thu thống kê)."""
+    if SCAN_ROLE == 'bot':
+        return await run_outbox_sender(bot)
+    # Đo tỷ lệ win chạy nền, bộ quét dùng tỷ lệ mặc định cho đến khi backtest xong
+    calibration = asyncio.create_task(_calibrate_win_rates()) if WIN_RATE_SOURCE == 'backtest' else None
+    try:
+        return await _run_scanner(bot, on_cycle)
+    finally:
+        if calibration:
+            calibration.cancel()
+
+async def _calibrate_win_rates():
+    from backtester import calibrate_win_rates
+    try:
+        await watchlist_manager.load()
+        await calibrate_win_rates(watchlist_manager.snapshot() or None)
+    except Exception as e:
+        print(f"❌ Không đo được tỷ lệ win bằng backtest, giữ tỷ lệ mặc định: {e}")
+
+async def _run_scanner(bot, on_cycle=None):
+    if SCAN_MODE == 'stream' and SCAN_UNIVERSE != 'market' and SCAN_ROLE != 'worker':
+        return await run_stream_checker(bot)
+    if SCAN_MODE == 'stream':
+        print("⚠️ SCAN_UNIVERSE=market và SCAN_ROLE=worker chỉ hỗ trợ chế độ poll, chuyển sang quét REST theo lịch.")
     print("🚀 Signal checker is running with FINAL combined logic...")
-    processed_signals = set()
+    await signal_store.warm_up()
+    await watchlist_manager.load()
+    if SCAN_ROLE == 'worker':
+        await shard_coordinator.start()
+    try:
+        await _poll_loop(bot, on_cycle)
+    finally:
+        await signal_store.flush()
+        if SCAN_ROLE == 'worker':
+            await shard_coordinator.stop()
+
+async def _poll_loop(bot, on_cycle=None):
     while True:
-        now = datetime.now(pytz.utc)
+        # Dùng đồng hồ dùng chung (clock.py) để replay chạy được nhanh hơn thời gian thực
+        now = clock.now()
         next_run_minute = (now.minute // 15 + 1) * 15
         if next_run_minute >= 60:
             next_run_time = now.replace(minute=0, second=SCAN_DELAY_SECONDS, microsecond=0) + timedelta(hours=1)
@@ -132,47 +503,115 @@ async def run_signal_checker(bot):
         sleep_duration = (next_run_time - now).total_seconds()
         if sleep_duration > 0:
             print(f"Next scan at {next_run_time.astimezone(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%H:%M:%S')}. Sleeping for {sleep_duration:.0f} seconds.")
-            await asyncio.sleep(sleep_duration)
-        print(f"\n--- Waking up at {datetime.now(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%Y-%m-%d %H:%M:%S')} to scan signals ---")
-        watchlist = await get_watchlist_from_db()
+            await clock.sleep(sleep_duration)
+        print(f"\n--- Waking up at {clock.now().astimezone(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%Y-%m-%d %H:%M:%S')} to scan signals ---")
+        market_mode = SCAN_UNIVERSE == 'market'
+        if SCAN_ROLE == 'worker' and not market_mode:
+            # /add, /remove chạy ở tiến trình bot: đọc lại watchlist từ database mỗi chu kỳ
+            try:
+                await watchlist_manager.reload()
+            except Exception as e:
+                print(f"Không đọc lại được watchlist, dùng danh sách cũ: {e}")
+        watchlist = await market_universe.snapshot() if market_mode else watchlist_manager.snapshot()
+        if SCAN_ROLE == 'worker':
+            watchlist = shard_coordinator.filter(watchlist)
         if not watchlist:
             print("Watchlist is empty. Will check again on the next cycle.")
             continue
-        for symbol in watchlist:
-            print(f"   -> Scanning {symbol}...")
+        candle_cache.prune(watchlist)
+        indicator_store.prune(watchlist)
+        stats = await (scan_universe if market_mode else scan_watchlist)(bot, watchlist)
+        await signal_store.flush()
+        metrics.record_cycle(stats)
+        last_scan_stats.update(stats, finished_at=clock.now())
+        print(f"--- Scan cycle done: {stats['symbols']} symbols in {stats['duration_seconds']:.2f}s ({stats['errors']} errors, Binance weight used: {stats['used_weight']}) ---")
+        if on_cycle:
+            on_cycle(dict(last_scan_stats))
+
+# --- BỘ QUÉT TÍN HIỆU LIVE (CHẾ ĐỘ WEBSOCKET) ---
+async def run_stream_checker(bot):
+    """
+    Chế độ stream: nhận kline khung gốc qua WebSocket thay vì chờ lịch quét REST. Dữ liệu lịch sử được nạp
+    một lần qua candle_cache, nến đóng (cờ `x`) được ghi vào cache, các khung lớn hơn được resample từ cache.
+    Cùng cách xác nhận với chế độ poll: sau khi một nến khung gốc đóng, mọi pipeline được đánh giá ở tick đầu
+    của nến kế tiếp, với nến đang chạy đó là nến cuối (poll chạy sau khi nến đóng SCAN_DELAY_SECONDS giây và
+    REST luôn trả kèm nến đang chạy). Nhờ vậy cùng dữ liệu thị trường cho cùng tín hiệu ở cả hai chế độ.
+    """
+    print("🚀 Signal checker is running in WebSocket stream mode...")
+    await signal_store.warm_up()
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+    background_tasks = set()
+    # Mã có nến khung gốc vừa đóng, chờ tick đầu của nến kế tiếp để đánh giá
+    pending = set()
+
+    def spawn(coro):
+        task = asyncio.create_task(coro)
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    async def load_history(symbol):
+        pipelines = pipelines_for(symbol)
+        async with semaphore:
+            await candle_cache.get(symbol, base_interval(pipelines), base_candle_limit(pipelines))
+
+    async def evaluate(symbol, base, pipelines, base_data):
+        async with semaphore:
             try:
-                # <<< SỬA ĐỔI Ở ĐÂY: Sử dụng hằng số LIVE_CANDLE_LIMIT >>>
-                m15_data_raw, h1_data_raw = await asyncio.gather(
-                    get_klines(symbol, TIMEFRAME_M15, limit=LIVE_CANDLE_LIMIT),
-                    get_klines(symbol, TIMEFRAME_H1, limit=LIVE_CANDLE_LIMIT)
-                )
-                if m15_data_raw.empty or h1_data_raw.empty: continue
-                recent_signal = find_latest_confirmed_signal(m15_data_raw.copy())
-                if not recent_signal: continue
-                signal_id = f"{symbol}_{recent_signal['timestamp']}"
-                if signal_id in processed_signals: 
-                    print(f"      - Signal for {symbol} at pivot {datetime.fromtimestamp(recent_signal['timestamp']/1000).strftime('%H:%M')} already processed. Skipping.")
-                    continue
-                print(f"      🔥 Found a confirmed signal for {symbol}! Pivot at {datetime.fromtimestamp(recent_signal['timestamp']/1000, tz=pytz.utc).astimezone(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%H:%M %d-%m')}, Confirmed at {datetime.fromtimestamp(recent_signal['confirmation_timestamp']/1000, tz=pytz.utc).astimezone(pytz.timezone('Asia/Ho_Chi_Minh')).strftime('%H:%M %d-%m')}")
-                m15_data_raw['stoch_k'] = calculate_stochastic(m15_data_raw)
-                h1_data_raw['stoch_k'] = calculate_stochastic(h1_data_raw)
-                m15_data_raw.set_index('timestamp', inplace=True)
-                h1_data_raw.set_index('timestamp', inplace=True)
-                try:
-                    stoch_m15_val = m15_data_raw.loc[recent_signal['confirmation_timestamp'], 'stoch_k']
-                    stoch_h1_val = h1_data_raw.loc[h1_data_raw.index <= recent_signal['confirmation_timestamp'], 'stoch_k'].iloc[-1]
-                except (KeyError, IndexError): continue
-                base_signal = {**recent_signal, 'symbol': symbol, 'stoch_m15': stoch_m15_val, 'stoch_h1': stoch_h1_val}
-                final_signal = None
-                if base_signal['type'] == 'LONG 📈' and stoch_m15_val < 20:
-                    if stoch_h1_val > 25: final_signal = {**base_signal, 'win_rate': '60%'}
-                    elif stoch_h1_val < 25: final_signal = {**base_signal, 'win_rate': '80%'}
-                elif base_signal['type'] == 'SHORT 📉' and stoch_m15_val > 80:
-                    if stoch_h1_val < 75: final_signal = {**base_signal, 'win_rate': '60%'}
-                    elif stoch_h1_val > 75: final_signal = {**base_signal, 'win_rate': '80%'}
-                if final_signal:
-                    await send_formatted_signal(bot, final_signal)
-                    processed_signals.add(signal_id)
+                await _evaluate_pipelines(bot, symbol, base_data, base, pipelines)
             except Exception as e:
-                print(f"Error processing {symbol}: {e}", exc_info=True)
-            await asyncio.sleep(2)
\ No newline at end of file
+                metrics.SYMBOL_ERRORS.inc(error=type(e).__name__)
+                print(f"Error processing {symbol}: {e}")
+
+    async def on_kline(symbol, interval, row, is_closed):
+        pipelines = pipelines_for(symbol)
+        base = base_interval(pipelines)
+        if interval != base: return
+        if symbol in pending:
+            # Message đầu tiên của nến kế tiếp (thường chưa đóng; nếu đã đóng thì dùng luôn bản đã đóng)
+            base_data = candle_cache.with_open(symbol, interval, row)
+            if base_data is not None:
+                pending.discard(symbol)
+                spawn(evaluate(symbol, base, pipelines, base_data))
+        if not is_closed: return
+        if not candle_cache.append_closed(symbol, interval, row):
+            print(f"[Stream] {symbol} {interval}: nến không nối liền cache, tải lại lịch sử.")
+            spawn(load_history(symbol))
+            return
+        pending.add(symbol)
+
+    def stream_intervals():
+        return sorted({base_interval(pipelines_for(s)) for s in watchlist_manager.snapshot()} or {base_interval(SIGNAL_PIPELINES)}, key=interval_to_milliseconds)
+
+    await watchlist_manager.load()
+    watchlist = watchlist_manager.snapshot()
+    if not watchlist:
+        print("Watchlist is empty. Waiting for symbols to be added...")
+    await asyncio.gather(*(load_history(s) for s in watchlist))
+    stream = KlineStream(watchlist, stream_intervals(), on_kline)
+
+    async def resubscribe(symbols):
+        # Nạp lịch sử cho mã mới trước khi đăng ký stream, bỏ cache của mã đã xóa
+        new_symbols = [s for s in symbols if s not in stream.symbols]
+        await asyncio.gather(*(load_history(s) for s in new_symbols))
+        candle_cache.prune(symbols)
+        indicator_store.prune(symbols)
+        stream.intervals = stream_intervals()
+        stream.set_symbols(symbols)
+
+    def on_watchlist_change(symbols):
+        spawn(resubscribe(symbols))
+
+    async def flush_signals():
+        while True:
+            await asyncio.sleep(SIGNAL_FLUSH_SECONDS)
+            await signal_store.flush()
+
+    spawn(flush_signals())
+    watchlist_manager.subscribe(on_watchlist_change)
+    try:
+        await stream.run()
+    finally:
+        watchlist_manager.unsubscribe(on_watchlist_change)
+        for task in list(background_tasks):
+            task.cancel()
+        await signal_store.flush()
@@ -0,0 +1,116 @@
+# universe.py
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from binance.exceptions import BinanceAPIException
+from binance_client import get_binance_client, weight_limiter, record_used_weight, retry_after_seconds, MAX_RATE_LIMIT_RETRIES
+
+# --- CẤU HÌNH CHẾ ĐỘ QUÉT TOÀN THỊ TRƯỜNG ---
+UNIVERSE_REFRESH_SECONDS = 24 * 3600  # Danh sách mã từ exchange info được làm mới mỗi ngày
+UNIVERSE_QUOTE_ASSET = 'USDT'
+UNIVERSE_CONTRACT_TYPE = 'PERPETUAL'
+EXCHANGE_INFO_WEIGHT = 1
+TICKER_24H_WEIGHT = 40                # /fapi/v1/ticker/24hr không truyền symbol
+
+
+async def _request(call, weight):
+    """Gọi một endpoint REST qua bộ giới hạn trọng số, chờ và thử lại khi bị 429/418."""
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        await weight_limiter.acquire(weight)
+        client = await get_binance_client()
+        try:
+            result = await call(client)
+            record_used_weight(client)
+            return result
+        except BinanceAPIException as e:
+            if e.status_code not in (418, 429) or attempt == MAX_RATE_LIMIT_RETRIES: raise e
+            retry_after = retry_after_seconds(e)
+            print(f"Binance rate limit ({e.status_code}) khi tải danh sách thị trường, tạm dừng {retry_after:.0f}s...")
+            weight_limiter.backoff(retry_after)
+
+def tradable_symbols(exchange_info, quote_asset=UNIVERSE_QUOTE_ASSET):
+    """Các hợp đồng vĩnh cửu USDT-M đang giao dịch trong exchange info của Futures."""
+    return sorted(
+        s['symbol'] for s in exchange_info.get('symbols', [])
+        if s.get('status') == 'TRADING' and s.get('contractType') == UNIVERSE_CONTRACT_TYPE and s.get('quoteAsset') == quote_asset
+    )
+
+def liquid_symbols(symbols, tickers, min_quote_volume):
+    """Lọc các mã có khối lượng 24h (theo quote) >= min_quote_volume, sắp xếp giảm dần theo khối lượng."""
+    quote_volume = {t['symbol']: float(t.get('quoteVolume', 0)) for t in tickers}
+    volumes = np.array([quote_volume.get(s, 0.0) for s in symbols])
+    order = np.argsort(-volumes, kind='stable')
+    return [symbols[i] for i in order if volumes[i] >= min_quote_volume]
+
+
+# --- BỘ LỌC SƠ BỘ THEO STOCH (VECTOR HÓA TRÊN NHIỀU MÃ) ---
+def last_stoch_k(high, low, close, k, smooth_k):
+    """
+    %K đã làm mượt của nến cuối cho từng hàng của các mảng 2D (mã x nến), mỗi hàng có đúng
+    k + smooth_k - 1 nến. Cùng công thức với indicators.stoch_raw + sma nên cho kết quả như IndicatorState.
+    """
+    lowest_low = sliding_window_view(low, k, axis=1).min(axis=2)
+    highest_high = sliding_window_view(high, k, axis=1).max(axis=2)
+    price_range = highest_high - lowest_low
+    price_range[price_range == 0] = np.finfo(float).eps
+    raw = 100 * (close[:, k - 1:] - lowest_low) / price_range
+    return raw[:, -smooth_k:].mean(axis=1)
+
+def stoch_extreme_mask(frames, k, smooth_k, oversold, overbought):
+    """
+    Với mỗi mảng nến trong `frames`, cho biết Stoch %K ở nến cuối có đang quá bán (< oversold)
+    hoặc quá mua (> overbought) hay không. Tín hiệu mới chỉ qua được bộ lọc Stoch khung tín hiệu
+    trong vùng này, nên các mã còn lại có thể bỏ qua bước tìm phân kỳ mà không mất tín hiệu.
+    Mã không đủ nến cho Stoch luôn bị loại (Stoch NaN cũng không qua bộ lọc).
+    """
+    window = k + smooth_k - 1
+    mask = np.zeros(len(frames), dtype=bool)
+    rows = [i for i, frame in enumerate(frames) if len(frame) >= window]
+    if not rows:
+        return mask
+    high = np.stack([np.asarray(frames[i]['high'][-window:], dtype=float) for i in rows])
+    low = np.stack([np.asarray(frames[i]['low'][-window:], dtype=float) for i in rows])
+    close = np.stack([np.asarray(frames[i]['close'][-window:], dtype=float) for i in rows])
+    stoch = last_stoch_k(high, low, close, k, smooth_k)
+    mask[rows] = (stoch < oversold) | (stoch > overbought)
+    return mask
+
+
+class MarketUniverse:
+    """
+    Danh sách mã cho chế độ quét toàn thị trường: các hợp đồng USDT-M vĩnh cửu lấy từ exchange info
+    (cache, làm mới mỗi UNIVERSE_REFRESH_SECONDS), lọc theo khối lượng 24h bằng một request ticker cho mọi mã.
+    Nếu Binance lỗi thì giữ danh sách của lần làm mới trước.
+    """
+    def __init__(self, min_quote_volume, refresh_seconds=UNIVERSE_REFRESH_SECONDS):
+        self.min_quote_volume = min_quote_volume
+        self.refresh_seconds = refresh_seconds
+        self._symbols = []
+        self._refreshed_at = None
+        self._liquid = []
+
+    async def tradable(self):
+        now = time.monotonic()
+        if self._refreshed_at is None or now - self._refreshed_at >= self.refresh_seconds:
+            try:
+                info = await _request(lambda client: client.futures_exchange_info(), EXCHANGE_INFO_WEIGHT)
+                self._symbols = tradable_symbols(info)
+                self._refreshed_at = now
+                print(f"[Universe] Đã làm mới danh sách: {len(self._symbols)} hợp đồng {UNIVERSE_QUOTE_ASSET}-M đang giao dịch.")
+            except Exception as e:
+                print(f"[Universe] Lỗi khi tải exchange info, dùng danh sách cũ ({len(self._symbols)} mã): {e}")
+        return self._symbols
+
+    async def snapshot(self):
+        """Các mã cần quét trong chu kỳ này (đang giao dịch và đủ thanh khoản)."""
+        symbols = await self.tradable()
+        if not symbols:
+            return []
+        try:
+            tickers = await _request(lambda client: client.futures_ticker(), TICKER_24H_WEIGHT)
+            self._liquid = liquid_symbols(symbols, tickers, self.min_quote_volume)
+        except Exception as e:
+            print(f"[Universe] Lỗi khi tải ticker 24h, dùng bộ lọc thanh khoản lần trước: {e}")
+            tradable = set(symbols)
+            self._liquid = [s for s in self._liquid if s in tradable] or list(symbols)
+        return self._liquid
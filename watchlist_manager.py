@@ -0,0 +1,68 @@
+# watchlist_manager.py
+from database import get_watchlist_from_db, add_symbols_to_db, remove_symbols_from_db
+
+
+class WatchlistManager:
+    """
+    Watchlist trong bộ nhớ, nạp từ database một lần rồi cập nhật tại chỗ khi /add, /remove.
+    Bộ quét đọc `snapshot()` mỗi chu kỳ; các listener (ví dụ chế độ stream) được gọi ngay khi đổi.
+    """
+    def __init__(self, symbols=None):
+        # symbols: watchlist cố định trong bộ nhớ (replay), khi đó load() không đọc database
+        self._symbols = set(symbols or ())
+        self._loaded = symbols is not None
+        self._listeners = []
+
+    async def load(self):
+        if self._loaded:
+            return
+        self._symbols = set(await get_watchlist_from_db())
+        self._loaded = True
+
+    async def reload(self):
+        """Đọc lại watchlist từ database (worker quét: /add, /remove chạy ở tiến trình bot)."""
+        self._symbols = set(await get_watchlist_from_db())
+        self._loaded = True
+
+    def snapshot(self):
+        return sorted(self._symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self._symbols
+
+    def subscribe(self, listener):
+        """listener(symbols) được gọi với watchlist mới sau mỗi thay đổi."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self):
+        symbols = self.snapshot()
+        for listener in list(self._listeners):
+            listener(symbols)
+
+    async def add(self, symbols):
+        """Thêm các mã chưa có; trả về danh sách mã thực sự được thêm."""
+        await self.load()
+        to_add = list(dict.fromkeys(s for s in symbols if s not in self._symbols))
+        if to_add:
+            await add_symbols_to_db(to_add)
+            self._symbols.update(to_add)
+            self._notify()
+        return to_add
+
+    async def remove(self, symbols):
+        """Xóa các mã đang có; trả về (mã đã xóa, mã không tìm thấy)."""
+        await self.load()
+        to_remove = list(dict.fromkeys(s for s in symbols if s in self._symbols))
+        not_found = [s for s in symbols if s not in self._symbols]
+        if to_remove:
+            await remove_symbols_from_db(to_remove)
+            self._symbols.difference_update(to_remove)
+            self._notify()
+        return to_remove, not_found
+
+
+watchlist_manager = WatchlistManager()
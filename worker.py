@@ -0,0 +1,45 @@
+# worker.py
+"""
+Worker quét tín hiệu chạy tách khỏi bot Telegram (SCAN_ROLE=worker).
+Có thể chạy nhiều tiến trình / máy cùng trỏ vào một Postgres: các worker chia watchlist theo shard
+bằng advisory lock, tín hiệu được ghi vào signal_outbox để tiến trình bot (SCAN_ROLE=bot) gửi đi.
+
+    SCAN_ROLE=worker python worker.py [--metrics-port 9109]
+"""
+import argparse
+import asyncio
+from config import SCAN_ROLE, METRICS_HOST
+from database import init_db, close_db_pool
+from binance_client import init_binance_client, close_binance_client
+from metrics import start_metrics_server
+from trading_logic import run_signal_checker
+from backtester import close_process_pool
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Worker quét tín hiệu theo shard")
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help="Cổng /metrics của worker này (0 để tắt; mỗi worker trên cùng máy cần một cổng riêng)")
+    args = parser.parse_args()
+    if SCAN_ROLE != 'worker':
+        raise SystemExit("worker.py cần SCAN_ROLE=worker (tín hiệu được gửi qua signal_outbox, không gửi Telegram trực tiếp).")
+
+    await init_db()
+    await init_binance_client()
+    metrics_runner = await start_metrics_server(METRICS_HOST, args.metrics_port) if args.metrics_port else None
+    try:
+        # Worker không có bot: tín hiệu đi qua signal_outbox
+        await run_signal_checker(None)
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        # Pool tiến trình của backtest đo tỷ lệ win (WIN_RATE_SOURCE=backtest)
+        close_process_pool()
+        await close_binance_client()
+        await close_db_pool()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nWorker stopped by user.")